@@ -0,0 +1,60 @@
+import json
+
+from models.etl import segment_transcript
+from utils.embedding_utils import get_config, get_tokenizer
+from utils.transcript_utils import fetch_transcripts
+from constants import MAIN_VIDEOS_JSON_PATH
+
+# Chunking settings to compare. The first one is how data/videos.db was loaded.
+CHUNKING_SETTINGS = [
+    {"batch_size": 15, "overlap": 10},
+    {"batch_size": 15, "overlap": 5},
+    {"max_tokens": 128, "token_overlap": 16},
+    {"max_tokens": 256, "token_overlap": 32},
+    {"max_tokens": 384, "token_overlap": 48},
+]
+
+
+def run_report(json_path: str = MAIN_VIDEOS_JSON_PATH) -> None:
+    """Prints the number of vectors, vectors per hour of audio, estimated index size and token statistics for each chunking setting."""
+
+    with open(json_path) as f:
+        video_info = json.load(f)
+    transcripts = fetch_transcripts([video["id"] for video in video_info])
+
+    # Hours of audio covered by the transcripts
+    hours = sum(
+        (transcript[-1]["start"] + transcript[-1]["duration"]) / 3600
+        for transcript in transcripts.values()
+        if transcript
+    )
+    tokenizer = get_tokenizer()
+    max_length = tokenizer.model_max_length
+    dimension = get_config().hidden_size
+
+    print(f"{len(video_info)} videos, {hours:.1f} hours of audio")
+    for chunking in CHUNKING_SETTINGS:
+        segments = []
+        for video in video_info:
+            transcript = transcripts[video["id"]]
+            if transcript:
+                segments.extend(segment_transcript(transcript, video, **chunking))
+
+        texts = [segment["text"] for segment in segments]
+        token_counts = [len(ids) for ids in tokenizer(texts)["input_ids"]]
+
+        # Stored size: float32 vectors plus the document text
+        vector_mb = len(segments) * dimension * 4 / 1e6
+        text_mb = sum(len(text.encode("utf-8")) for text in texts) / 1e6
+
+        print(
+            f"{chunking}: {len(segments)} vectors, {len(segments) / hours:.0f} vectors/hour, "
+            f"~{vector_mb + text_mb:.1f} MB ({vector_mb:.1f} MB vectors, {text_mb:.1f} MB text), "
+            f"{sum(token_counts) / len(token_counts):.0f} mean tokens, "
+            f"{sum(token_counts)} tokens to embed, "
+            f"{sum(count > max_length for count in token_counts)} truncated"
+        )
+
+
+if __name__ == "__main__":
+    run_report()
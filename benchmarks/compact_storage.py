@@ -0,0 +1,139 @@
+import json
+import os
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from models.etl import get_log_path, segment_transcript
+from models.retrieval import Retriever
+from utils.general_utils import get_size
+from utils.line_store import LineStore, compact_metadata, get_line_store_path
+from utils.transcript_utils import fetch_transcripts
+from utils.vector_store import EXPORT_PAGE_SIZE
+from constants import MAIN_VIDEOS_DB_PATH, TABLE_NAME, CONTEXT_CANDIDATES
+
+NUM_QUERIES = 200
+
+
+def build_compact_copy(db_path: str, compact_path: str) -> tuple:
+    """Copies the database to a compact database with the same vectors. Returns the number of segments and
+    videos and the stored vectors.
+
+    The line range of each segment is found by segmenting the video's transcript again with the chunking settings
+    in the database's load log. Transcripts come from the local cache where possible.
+    """
+
+    collection = chromadb.PersistentClient(db_path).get_collection(TABLE_NAME)
+    segments = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    while True:
+        page = collection.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=EXPORT_PAGE_SIZE,
+            offset=len(segments["ids"]),
+        )
+        for key in segments:
+            segments[key].extend(page[key])
+        if len(page["ids"]) < EXPORT_PAGE_SIZE:
+            break
+
+    with open(get_log_path(db_path, "load_log")) as f:
+        load_log = json.load(f)
+    chunking = {key: load_log.get(key) for key in ("batch_size", "overlap", "max_tokens", "token_overlap")}
+
+    # Store the caption lines of each video once, and find the line range of each segment
+    videos = {metadata["video_id"]: metadata["title"] for metadata in segments["metadatas"]}
+    transcripts = fetch_transcripts(list(videos))
+    line_store = LineStore(get_line_store_path(compact_path))
+    lines = {}
+    for video_id, title in videos.items():
+        video = {"id": video_id, "title": title}
+        line_store.save_video(video, transcripts[video_id])
+        for segment in segment_transcript(transcripts[video_id], video, **chunking):
+            lines[segment["metadata"]["segment_id"]] = segment
+
+    compact_collection = chromadb.PersistentClient(compact_path).create_collection(
+        TABLE_NAME, metadata={**collection.metadata, "storage": "compact"}
+    )
+    for start in range(0, len(segments["ids"]), EXPORT_PAGE_SIZE):
+        ids = segments["ids"][start : start + EXPORT_PAGE_SIZE]
+        compact_collection.add(
+            ids=ids,
+            embeddings=segments["embeddings"][start : start + EXPORT_PAGE_SIZE],
+            metadatas=[compact_metadata(lines[id]) for id in ids],
+        )
+
+    return len(segments["ids"]), len(videos), np.array(segments["embeddings"], dtype=np.float32)
+
+
+def measure(db_path: str, queries: np.ndarray) -> tuple:
+    """Returns the results and the retrieval latencies of the queries against the database."""
+
+    retriever = Retriever(db_path, max_batch_size=1)
+    retriever.query_by_embedding(queries[0], n_results=CONTEXT_CANDIDATES)
+
+    results, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        results.append(retriever.query_by_embedding(query, n_results=CONTEXT_CANDIDATES))
+        latencies.append(time.perf_counter() - start_time)
+    return results, latencies
+
+
+def run_benchmark(db_path: str = MAIN_VIDEOS_DB_PATH, num_queries: int = NUM_QUERIES) -> None:
+    """Prints the on-disk size and retrieval latency of the database and of a compact copy with the same vectors.
+    Queries are stored segment vectors with noise added, so no model is loaded for them. Segments returned by both
+    databases should have the same text and source."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        compact_path = os.path.join(tmp_dir, "compact.db")
+        start_time = time.perf_counter()
+        num_segments, num_videos, vectors = build_compact_copy(db_path, compact_path)
+        print(
+            f"{num_segments} segments of {num_videos} videos in {db_path}, "
+            f"compact copy built in {time.perf_counter() - start_time:.1f}s"
+        )
+
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+        queries = queries + rng.normal(scale=queries.std(), size=queries.shape).astype(np.float32)
+
+        sizes = {
+            "documents": get_size(db_path),
+            "compact": get_size(compact_path) + get_size(get_line_store_path(compact_path)),
+        }
+        all_results = {}
+        for name, path in (("documents", db_path), ("compact", compact_path)):
+            all_results[name], latencies = measure(path, queries)
+            latencies_ms = np.array(latencies) * 1000
+            print(
+                f"{name}: {sizes[name] / 1e6:.1f} MB on disk, top {CONTEXT_CANDIDATES} "
+                f"p50 {np.percentile(latencies_ms, 50):.2f} ms / p95 {np.percentile(latencies_ms, 95):.2f} ms"
+            )
+        print(f"line store: {get_size(get_line_store_path(compact_path)) / 1e6:.2f} MB")
+
+        # Both databases hold the same vectors, but their HNSW graphs differ, so compare the segments found by both
+        overlaps, matches = [], []
+        for full, compact in zip(all_results["documents"], all_results["compact"]):
+            rebuilt = {
+                id: (document, metadata["source"])
+                for id, document, metadata in zip(
+                    compact["ids"][0], compact["documents"][0], compact["metadatas"][0]
+                )
+            }
+            shared = [
+                (id, document, metadata["source"])
+                for id, document, metadata in zip(full["ids"][0], full["documents"][0], full["metadatas"][0])
+                if id in rebuilt
+            ]
+            overlaps.append(len(shared) / len(full["ids"][0]))
+            matches.extend(rebuilt[id] == (document, source) for id, document, source in shared)
+        print(
+            f"overlap of the top {CONTEXT_CANDIDATES}: {np.mean(overlaps):.3f}, "
+            f"rebuilt segments with the stored text and source: {np.mean(matches):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    run_benchmark()
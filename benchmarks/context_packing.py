@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+
+from models.llm import build_messages
+from models.retrieval import Retriever
+from utils.context_utils import build_context, count_tokens
+from utils.eval_utils import get_video_ids, load_questions
+from constants import MAIN_VIDEOS_DB_PATH, DEFAULT_QUERY_RESULTS, CONTEXT_CANDIDATES
+
+
+def prompt_tokens(question: str, context: dict) -> int:
+    """Returns the number of tokens in the chat messages sent to the LLM for the question and context."""
+
+    messages = build_messages(question, context)
+    return sum(count_tokens([message["content"] for message in messages]))
+
+
+def run_benchmark(db_path: str = MAIN_VIDEOS_DB_PATH, num_rel_segments: int = DEFAULT_QUERY_RESULTS) -> None:
+    """Prints the prompt tokens per question with the top segments as retrieved and with overlapping windows merged
+    and distinct passages packed into the token budget, on the evaluation questions. Tokens are counted with the
+    embedding-model tokenizer."""
+
+    questions = [question["question"] for question in load_questions()]
+    retriever = Retriever(db_path, max_batch_size=1)
+    retriever.warmup()
+
+    before, after, context_latencies = [], [], []
+    num_videos_before, num_videos_after = [], []
+    for question in questions:
+        query_embedding = retriever.embed_query(question)
+        candidates = retriever.search(
+            question, query_embedding, n_results=max(num_rel_segments, CONTEXT_CANDIDATES)
+        )
+
+        # The top segments as retrieved, the way the context was built before packing
+        top_segments = {
+            key: [value[0][:num_rel_segments]] for key, value in candidates.items() if value is not None
+        }
+        before.append(prompt_tokens(question, top_segments))
+        num_videos_before.append(len(set(get_video_ids(top_segments))))
+
+        start_time = time.perf_counter()
+        packed = build_context(candidates, num_rel_segments)
+        context_latencies.append(time.perf_counter() - start_time)
+        after.append(prompt_tokens(question, packed))
+        num_videos_after.append(len(set(get_video_ids(packed))))
+
+    print(f"{len(questions)} questions against {db_path}, {num_rel_segments} segments per question")
+    for name, tokens, num_videos in [
+        ("as retrieved", before, num_videos_before),
+        ("merged and packed", after, num_videos_after),
+    ]:
+        print(
+            f"{name}: prompt tokens mean {np.mean(tokens):.0f}, p50 {np.percentile(tokens, 50):.0f}, "
+            f"max {np.max(tokens):.0f}; distinct videos {np.mean(num_videos):.1f}"
+        )
+    print(
+        f"prompt tokens saved: {1 - np.sum(after) / np.sum(before):.1%}, "
+        f"build_context p50 {np.percentile(context_latencies, 50) * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    run_benchmark()
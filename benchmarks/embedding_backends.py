@@ -0,0 +1,79 @@
+import multiprocessing
+import resource
+import sys
+import time
+
+import constants
+from constants import MAIN_VIDEOS_DB_PATH
+
+BACKENDS = ["torch", "torch_int8", "onnx"]
+NUM_DOCUMENTS = 500
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak resident set size of this process in MB."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def measure_backend(name: str, db_path: str, num_documents: int, results: dict) -> None:
+    """Loads the backend in a fresh process and records its load time, peak RSS, throughput and agreement with the stored vectors."""
+
+    # Select the backend before the embedding module loads it
+    constants.EMBEDDING_BACKEND = name
+
+    start_time = time.perf_counter()
+    from utils.embedding_utils import MyEmbeddingFunction, cosine_agreement, load_stored_sample, warmup
+
+    warmup()
+    load_seconds = time.perf_counter() - start_time
+    load_rss = peak_rss_mb()
+
+    documents, stored = load_stored_sample(db_path, num_documents)
+    embed_text = MyEmbeddingFunction()
+    start_time = time.perf_counter()
+    embeddings = embed_text.encode(documents)
+    embed_seconds = time.perf_counter() - start_time
+
+    results[name] = {
+        "load_seconds": load_seconds,
+        "load_rss_mb": load_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "embeddings_per_second": len(documents) / embed_seconds,
+        "mean_cosine": float(cosine_agreement(embeddings, stored).mean()),
+    }
+
+
+def run_benchmark(db_path: str = MAIN_VIDEOS_DB_PATH, num_documents: int = NUM_DOCUMENTS) -> None:
+    """Prints the load time, RSS, embeddings/sec and cosine agreement with the stored vectors of each backend.
+
+    Each backend runs in its own process so memory is measured in isolation. Load time includes importing the
+    embedding module and loading the tokenizer.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Manager().dict()
+    print(f"Embedding {num_documents} stored segments from {db_path}")
+    for name in BACKENDS:
+        process = context.Process(
+            target=measure_backend, args=(name, db_path, num_documents, results)
+        )
+        process.start()
+        process.join()
+        if name not in results:
+            print(f"{name}: failed (exit code {process.exitcode})")
+            continue
+
+        result = results[name]
+        print(
+            f"{name}: load {result['load_seconds']:.1f}s, "
+            f"RSS {result['load_rss_mb']:.0f} MB after load / {result['peak_rss_mb']:.0f} MB peak, "
+            f"{result['embeddings_per_second']:.1f} embeddings/sec, "
+            f"mean cosine to stored {result['mean_cosine']:.5f}"
+        )
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,87 @@
+import json
+import time
+
+import numpy as np
+import torch
+
+from models.etl import get_video_transcript, format_transcript
+from utils.embedding_backends import load_model
+from utils.embedding_utils import MyEmbeddingFunction, get_tokenizer
+
+SINGLE_VIDEO_JSON_PATH = "data/single_video.json"
+BENCHMARK_BATCH_SIZE = 15
+BENCHMARK_OVERLAP = 10
+
+
+def embed_one_by_one(documents: list) -> np.ndarray:
+    """Embeds the documents one at a time, the way the embedding function did before batching.
+
+    Args:
+        documents (list): The text documents to embed.
+
+    Returns:
+        np.ndarray: The embeddings, one row per document.
+    """
+
+    tokenizer = get_tokenizer()
+    model = load_model()
+    embeddings_list = []
+    for text in documents:
+        tokens = tokenizer(text, truncation=True, return_tensors="pt")
+        with torch.no_grad():
+            outputs = model(**tokens)
+        embeddings_list.append(outputs.last_hidden_state.mean(dim=1).squeeze().numpy())
+
+    return np.stack(embeddings_list)
+
+
+def load_documents(json_path: str = SINGLE_VIDEO_JSON_PATH) -> list:
+    """Fetches and formats the transcripts listed in the JSON file and returns the segment texts."""
+
+    with open(json_path) as f:
+        video_info = json.load(f)
+
+    documents = []
+    for video in video_info:
+        transcript = get_video_transcript(video["id"])
+        if transcript:
+            segments = format_transcript(
+                transcript,
+                video["id"],
+                video["title"],
+                batch_size=BENCHMARK_BATCH_SIZE,
+                overlap=BENCHMARK_OVERLAP,
+            )
+            documents.extend(segment["text"] for segment in segments)
+
+    return documents
+
+
+def run_benchmark(batch_sizes: tuple = (1, 8, 16, 32, 64)) -> None:
+    """Prints the embedding throughput (docs/sec) of the one-by-one path and of the batched engine."""
+
+    documents = load_documents()
+    print(f"Embedding {len(documents)} documents from {SINGLE_VIDEO_JSON_PATH}")
+
+    start_time = time.perf_counter()
+    reference = embed_one_by_one(documents)
+    elapsed = time.perf_counter() - start_time
+    print(f"one-by-one: {len(documents) / elapsed:.1f} docs/sec")
+
+    for batch_size in batch_sizes:
+        embed_text = MyEmbeddingFunction(batch_size=batch_size)
+
+        start_time = time.perf_counter()
+        embeddings = embed_text(documents)
+        elapsed = time.perf_counter() - start_time
+
+        # Padding is masked out, so the batched vectors should match the reference
+        max_diff = float(np.abs(embeddings - reference).max())
+        print(
+            f"batch_size={batch_size}: {len(documents) / elapsed:.1f} docs/sec "
+            f"(max abs diff vs one-by-one: {max_diff:.2e})"
+        )
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,61 @@
+import os
+import time
+
+import numpy as np
+
+from utils.embedding_pool import EmbeddingPool, get_threads_per_worker
+from utils.embedding_utils import MyEmbeddingFunction, load_stored_sample
+from constants import MAIN_VIDEOS_DB_PATH
+
+WORKER_COUNTS = [1, 2, 4, 8]
+NUM_DOCUMENTS = 2000
+
+# The ETL embeds one video at a time, so documents are embedded in chunks of about one video's segments
+SEGMENTS_PER_VIDEO = 200
+
+
+def embed_by_video(embedding_function: MyEmbeddingFunction, documents: list) -> np.ndarray:
+    """Embeds the documents one video-sized chunk at a time, the way the ETL calls the embedding function."""
+
+    return np.concatenate(
+        [
+            embedding_function.embed(documents[start : start + SEGMENTS_PER_VIDEO])
+            for start in range(0, len(documents), SEGMENTS_PER_VIDEO)
+        ]
+    )
+
+
+def run_benchmark(db_path: str = MAIN_VIDEOS_DB_PATH) -> None:
+    """Prints the wall time of embedding stored segments in the ETL process and on pools of 1 to 8 workers."""
+
+    documents, _ = load_stored_sample(db_path, NUM_DOCUMENTS)
+    print(f"Embedding {len(documents)} documents from {db_path} on {os.cpu_count()} CPU cores")
+
+    # In the ETL process with every core, the default
+    embedding_function = MyEmbeddingFunction()
+    embedding_function.embed(documents[:SEGMENTS_PER_VIDEO])  # Load the model first
+    start_time = time.perf_counter()
+    reference = embed_by_video(embedding_function, documents)
+    baseline = time.perf_counter() - start_time
+    print(f"in process: {baseline:.2f}s ({len(documents) / baseline:.1f} docs/sec)")
+
+    for num_workers in WORKER_COUNTS:
+        start_time = time.perf_counter()
+        with EmbeddingPool(num_workers, use_cache=False) as pool:
+            startup = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            embeddings = embed_by_video(pool, documents)
+            elapsed = time.perf_counter() - start_time
+
+        # Each worker runs the same model, so the vectors should match the in-process ones
+        max_diff = float(np.abs(embeddings - reference).max())
+        print(
+            f"{num_workers} workers x {get_threads_per_worker(num_workers)} threads: {elapsed:.2f}s "
+            f"({len(documents) / elapsed:.1f} docs/sec, {baseline / elapsed:.2f}x), "
+            f"startup {startup:.2f}s, max abs diff {max_diff:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
+
+from models import etl, llm
+from models.retrieval import Retriever
+from utils.context_utils import build_context, count_tokens
+from utils.eval_utils import get_video_ids, load_questions, recall_at_k, reciprocal_rank
+from utils.stub_llm import StubOpenAIClient
+from utils.vector_store import export_vector_store, get_vector_store_path, remove_vector_store
+from constants import (
+    MAIN_VIDEOS_DB_PATH,
+    MAIN_VIDEOS_JSON_PATH,
+    EVAL_QUESTIONS_PATH,
+    EMBEDDING_BACKEND,
+    CONTEXT_CANDIDATES,
+)
+
+# Numbers of relevant segments to evaluate
+NUM_REL_SEGMENTS = [3, 5, 10]
+
+# Chunking settings to build an index for. The database given with --db is evaluated as loaded in addition.
+CHUNKING_SETTINGS = [
+    {"batch_size": 15, "overlap": 5},
+    {"max_tokens": 256, "token_overlap": 32},
+]
+
+# Retrieval backends to evaluate on each index
+RETRIEVERS = [
+    {"store": "chroma", "mode": "vector"},
+    {"store": "chroma", "mode": "hybrid"},
+    {"store": "mmap", "mode": "vector"},
+]
+
+# Where indexes for the chunking settings are built, and where results are written
+INDEX_DIR = "data/eval/indexes"
+RESULTS_DIR = "data/eval/results"
+
+STAGES = ["embed", "search", "format", "llm"]
+
+
+def get_chunking_name(chunking: dict) -> str:
+    """Returns a short name for the chunking settings, e.g. lines15_overlap5 or tokens256_overlap32."""
+
+    if "max_tokens" in chunking:
+        return f"tokens{chunking['max_tokens']}_overlap{chunking.get('token_overlap') or 0}"
+    return f"lines{chunking['batch_size']}_overlap{chunking.get('overlap') or 0}"
+
+
+def build_index(json_path: str, chunking: dict, with_vector_store: bool) -> dict:
+    """Builds a new database with the chunking settings and returns its path and build times.
+
+    Segments already in the embedding cache are not embedded again, so rebuilds are faster than a first build.
+    """
+
+    db_path = os.path.join(INDEX_DIR, get_chunking_name(chunking) + ".db")
+
+    # Start from scratch. The checkpoint manifest of an earlier build is dropped with its database.
+    shutil.rmtree(db_path, ignore_errors=True)
+    remove_vector_store(get_vector_store_path(db_path))
+    os.makedirs(INDEX_DIR, exist_ok=True)
+
+    start_time = time.perf_counter()
+    etl.run_etl(json_path, db=db_path, **chunking)
+    index = {
+        "name": get_chunking_name(chunking),
+        "db_path": db_path,
+        "chunking": chunking,
+        "build_seconds": time.perf_counter() - start_time,
+    }
+
+    if with_vector_store:
+        start_time = time.perf_counter()
+        export_vector_store(db_path)
+        index["vector_store_seconds"] = time.perf_counter() - start_time
+
+    return index
+
+
+def summarize_latencies(latencies: list) -> dict:
+    """Returns the mean, p50 and p95 of the latencies in milliseconds."""
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "mean": float(latencies_ms.mean()),
+        "p50": float(np.percentile(latencies_ms, 50)),
+        "p95": float(np.percentile(latencies_ms, 95)),
+    }
+
+
+def evaluate_retriever(retriever: Retriever, questions: list, num_rel_segments: int) -> dict:
+    """Runs every question through retrieval, context building and the stub LLM.
+
+    Args:
+        retriever (Retriever): The retriever to evaluate.
+        questions (list): The evaluation questions, see load_questions.
+        num_rel_segments (int): The number of relevant segments per question.
+
+    Returns:
+        dict: The mean recall@k, MRR and context recall (the share of expected videos in the context sent to the
+        LLM), the mean prompt tokens, and the latency of each stage.
+    """
+
+    recalls, reciprocal_ranks, context_recalls, prompt_tokens = [], [], [], []
+    latencies = {stage: [] for stage in STAGES}
+    for question in questions:
+        text, expected = question["question"], question["expected_video_ids"]
+
+        # Embed with the model rather than the embedding cache so the stage is timed the same on every run
+        start_time = time.perf_counter()
+        query_embedding = retriever.embedding_function.embed([text])[0]
+        latencies["embed"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        candidates = retriever.search(
+            text, query_embedding, n_results=max(num_rel_segments, CONTEXT_CANDIDATES)
+        )
+        latencies["search"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        context = build_context(candidates, num_rel_segments)
+        messages = llm.build_messages(text, context)
+        latencies["format"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        llm.answer_with_context(text, context)
+        latencies["llm"].append(time.perf_counter() - start_time)
+
+        video_ids = get_video_ids(candidates)
+        recalls.append(recall_at_k(video_ids, expected, num_rel_segments))
+        reciprocal_ranks.append(reciprocal_rank(video_ids[:num_rel_segments], expected))
+        context_recalls.append(recall_at_k(get_video_ids(context), expected, num_rel_segments))
+        prompt_tokens.append(sum(count_tokens([message["content"] for message in messages])))
+
+    return {
+        "recall": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "context_recall": float(np.mean(context_recalls)),
+        "prompt_tokens": float(np.mean(prompt_tokens)),
+        "latency_ms": {stage: summarize_latencies(latencies[stage]) for stage in STAGES},
+    }
+
+
+def run_suite(
+    db_path: str = MAIN_VIDEOS_DB_PATH,
+    json_path: str = MAIN_VIDEOS_JSON_PATH,
+    questions_path: str = EVAL_QUESTIONS_PATH,
+    output_path: str = None,
+    build: bool = True,
+) -> dict:
+    f"""Evaluates retrieval and answering on the labeled questions for every index, retrieval backend and number of
+    relevant segments, and writes the results to a JSON file. The LLM is a deterministic local stub, so the suite
+    runs without network access and the LLM stage only measures the overhead of the client call.
+
+    Args:
+        db_path (str): The path to the database evaluated as loaded. Default is {MAIN_VIDEOS_DB_PATH}.
+        json_path (str): The videos to build the chunking indexes from. Default is {MAIN_VIDEOS_JSON_PATH}.
+        questions_path (str): The path to the labeled questions. Default is {EVAL_QUESTIONS_PATH}.
+        output_path (str): The path to write the results to. Default is None (a timestamped file in {RESULTS_DIR}).
+        build (bool): Whether to build an index for each of the chunking settings. Default is True.
+
+    Returns:
+        dict: The results.
+    """
+
+    questions = load_questions(questions_path)
+    llm.client = StubOpenAIClient()
+    with_vector_store = any(config["store"] == "mmap" for config in RETRIEVERS)
+
+    # Indexes to evaluate: the database as loaded, plus one per chunking setting
+    indexes = [{"name": "as loaded", "db_path": db_path, "chunking": None, "build_seconds": None}]
+    if build:
+        indexes.extend(build_index(json_path, chunking, with_vector_store) for chunking in CHUNKING_SETTINGS)
+
+    runs = []
+    for index in indexes:
+        for config in RETRIEVERS:
+            if config["store"] == "mmap" and not os.path.exists(get_vector_store_path(index["db_path"])):
+                print(f"{index['name']} {config}: skipped, no vector store (export it with export_vector_store.py)")
+                continue
+
+            retriever = Retriever(index["db_path"], max_batch_size=1, **config)
+            retriever.warmup()
+            for num_rel_segments in NUM_REL_SEGMENTS:
+                result = evaluate_retriever(retriever, questions, num_rel_segments)
+                runs.append(
+                    {"index": index["name"], **config, "num_rel_segments": num_rel_segments, **result}
+                )
+
+                latency = result["latency_ms"]
+                print(
+                    f"{index['name']} {config['store']}/{config['mode']} k={num_rel_segments}: "
+                    f"recall {result['recall']:.3f}, MRR {result['mrr']:.3f}, "
+                    f"context recall {result['context_recall']:.3f}, {result['prompt_tokens']:.0f} prompt tokens, "
+                    + ", ".join(f"{stage} p50 {latency[stage]['p50']:.1f} ms" for stage in STAGES)
+                )
+
+    results = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "questions_path": questions_path,
+        "num_questions": len(questions),
+        "embedding_backend": EMBEDDING_BACKEND,
+        "indexes": indexes,
+        "runs": runs,
+    }
+
+    if output_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output_path = os.path.join(RESULTS_DIR, f"eval_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {output_path}")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval and answer evaluation with a stub LLM.")
+    parser.add_argument("--db", default=MAIN_VIDEOS_DB_PATH, help="Database to evaluate as loaded.")
+    parser.add_argument("--videos", default=MAIN_VIDEOS_JSON_PATH, help="Videos to build the chunking indexes from.")
+    parser.add_argument("--questions", default=EVAL_QUESTIONS_PATH, help="Labeled questions (JSON lines).")
+    parser.add_argument("--output", default=None, help="Path of the JSON results file.")
+    parser.add_argument("--no-build", action="store_true", help="Only evaluate the database as loaded.")
+    args = parser.parse_args()
+
+    run_suite(args.db, args.videos, args.questions, args.output, build=not args.no_build)
@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+
+from models.retrieval import Retriever
+from utils.eval_utils import get_video_ids, load_questions, recall_at_k, reciprocal_rank
+from constants import MAIN_VIDEOS_DB_PATH, DEFAULT_QUERY_RESULTS
+
+# (vector weight, BM25 weight) settings of hybrid mode to compare against pure vector search
+HYBRID_WEIGHTS = [(1.0, 0.5), (1.0, 1.0), (1.0, 2.0)]
+
+
+def evaluate(retriever: Retriever, questions: list, query_embeddings: np.ndarray, k: int) -> dict:
+    """Returns the mean recall@k and MRR of the retriever over the questions."""
+
+    recalls, reciprocal_ranks = [], []
+    for question, query_embedding in zip(questions, query_embeddings):
+        results = retriever.search(question["question"], query_embedding, n_results=k)
+        video_ids = get_video_ids(results)
+        recalls.append(recall_at_k(video_ids, question["expected_video_ids"], k))
+        reciprocal_ranks.append(reciprocal_rank(video_ids, question["expected_video_ids"]))
+    return {"recall": float(np.mean(recalls)), "mrr": float(np.mean(reciprocal_ranks))}
+
+
+def run_benchmark(db_path: str = MAIN_VIDEOS_DB_PATH, k: int = DEFAULT_QUERY_RESULTS) -> None:
+    """Prints recall@k and MRR of vector and hybrid retrieval on the evaluation questions, and the latency of the
+    keyword search compared to embedding the question."""
+
+    questions = load_questions()
+    retriever = Retriever(db_path, max_batch_size=1)
+    retriever.warmup()
+
+    # Embed each question once and reuse the embedding for every setting
+    embed_latencies = []
+    query_embeddings = []
+    for question in questions:
+        start_time = time.perf_counter()
+        query_embeddings.append(retriever.embedding_function.embed([question["question"]])[0])
+        embed_latencies.append(time.perf_counter() - start_time)
+
+    bm25_latencies = []
+    for question in questions:
+        start_time = time.perf_counter()
+        retriever.bm25_index.search(question["question"], k)
+        bm25_latencies.append(time.perf_counter() - start_time)
+
+    print(f"{len(questions)} questions against {db_path}")
+    print(
+        f"embed p50 {np.percentile(embed_latencies, 50) * 1000:.2f} ms, "
+        f"BM25 search p50 {np.percentile(bm25_latencies, 50) * 1000:.2f} ms"
+    )
+
+    result = evaluate(retriever, questions, query_embeddings, k)
+    print(f"vector: recall@{k} {result['recall']:.3f}, MRR {result['mrr']:.3f}")
+    for vector_weight, bm25_weight in HYBRID_WEIGHTS:
+        hybrid = Retriever(
+            db_path,
+            max_batch_size=1,
+            mode="hybrid",
+            vector_weight=vector_weight,
+            bm25_weight=bm25_weight,
+        )
+        result = evaluate(hybrid, questions, query_embeddings, k)
+        print(
+            f"hybrid (vector {vector_weight}, BM25 {bm25_weight}): "
+            f"recall@{k} {result['recall']:.3f}, MRR {result['mrr']:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,71 @@
+import json
+import subprocess
+import sys
+
+# The top-level modules of the project, each imported in a fresh interpreter
+TOP_LEVEL_MODULES = [
+    "constants",
+    "models.llm",
+    "models.retrieval",
+    "models.etl",
+    "utils.embedding_utils",
+    "main",
+    "run_etl",
+    "run_batch",
+    "tune_hnsw",
+    "reembed_db",
+    "export_embedding_model",
+    "export_vector_store",
+]
+
+# Modules that should only be imported when a model or client is first used
+HEAVY_MODULES = ["torch", "transformers", "openai", "gradio"]
+
+MEASURE_IMPORT = """
+import json, resource, sys, time
+start_time = time.perf_counter()
+import {module}
+print(json.dumps({{
+    "seconds": time.perf_counter() - start_time,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3,
+    "heavy_modules": [name for name in {heavy_modules} if name in sys.modules],
+}}))
+"""
+
+
+def measure_import(module: str) -> dict:
+    """Imports the module in a fresh interpreter and returns the import time, peak RSS and the heavy modules it pulled in.
+
+    Args:
+        module (str): The dotted module name.
+
+    Returns:
+        dict: The import seconds, the peak RSS in MB and the list of heavy modules that were imported.
+    """
+
+    code = MEASURE_IMPORT.format(module=module, heavy_modules=HEAVY_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmark(modules: list = TOP_LEVEL_MODULES) -> None:
+    """Prints the import time, peak RSS and heavy modules pulled in by each top-level module."""
+
+    for module in modules:
+        try:
+            result = measure_import(module)
+        except subprocess.CalledProcessError as e:
+            print(f"{module}: import failed\n{e.stderr}")
+            continue
+
+        heavy_modules = ", ".join(result["heavy_modules"]) or "none"
+        print(
+            f"{module}: {result['seconds']:.2f}s, peak RSS {result['peak_rss_mb']:.0f} MB, "
+            f"heavy modules: {heavy_modules}"
+        )
+
+
+if __name__ == "__main__":
+    run_benchmark()
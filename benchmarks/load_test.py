@@ -0,0 +1,105 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+import openai
+
+import main
+from models import llm, retrieval
+from utils.stub_llm import StubLLMServer
+from constants import (
+    MAIN_VIDEOS_DB_PATH,
+    FITNESS_TEST_QUESTION,
+    FITNESS_TEST_QUESTION_1,
+    GRADIO_EXAMPLES,
+    LLM_MAX_CONNECTIONS,
+)
+
+NUM_QUESTIONS = 64
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+STUB_LLM_DELAY = 0.5
+QUESTIONS = [FITNESS_TEST_QUESTION, FITNESS_TEST_QUESTION_1] + GRADIO_EXAMPLES
+
+
+def summarize(name: str, concurrency: int, total_seconds: float, latencies: list) -> None:
+    """Prints the throughput and the p50/p95/p99 latency in milliseconds."""
+
+    latencies_ms = np.array(latencies) * 1000
+    print(
+        f"{name} x{concurrency}: {len(latencies) / total_seconds:.1f} QPS, "
+        f"p50 {np.percentile(latencies_ms, 50):.0f} ms, "
+        f"p95 {np.percentile(latencies_ms, 95):.0f} ms, "
+        f"p99 {np.percentile(latencies_ms, 99):.0f} ms"
+    )
+
+
+def run_threads(questions: list, db_path: str, concurrency: int) -> tuple:
+    """Answers the questions with the blocking run_query on a pool of `concurrency` threads."""
+
+    def timed_query(question: str) -> float:
+        start_time = time.perf_counter()
+        main.run_query(question, db_path=db_path, use_cache=False)
+        return time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed_query, questions))
+    return time.perf_counter() - start_time, latencies
+
+
+async def run_async(questions: list, db_path: str, concurrency: int) -> tuple:
+    """Answers the questions with run_query_async, keeping `concurrency` questions in flight."""
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed_query(question: str) -> float:
+        async with semaphore:
+            start_time = time.perf_counter()
+            await main.run_query_async(question, db_path=db_path, use_cache=False)
+            return time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    latencies = await asyncio.gather(*(timed_query(question) for question in questions))
+    return time.perf_counter() - start_time, latencies
+
+
+def run_benchmark(
+    db_path: str = MAIN_VIDEOS_DB_PATH,
+    num_questions: int = NUM_QUESTIONS,
+    delay: float = STUB_LLM_DELAY,
+) -> None:
+    """Prints QPS and tail latency of the blocking and async query paths at each concurrency level, against a local
+    stub LLM that takes `delay` seconds per answer. Queries above main's MAX_CONCURRENT_QUERIES limit are queued.
+    """
+
+    server = StubLLMServer(delay=delay).start()
+    try:
+        llm.client = openai.OpenAI(base_url=server.url, api_key="stub")
+        llm.async_client = openai.AsyncOpenAI(
+            base_url=server.url,
+            api_key="stub",
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS)
+            ),
+        )
+        retrieval.get_retriever(db_path).warmup()
+
+        questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(num_questions)]
+        print(f"{num_questions} questions against {db_path}, stub LLM delay {delay} s")
+        for concurrency in CONCURRENCY_LEVELS:
+            summarize("threads", concurrency, *run_threads(questions, db_path, concurrency))
+
+        # Run every async level on one event loop, since the pooled connections belong to the loop that opened them
+        async def run_async_levels() -> None:
+            for concurrency in CONCURRENCY_LEVELS:
+                summarize("async", concurrency, *await run_async(questions, db_path, concurrency))
+
+        asyncio.run(run_async_levels())
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from models.retrieval import Retriever
+from utils.embedding_utils import MyEmbeddingFunction
+from constants import (
+    MAIN_VIDEOS_DB_PATH,
+    FITNESS_TEST_QUESTION,
+    FITNESS_TEST_QUESTION_1,
+    GRADIO_EXAMPLES,
+    QUERY_BATCH_MAX_SIZE,
+)
+
+NUM_QUERIES = 256
+CONCURRENCY = 32
+# (max wait in seconds, max batch size); a batch size of 1 is the unbatched baseline
+WINDOWS = [(0.0, 1), (0.001, QUERY_BATCH_MAX_SIZE), (0.005, QUERY_BATCH_MAX_SIZE), (0.01, QUERY_BATCH_MAX_SIZE), (0.02, QUERY_BATCH_MAX_SIZE)]
+QUESTIONS = [FITNESS_TEST_QUESTION, FITNESS_TEST_QUESTION_1] + GRADIO_EXAMPLES
+
+
+def run_window(
+    db_path: str, max_wait: float, max_batch_size: int, num_queries: int, concurrency: int
+) -> None:
+    """Prints the throughput, latency and mean batch size of `concurrency` callers querying through one retriever."""
+
+    # No embedding cache, so every question runs through the model
+    retriever = Retriever(
+        db_path,
+        embedding_function=MyEmbeddingFunction(),
+        max_wait=max_wait,
+        max_batch_size=max_batch_size,
+    )
+    retriever.warmup()
+
+    # Make every question distinct so no two callers share work
+    questions = [f"{QUESTIONS[i % len(QUESTIONS)]} ({i})" for i in range(num_queries)]
+
+    def timed_query(question: str) -> float:
+        start_time = time.perf_counter()
+        retriever.query(question)
+        return time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed_query, questions))
+    total_seconds = time.perf_counter() - start_time
+
+    latencies_ms = np.array(latencies) * 1000
+    print(
+        f"wait {max_wait * 1000:.0f} ms, batch {max_batch_size}: "
+        f"{num_queries / total_seconds:.1f} QPS, "
+        f"p50 {np.percentile(latencies_ms, 50):.1f} ms, "
+        f"p95 {np.percentile(latencies_ms, 95):.1f} ms, "
+        f"mean embed batch {retriever.embed_batcher.stats()['mean_batch_size']:.1f}, "
+        f"mean search batch {retriever.search_batcher.stats()['mean_batch_size']:.1f}"
+    )
+
+
+def run_benchmark(
+    db_path: str = MAIN_VIDEOS_DB_PATH,
+    num_queries: int = NUM_QUERIES,
+    concurrency: int = CONCURRENCY,
+) -> None:
+    """Prints the throughput vs latency tradeoff of query micro-batching at each window size."""
+
+    print(f"{num_queries} queries from {concurrency} concurrent callers against {db_path}")
+    for max_wait, max_batch_size in WINDOWS:
+        run_window(db_path, max_wait, max_batch_size, num_queries, concurrency)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,61 @@
+import time
+
+import chromadb
+import numpy as np
+
+from models.retrieval import Retriever
+from utils.embedding_utils import get_embedding_function
+from utils.general_utils import close_chroma_system
+from constants import MAIN_VIDEOS_DB_PATH, TABLE_NAME, FITNESS_TEST_QUESTION
+
+NUM_QUERIES = 50
+
+
+def cold_query(question: str, db_path: str) -> dict:
+    """Opens a fresh client and collection for the query, the way retrieval worked before the Retriever."""
+
+    close_chroma_system(db_path)
+    client = chromadb.PersistentClient(db_path)
+    collection = client.get_collection(
+        TABLE_NAME, embedding_function=get_embedding_function()
+    )
+    return collection.query(query_texts=[question], n_results=5)
+
+
+def summarize(name: str, latencies: list) -> None:
+    """Prints the p50/p95 latency in milliseconds."""
+
+    latencies_ms = np.array(latencies) * 1000
+    print(
+        f"{name}: p50 {np.percentile(latencies_ms, 50):.1f} ms, "
+        f"p95 {np.percentile(latencies_ms, 95):.1f} ms"
+    )
+
+
+def run_benchmark(
+    db_path: str = MAIN_VIDEOS_DB_PATH, question: str = FITNESS_TEST_QUESTION
+) -> None:
+    """Prints the latency of cold (new client per query) and warm (shared Retriever) retrieval."""
+
+    cold_latencies = []
+    for _ in range(NUM_QUERIES):
+        start_time = time.perf_counter()
+        cold_query(question, db_path)
+        cold_latencies.append(time.perf_counter() - start_time)
+
+    retriever = Retriever(db_path)
+    retriever.warmup()
+
+    warm_latencies = []
+    for _ in range(NUM_QUERIES):
+        start_time = time.perf_counter()
+        retriever.query(question)
+        warm_latencies.append(time.perf_counter() - start_time)
+
+    print(f"{NUM_QUERIES} queries against {db_path}")
+    summarize("cold", cold_latencies)
+    summarize("warm", warm_latencies)
+
+
+if __name__ == "__main__":
+    run_benchmark()
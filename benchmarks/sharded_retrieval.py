@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from models.retrieval import Retriever
+from models.sharded_retrieval import ShardedRetriever
+from utils.vector_store import EXPORT_PAGE_SIZE, export_vector_store, get_vector_store_path
+from constants import MAIN_VIDEOS_DB_PATH, TABLE_NAME
+
+SHARD_COUNTS = [1, 2, 4, 8]
+STORES = ["chroma", "mmap"]
+NUM_QUERIES = 100
+TOP_K = 5
+
+
+def load_segments(db_path: str) -> tuple:
+    """Returns the stored segments of the database (a Chroma get result) and the metadata of its collection."""
+
+    collection = chromadb.PersistentClient(db_path).get_collection(TABLE_NAME)
+    segments = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    while True:
+        page = collection.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=EXPORT_PAGE_SIZE,
+            offset=len(segments["ids"]),
+        )
+        for key in segments:
+            segments[key].extend(page[key])
+        if len(page["ids"]) < EXPORT_PAGE_SIZE:
+            break
+    return segments, collection.metadata
+
+
+def split_by_video(segments: dict, metadata: dict, num_shards: int, shard_dir: str) -> list:
+    """Splits the segments into databases of whole videos, assigned round-robin, and returns the shards."""
+
+    video_ids = sorted({id.rsplit("__", 1)[0] for id in segments["ids"]})
+    shard_of_video = {video_id: i % num_shards for i, video_id in enumerate(video_ids)}
+
+    shards = []
+    for shard in range(num_shards):
+        db_path = f"{shard_dir}/split{num_shards}_{shard}.db"
+        rows = [i for i, id in enumerate(segments["ids"]) if shard_of_video[id.rsplit("__", 1)[0]] == shard]
+        collection = chromadb.PersistentClient(db_path).create_collection(TABLE_NAME, metadata=metadata)
+        for start in range(0, len(rows), EXPORT_PAGE_SIZE):
+            batch = rows[start : start + EXPORT_PAGE_SIZE]
+            collection.add(**{key: [values[i] for i in batch] for key, values in segments.items()})
+        shards.append({"db_path": db_path, "name": f"shard{shard}"})
+    return shards
+
+
+def replicate(db_path: str, num_shards: int, shard_dir: str) -> list:
+    """Copies the database once per shard, so the indexed corpus grows with the number of shards."""
+
+    shards = []
+    for shard in range(num_shards):
+        copy_path = f"{shard_dir}/replica{shard}.db"
+        if not os.path.exists(copy_path):
+            shutil.copytree(db_path, copy_path)
+        shards.append({"db_path": copy_path, "name": f"replica{shard}"})
+    return shards
+
+
+def measure(shards: list, queries: np.ndarray, max_workers: int, store: str) -> tuple:
+    """Returns the IDs found for each query and the search latencies of a sharded retriever over the shards."""
+
+    # Vector stores are exported next to each shard database on first use
+    if store == "mmap":
+        for shard in shards:
+            if not os.path.exists(get_vector_store_path(shard["db_path"])):
+                export_vector_store(shard["db_path"])
+
+    retriever = ShardedRetriever(
+        shards,
+        max_workers=max_workers,
+        make_retriever=lambda path: Retriever(path, max_batch_size=1, store=store),
+    )
+    retriever.search("", queries[0], n_results=TOP_K)
+
+    ids, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        result = retriever.search("", query, n_results=TOP_K)
+        latencies.append(time.perf_counter() - start_time)
+        ids.append(set(result["ids"][0]))
+    retriever.executor.shutdown()
+    return ids, latencies
+
+
+def run_benchmark(db_path: str = MAIN_VIDEOS_DB_PATH, num_queries: int = NUM_QUERIES) -> None:
+    """Prints the search latency of a sharded retriever as the number of shards grows, with the shards searched in
+    parallel and one after the other. The corpus is either split into shards of whole videos (fixed size) or
+    copied once per shard (growing). Queries are stored segment vectors with noise added, so no model is loaded for
+    them. The overlap with the top 5 of the unsharded database shows that merging by distance keeps the global top k
+    (up to the approximation of each HNSW index). Shards are searched in Chroma and in exported vector stores.
+    """
+
+    segments, metadata = load_segments(db_path)
+    vectors = np.array(segments["embeddings"], dtype=np.float32)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+    queries = queries + rng.normal(scale=queries.std(), size=queries.shape).astype(np.float32)
+
+    print(f"{len(segments['ids'])} segments in {db_path}, {len(queries)} queries, top {TOP_K}")
+    with tempfile.TemporaryDirectory() as shard_dir:
+        baseline, _ = measure([{"db_path": db_path}], queries, max_workers=1, store="chroma")
+        for layout in ("split", "replicated"):
+            for num_shards in SHARD_COUNTS:
+                start_time = time.perf_counter()
+                if layout == "split":
+                    shards = split_by_video(segments, metadata, num_shards, shard_dir)
+                else:
+                    shards = replicate(db_path, num_shards, shard_dir)
+                build_seconds = time.perf_counter() - start_time
+
+                for store in STORES:
+                    line = f"{layout} x{num_shards} {store} (built in {build_seconds:.1f}s):"
+                    for name, max_workers in (("parallel", num_shards), ("sequential", 1)):
+                        ids, latencies = measure(shards, queries, max_workers, store)
+                        latencies_ms = np.array(latencies) * 1000
+                        line += (
+                            f" {name} p50 {np.percentile(latencies_ms, 50):.1f} ms / "
+                            f"p95 {np.percentile(latencies_ms, 95):.1f} ms,"
+                        )
+                    overlap = np.mean([len(found & truth) / TOP_K for found, truth in zip(ids, baseline)])
+                    print(f"{line} overlap with unsharded Chroma top {TOP_K} {overlap:.3f}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
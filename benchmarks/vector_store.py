@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from utils.vector_store import VectorStore, export_vector_store
+from constants import MAIN_VIDEOS_DB_PATH, TABLE_NAME
+
+NUM_QUERIES = 200
+TOP_K = 5
+STORES = ["chroma", "float16", "int8"]
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak resident set size of this process in MB."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> list:
+    """Returns the row indices of the k nearest vectors (cosine) of each query, by brute force in float32."""
+
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return [np.argsort(-row)[:k] for row in queries @ vectors.T]
+
+
+def measure_store(store: str, db_path: str, store_dir: str, queries: np.ndarray, results: dict) -> None:
+    """Opens the store in a fresh process and records the IDs it returns, the open time, the query latencies and the peak RSS."""
+
+    start_time = time.perf_counter()
+    if store == "chroma":
+        collection = chromadb.PersistentClient(db_path).get_collection(TABLE_NAME)
+        search = lambda query: collection.query(query_embeddings=[query.tolist()], n_results=TOP_K)
+    else:
+        vector_store = VectorStore(os.path.join(store_dir, store))
+        search = lambda query: vector_store.query(query, n_results=TOP_K)[0]
+    search(queries[0])
+    open_seconds = time.perf_counter() - start_time
+
+    ids, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        result = search(query)
+        latencies.append(time.perf_counter() - start_time)
+        ids.append(result["ids"][0])
+
+    results[store] = {
+        "ids": ids,
+        "open_seconds": open_seconds,
+        "latencies": latencies,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_benchmark(db_path: str = MAIN_VIDEOS_DB_PATH, num_queries: int = NUM_QUERIES) -> None:
+    """Prints recall@5 against exact float32 search, open time, query latency and peak RSS of the Chroma index and
+    of memory-mapped float16 and int8 stores exported from it. Queries are stored segment vectors with noise added.
+    Each store is searched in its own process so memory is measured in isolation.
+    """
+
+    # Exact neighbours of the queries over every stored vector
+    stored = chromadb.PersistentClient(db_path).get_collection(TABLE_NAME).get(include=["embeddings"])
+    vectors = np.array(stored["embeddings"], dtype=np.float32)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+    queries = queries + rng.normal(scale=queries.std(), size=queries.shape).astype(np.float32)
+    truth = [{stored["ids"][i] for i in row} for row in exact_top_k(vectors, queries, TOP_K)]
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Manager().dict()
+    with tempfile.TemporaryDirectory() as store_dir:
+        for dtype in ("float16", "int8"):
+            info = export_vector_store(db_path, os.path.join(store_dir, dtype), dtype=dtype)
+            size_mb = os.path.getsize(os.path.join(store_dir, dtype, "vectors.npy")) / 1e6
+            print(f"{dtype} store: {info['count']} vectors, {size_mb:.1f} MB matrix")
+
+        print(f"{len(queries)} queries against {db_path}, top {TOP_K}")
+        for store in STORES:
+            process = context.Process(
+                target=measure_store, args=(store, db_path, store_dir, queries, results)
+            )
+            process.start()
+            process.join()
+            if store not in results:
+                print(f"{store}: failed (exit code {process.exitcode})")
+                continue
+
+            result = results[store]
+            recall = np.mean([len(truth[i] & set(ids)) / TOP_K for i, ids in enumerate(result["ids"])])
+            latencies_ms = np.array(result["latencies"]) * 1000
+            print(
+                f"{store}: recall@{TOP_K} {recall:.3f}, open {result['open_seconds'] * 1000:.0f} ms, "
+                f"p50 {np.percentile(latencies_ms, 50):.2f} ms, p95 {np.percentile(latencies_ms, 95):.2f} ms, "
+                f"peak RSS {result['peak_rss_mb']:.0f} MB"
+            )
+
+
+if __name__ == "__main__":
+    run_benchmark()
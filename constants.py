@@ -4,15 +4,111 @@ SINGLE_VIDEO_TEST_DB_PATH = "data/single_video.db"
 SUBSET_TEST_DB_PATH = "data/videos_subset_more_context.db"
 
 EMBEDDING_MODEL = "YituTech/conv-bert-base"
+# "torch" (full precision), "torch_int8" (dynamically quantized) or "onnx" (ONNX Runtime, export with export_embedding_model.py)
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_ONNX_PATH = "data/models/conv-bert-base.onnx"
+# Minimum mean cosine similarity of a backend's vectors to the stored full-precision vectors
+EMBEDDING_MIN_COSINE = 0.99
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_NUM_THREADS = None
+EMBEDDING_CACHE_PATH = "data/embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000
+
+TRANSCRIPT_CACHE_DIR = "data/transcripts"
+TRANSCRIPT_FETCH_WORKERS = 4
+TRANSCRIPT_FETCH_RETRIES = 3
+TRANSCRIPT_FETCH_BACKOFF = 1.0
+
+PIPELINE_QUEUE_SIZE = 4
+# Number of worker processes that embed segments during the ETL, each with its share of the CPU cores (1 embeds in
+# the ETL process)
+ETL_EMBEDDING_WORKERS = 1
 
 TABLE_NAME = "huberman_videos"
 DISTANCE_METRIC = "cosine"
 
+# HNSW index parameters of new databases, e.g. {"M": 32, "construction_ef": 200, "search_ef": 50}. Missing ones keep
+# Chroma's defaults (M 16, construction_ef 100, search_ef 10). They are recorded in the collection metadata, and an
+# existing database keeps the ones it was built with until tune_hnsw.py rebuilds it with tuned ones.
+HNSW_PARAMS = {}
+# tune_hnsw.py: the values tried for each parameter, the recall@HNSW_TUNING_K against exact search the chosen
+# parameters must reach, and the number of queries measured
+HNSW_TUNING_GRID = {"M": [8, 16, 32], "construction_ef": [100, 200], "search_ef": [10, 20, 50, 100]}
+HNSW_TUNING_K = 20
+HNSW_TARGET_RECALL = 0.95
+HNSW_TUNING_QUERIES = 200
+
+# Where retrieval searches: "chroma" (the HNSW index) or "mmap" (the exact-search vector store exported next to the
+# database with export_vector_store.py), and the storage type of exported vectors ("float16" or "int8")
+VECTOR_STORE = "chroma"
+VECTOR_STORE_DTYPE = "float16"
+
+# Whether new databases store each window as a line range into the caption lines of its video, kept once per video
+# next to the database (e.g. data/videos.lines), instead of storing its text, title and source URL
+COMPACT_STORAGE = False
+
+# Retrieval mode: "vector" (embedding search) or "hybrid" (embedding and BM25 keyword search, fused by reciprocal
+# rank). Hybrid mode fuses the top HYBRID_CANDIDATES results of each search.
+RETRIEVAL_MODE = "vector"
+HYBRID_VECTOR_WEIGHT = 1.0
+HYBRID_BM25_WEIGHT = 1.0
+HYBRID_RRF_K = 60
+HYBRID_CANDIDATES = 50
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Databases searched together as shards of one index by models/sharded_retrieval.py. Besides its "db_path" (and an
+# optional "name"), each shard has metadata that queries can be routed by, e.g. {"playlist": "fitness"}.
+RETRIEVAL_SHARDS = [
+    {"db_path": MAIN_VIDEOS_DB_PATH, "playlist": "fitness"},
+]
+SHARD_QUERY_WORKERS = 8
+
 DEFAULT_LLM_MODEL = "gpt-3.5-turbo-0125"
 DEFAULT_LLM_TEMP = 0.1
+LLM_MAX_CONNECTIONS = 32
+# LLM calls that are rate limited (429), hit a server error (5xx) or lose their connection are retried up to
+# LLM_MAX_RETRIES times, after the server's Retry-After or after LLM_RETRY_BACKOFF seconds doubling on each retry
+LLM_MAX_RETRIES = 5
+LLM_RETRY_BACKOFF = 1.0
+
+MAX_CONCURRENT_QUERIES = 16
+QUERY_EXECUTOR_WORKERS = 4
+
+# Concurrent queries arriving within QUERY_BATCH_MAX_WAIT seconds are embedded and searched together (1 disables batching)
+QUERY_BATCH_MAX_WAIT = 0.005
+QUERY_BATCH_MAX_SIZE = 32
+
+# Bulk question answering (run_batch.py): questions embedded and searched per pass, and LLM calls in flight
+BATCH_QUERY_SIZE = 64
+BATCH_LLM_WORKERS = 8
 
 DEFAULT_QUERY_RESULTS = 5
 
+# Before the LLM call, CONTEXT_CANDIDATES segments are retrieved, distinct ones are picked by maximal marginal
+# relevance, overlapping windows of the same video among them are merged and the passages are packed into
+# CONTEXT_MAX_TOKENS embedding-model tokens. None disables the stage and sends the top segments as retrieved.
+CONTEXT_MAX_TOKENS = 800
+CONTEXT_CANDIDATES = 20
+CONTEXT_MMR_LAMBDA = 0.7
+CONTEXT_MIN_PASSAGE_TOKENS = 50
+
+ANSWER_CACHE_PATH = "data/answer_cache.sqlite3"
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_TTL = 7 * 24 * 60 * 60
+# Cosine similarity above which a cached answer to a different question is reused. Mean-pooled conv-bert vectors
+# are all fairly similar to each other, so the semantic tier is disabled (None) until a threshold is tuned.
+ANSWER_CACHE_SEMANTIC_THRESHOLD = None
+
+# Spans, histograms and counters of the query path and the ETL (see utils/instrumentation.py). When set, finished
+# spans are appended as JSON lines to INSTRUMENTATION_LOG_PATH and metrics are served for Prometheus on METRICS_PORT.
+INSTRUMENTATION_ENABLED = True
+INSTRUMENTATION_LOG_PATH = None
+METRICS_PORT = None
+
+# Fitness questions labelled with the videos that answer them, for offline retrieval evaluation
+EVAL_QUESTIONS_PATH = "data/eval/fitness_questions.jsonl"
+
 LLM_TEST_QUESTION = "What are the components of an LLM?"
 FITNESS_TEST_QUESTION = "How should I train for anerobic capacity?"
 FITNESS_TEST_QUESTION_1 = "What methods can I use to lose weight quickly?"
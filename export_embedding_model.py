@@ -0,0 +1,45 @@
+from utils.embedding_utils import MyEmbeddingFunction, cosine_agreement, load_stored_sample
+from constants import MAIN_VIDEOS_DB_PATH, EMBEDDING_ONNX_PATH, EMBEDDING_MIN_COSINE
+
+VALIDATION_SAMPLES = 500
+
+
+def validate_backend(
+    name: str, db_path: str = MAIN_VIDEOS_DB_PATH, num_samples: int = VALIDATION_SAMPLES
+) -> bool:
+    f"""Re-embeds stored segments with the backend and compares them to the full-precision vectors in the database.
+
+    Args:
+        name (str): The name of the embedding backend.
+        db_path (str): The path to the database. Default is {MAIN_VIDEOS_DB_PATH}.
+        num_samples (int): The number of stored segments to compare. Default is {VALIDATION_SAMPLES}.
+
+    Returns:
+        bool: Whether the mean cosine similarity is at least {EMBEDDING_MIN_COSINE}.
+    """
+
+    from utils.embedding_backends import load_backend
+
+    documents, stored = load_stored_sample(db_path, num_samples)
+    embeddings = MyEmbeddingFunction(backend=load_backend(name)).encode(documents)
+    cosines = cosine_agreement(embeddings, stored)
+
+    passed = float(cosines.mean()) >= EMBEDDING_MIN_COSINE
+    print(
+        f"{name}: cosine to stored vectors over {len(documents)} segments: "
+        f"mean {cosines.mean():.5f}, min {cosines.min():.5f} ({'ok' if passed else 'FAILED'})"
+    )
+    return passed
+
+
+if __name__ == "__main__":
+    db_path = input(f"Enter path to database to validate against (leave blank for {MAIN_VIDEOS_DB_PATH}): ")
+    db_path = db_path or MAIN_VIDEOS_DB_PATH
+
+    from utils.embedding_backends import export_onnx
+
+    export_onnx(EMBEDDING_ONNX_PATH)
+    print(f"Exported the embedding model to {EMBEDDING_ONNX_PATH}")
+
+    for name in ["torch", "torch_int8", "onnx"]:
+        validate_backend(name, db_path)
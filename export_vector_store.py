@@ -0,0 +1,11 @@
+from utils.vector_store import export_vector_store, get_vector_store_path
+from constants import MAIN_VIDEOS_DB_PATH, VECTOR_STORE_DTYPE
+
+if __name__ == "__main__":
+    db_path = input(f"Enter path to database (leave blank for {MAIN_VIDEOS_DB_PATH}): ")
+    db_path = db_path or MAIN_VIDEOS_DB_PATH
+    dtype = input(f"Enter vector type, float16 or int8 (leave blank for {VECTOR_STORE_DTYPE}): ")
+    dtype = dtype or VECTOR_STORE_DTYPE
+
+    info = export_vector_store(db_path, dtype=dtype)
+    print(f"Exported {info['count']} vectors to {get_vector_store_path(db_path)}: {info}")
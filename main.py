@@ -1,14 +1,157 @@
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, List
+
 from models import llm, retrieval
-import gradio as gr
+from utils.answer_cache import AnswerCache
+from utils.context_utils import build_context, count_tokens
+from utils.instrumentation import configure, in_current_context, increment, record_span, span
 
 from constants import (
     MAIN_VIDEOS_DB_PATH,
     DEFAULT_QUERY_RESULTS,
     DEFAULT_LLM_MODEL,
     DEFAULT_LLM_TEMP,
+    MAX_CONCURRENT_QUERIES,
+    QUERY_EXECUTOR_WORKERS,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_CANDIDATES,
 )
 from constants import GRADIO_TITLE, GRADIO_DESCRIPTION, GRADIO_EXAMPLES
 
+# The answer cache and the query executor are created on first use, so importing this module does not open the
+# cache database or start threads. Tests and benchmarks may assign their own cache to this name.
+answer_cache = None
+query_executor = None
+_resources_lock = threading.Lock()
+
+# Limit on the number of async queries in flight, one per event loop. Queries above the limit wait their turn.
+_query_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Returns the shared cache of LLM answers, persisted across restarts, opening it on first use."""
+
+    global answer_cache
+    with _resources_lock:
+        if answer_cache is None:
+            answer_cache = AnswerCache()
+        return answer_cache
+
+
+def get_query_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool the async query path runs embedding and retrieval on, since they are CPU bound,
+    creating it on first use."""
+
+    global query_executor
+    with _resources_lock:
+        if query_executor is None:
+            query_executor = ThreadPoolExecutor(
+                max_workers=QUERY_EXECUTOR_WORKERS, thread_name_prefix="retrieval"
+            )
+        return query_executor
+
+
+def get_query_semaphore() -> asyncio.Semaphore:
+    """Returns the semaphore that limits the number of concurrent queries on the running event loop."""
+
+    loop = asyncio.get_running_loop()
+    if loop not in _query_semaphores:
+        _query_semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+    return _query_semaphores[loop]
+
+
+def retrieve_context(
+    question: str,
+    db_path: str,
+    num_rel_segments: int,
+    scope: str,
+    use_cache: bool,
+) -> tuple:
+    """Embeds the question and retrieves the relevant segments, stopping early if the answer is cached.
+
+    Args:
+        question (str): The user's question.
+        db_path (str): The path to the database.
+        num_rel_segments (int): The number of relevant segments to retrieve.
+        scope (str): The answer cache scope of the query settings.
+        use_cache (bool): Whether to use the answer cache.
+
+    Returns:
+        tuple: The cached answer (or None), the relevant segments (or None on a semantic hit) and the query embedding.
+    """
+
+    retriever = retrieval.get_retriever(db_path)
+
+    # Embed the question and check for an answer to a similar question
+    query_embedding = retriever.embed_query(question)
+    if use_cache:
+        answer = get_answer_cache().get_similar(query_embedding, scope)
+        if answer is not None:
+            increment("answer_cache_hits")
+            return answer, None, query_embedding
+
+    # Get the candidate segments from the shared retriever for this database
+    candidates = retriever.search(
+        question, query_embedding, n_results=get_num_candidates(num_rel_segments)
+    )
+    answer, relevant_segments = select_context(
+        question, candidates, num_rel_segments, scope, use_cache
+    )
+
+    return answer, relevant_segments, query_embedding
+
+
+def get_num_candidates(num_rel_segments: int) -> int:
+    """Returns the number of segments to retrieve for a context of `num_rel_segments` segments."""
+
+    # Over-fetch so distinct segments can be picked, unless the context is sent as retrieved
+    if CONTEXT_MAX_TOKENS is None:
+        return num_rel_segments
+    return max(num_rel_segments, CONTEXT_CANDIDATES)
+
+
+def select_context(
+    question: str,
+    candidates: dict,
+    num_rel_segments: int,
+    scope: str,
+    use_cache: bool,
+    token_counter: Callable[[List[str]], List[int]] = count_tokens,
+) -> tuple:
+    """Builds the context from the retrieved candidates and checks for a cached answer from the same segments.
+
+    Args:
+        question (str): The user's question.
+        candidates (dict): The segments retrieved for the question, see get_num_candidates.
+        num_rel_segments (int): The number of relevant segments to select.
+        scope (str): The answer cache scope of the query settings.
+        use_cache (bool): Whether to use the answer cache.
+        token_counter (function): Returns the number of tokens in each of a list of texts. Default is count_tokens.
+
+    Returns:
+        tuple: The cached answer (or None) and the relevant segments.
+    """
+
+    if CONTEXT_MAX_TOKENS is None:
+        relevant_segments = candidates
+    else:
+        # Pick distinct segments, merge overlapping windows and pack them into the token budget
+        with span("build_context"):
+            relevant_segments = build_context(candidates, num_rel_segments, token_counter=token_counter)
+    increment("segments_retrieved", len(relevant_segments["ids"][0]))
+
+    # Check for an answer to the same question from the same segments
+    answer = None
+    if use_cache:
+        answer = get_answer_cache().get(question, relevant_segments["ids"][0], scope)
+        increment("answer_cache_hits" if answer is not None else "answer_cache_misses")
+
+    return answer, relevant_segments
+
 
 def run_query(
     question: str,
@@ -16,8 +159,10 @@ def run_query(
     num_rel_segments: int = DEFAULT_QUERY_RESULTS,
     llm_model: str = DEFAULT_LLM_MODEL,
     llm_temp: float = DEFAULT_LLM_TEMP,
+    use_cache: bool = True,
 ) -> str:
-    f"""Runs the query and returns the answer.
+    f"""Runs the query and returns the answer. Answers are served from the answer cache when the same question was
+    answered from the same segments before, or (if the semantic tier is enabled) when a similar question was.
 
     Args:
         question (str): The user's question.
@@ -25,27 +170,290 @@ def run_query(
         num_rel_segments (int): The number of relevant segments to retrieve. Default is {DEFAULT_QUERY_RESULTS}.
         llm_model (str): The LLM model to use. Default is {DEFAULT_LLM_MODEL}.
         llm_temp (float): The sampling temperature to use. Default is {DEFAULT_LLM_TEMP}.
+        use_cache (bool): Whether to use the answer cache. Default is True.
 
     Returns:
         str: The answer to the user's question.
     """
 
-    # Get the relevant segments
-    relevant_segments = retrieval.get_relevant_segments(
-        question, db_path=db_path, n_results=num_rel_segments
+    with span("query") as query_span:
+        scope = AnswerCache.scope(db_path, num_rel_segments, llm_model, llm_temp)
+        answer, relevant_segments, query_embedding = retrieve_context(
+            question, db_path, num_rel_segments, scope, use_cache
+        )
+        if answer is not None:
+            query_span.set_attribute("cached", True)
+            return answer
+
+        # Get the LLM answer
+        start_time = time.perf_counter()
+        answer = llm.answer_with_context(
+            question, relevant_segments, model=llm_model, temperature=llm_temp
+        )
+        llm_seconds = time.perf_counter() - start_time
+
+        if use_cache:
+            get_answer_cache().put(
+                question,
+                relevant_segments["ids"][0],
+                scope,
+                query_embedding,
+                answer,
+                llm_seconds,
+            )
+
+    return answer
+
+
+def run_query_stream(
+    question: str,
+    db_path: str = MAIN_VIDEOS_DB_PATH,
+    num_rel_segments: int = DEFAULT_QUERY_RESULTS,
+    llm_model: str = DEFAULT_LLM_MODEL,
+    llm_temp: float = DEFAULT_LLM_TEMP,
+    use_cache: bool = True,
+) -> Iterator[str]:
+    f"""Runs the query and yields the answer as it is generated. Each yield is the answer so far, which is what Gradio
+    expects from a streaming function. Time to first token and total time are printed when the answer is complete.
+
+    Args:
+        question (str): The user's question.
+        db_path (str): The path to the database. Default is {MAIN_VIDEOS_DB_PATH}.
+        num_rel_segments (int): The number of relevant segments to retrieve. Default is {DEFAULT_QUERY_RESULTS}.
+        llm_model (str): The LLM model to use. Default is {DEFAULT_LLM_MODEL}.
+        llm_temp (float): The sampling temperature to use. Default is {DEFAULT_LLM_TEMP}.
+        use_cache (bool): Whether to use the answer cache. Default is True.
+
+    Yields:
+        str: The answer to the user's question so far.
+    """
+
+    start_time = time.perf_counter()
+    scope = AnswerCache.scope(db_path, num_rel_segments, llm_model, llm_temp)
+    answer, relevant_segments, query_embedding = retrieve_context(
+        question, db_path, num_rel_segments, scope, use_cache
     )
+    if answer is not None:
+        record_span("query", time.perf_counter() - start_time, cached=True)
+        yield answer
+        return
 
-    # Get the LLM answer
-    answer = llm.answer_with_context(
+    # Stream the LLM answer
+    llm_start_time = time.perf_counter()
+    first_token_time = None
+    answer = ""
+    for token in llm.stream_answer_with_context(
         question, relevant_segments, model=llm_model, temperature=llm_temp
-    )
+    ):
+        if first_token_time is None:
+            first_token_time = time.perf_counter()
+        answer += token
+        yield answer
+
+    # Spans cannot stay open across the yields of a generator, so the stream is timed here
+    end_time = time.perf_counter()
+    record_stream_spans(start_time, llm_start_time, first_token_time, end_time, llm_model)
+    if first_token_time is not None:
+        print(
+            f"run_query_stream: first token after {first_token_time - start_time:.2f} seconds, "
+            f"complete after {end_time - start_time:.2f} seconds."
+        )
+
+    if use_cache:
+        get_answer_cache().put(
+            question,
+            relevant_segments["ids"][0],
+            scope,
+            query_embedding,
+            answer,
+            end_time - llm_start_time,
+        )
+
+
+def record_stream_spans(
+    start_time: float,
+    llm_start_time: float,
+    first_token_time: float,
+    end_time: float,
+    llm_model: str,
+) -> None:
+    """Records the LLM and query spans of a streamed answer from its perf_counter timestamps."""
+
+    first_token_ms = (first_token_time - start_time) * 1000 if first_token_time is not None else None
+    record_span("llm", end_time - llm_start_time, model=llm_model, stream=True)
+    record_span("query", end_time - start_time, first_token_ms=first_token_ms)
+
+
+def warmup(db_path: str = MAIN_VIDEOS_DB_PATH) -> None:
+    f"""Loads the embedding model, opens the database and the answer cache and creates the LLM clients ahead of the
+    first question.
+    Everything is otherwise created on first use, so call this before serving requests.
+
+    Args:
+        db_path (str): The path to the database. Default is {MAIN_VIDEOS_DB_PATH}.
+    """
+
+    retrieval.get_retriever(db_path).warmup()
+    llm.warmup()
+    get_answer_cache()
+
+
+async def run_query_async(
+    question: str,
+    db_path: str = MAIN_VIDEOS_DB_PATH,
+    num_rel_segments: int = DEFAULT_QUERY_RESULTS,
+    llm_model: str = DEFAULT_LLM_MODEL,
+    llm_temp: float = DEFAULT_LLM_TEMP,
+    use_cache: bool = True,
+) -> str:
+    f"""Runs the query without blocking the event loop and returns the answer. Retrieval runs on the query executor
+    and the LLM is called with the pooled async client. At most {MAX_CONCURRENT_QUERIES} queries run at once; the
+    rest wait for a free slot.
+
+    Args:
+        question (str): The user's question.
+        db_path (str): The path to the database. Default is {MAIN_VIDEOS_DB_PATH}.
+        num_rel_segments (int): The number of relevant segments to retrieve. Default is {DEFAULT_QUERY_RESULTS}.
+        llm_model (str): The LLM model to use. Default is {DEFAULT_LLM_MODEL}.
+        llm_temp (float): The sampling temperature to use. Default is {DEFAULT_LLM_TEMP}.
+        use_cache (bool): Whether to use the answer cache. Default is True.
+
+    Returns:
+        str: The answer to the user's question.
+    """
+
+    with span("query") as query_span:
+        async with get_query_semaphore():
+            loop = asyncio.get_running_loop()
+            scope = AnswerCache.scope(db_path, num_rel_segments, llm_model, llm_temp)
+
+            # Run retrieval in this task's context so its spans are children of the query span
+            answer, relevant_segments, query_embedding = await loop.run_in_executor(
+                get_query_executor(),
+                in_current_context(
+                    retrieve_context, question, db_path, num_rel_segments, scope, use_cache
+                ),
+            )
+            if answer is not None:
+                query_span.set_attribute("cached", True)
+                return answer
+
+            # Get the LLM answer
+            start_time = time.perf_counter()
+            answer = await llm.async_answer_with_context(
+                question, relevant_segments, model=llm_model, temperature=llm_temp
+            )
+            llm_seconds = time.perf_counter() - start_time
+
+    if use_cache:
+        # The cache writes to SQLite, so it runs on the query executor rather than the event loop
+        await loop.run_in_executor(
+            get_query_executor(),
+            get_answer_cache().put,
+            question,
+            relevant_segments["ids"][0],
+            scope,
+            query_embedding,
+            answer,
+            llm_seconds,
+        )
 
     return answer
 
 
+async def run_query_stream_async(
+    question: str,
+    db_path: str = MAIN_VIDEOS_DB_PATH,
+    num_rel_segments: int = DEFAULT_QUERY_RESULTS,
+    llm_model: str = DEFAULT_LLM_MODEL,
+    llm_temp: float = DEFAULT_LLM_TEMP,
+    use_cache: bool = True,
+) -> AsyncIterator[str]:
+    f"""Runs the query without blocking the event loop and yields the answer so far as it is generated, like
+    run_query_stream. At most {MAX_CONCURRENT_QUERIES} queries run at once; the rest wait for a free slot.
+
+    Args:
+        question (str): The user's question.
+        db_path (str): The path to the database. Default is {MAIN_VIDEOS_DB_PATH}.
+        num_rel_segments (int): The number of relevant segments to retrieve. Default is {DEFAULT_QUERY_RESULTS}.
+        llm_model (str): The LLM model to use. Default is {DEFAULT_LLM_MODEL}.
+        llm_temp (float): The sampling temperature to use. Default is {DEFAULT_LLM_TEMP}.
+        use_cache (bool): Whether to use the answer cache. Default is True.
+
+    Yields:
+        str: The answer to the user's question so far.
+    """
+
+    async with get_query_semaphore():
+        start_time = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        scope = AnswerCache.scope(db_path, num_rel_segments, llm_model, llm_temp)
+
+        # Spans cannot stay open across the yields of a generator, so the query span covers retrieval and the
+        # streamed answer is recorded as an llm span once it is complete
+        with span("query", stream=True) as query_span:
+            # Run retrieval in this task's context so its spans are children of the query span
+            answer, relevant_segments, query_embedding = await loop.run_in_executor(
+                get_query_executor(),
+                in_current_context(
+                    retrieve_context, question, db_path, num_rel_segments, scope, use_cache
+                ),
+            )
+            if answer is not None:
+                query_span.set_attribute("cached", True)
+        if answer is not None:
+            yield answer
+            return
+
+        # Stream the LLM answer
+        llm_start_time = time.perf_counter()
+        first_token_time = None
+        answer = ""
+        async for token in llm.async_stream_answer_with_context(
+            question, relevant_segments, model=llm_model, temperature=llm_temp
+        ):
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+            answer += token
+            yield answer
+
+        end_time = time.perf_counter()
+        first_token_ms = (first_token_time - start_time) * 1000 if first_token_time is not None else None
+        record_span(
+            "llm", end_time - llm_start_time, model=llm_model, stream=True, first_token_ms=first_token_ms
+        )
+
+    if first_token_time is not None:
+        print(
+            f"run_query_stream_async: first token after {first_token_time - start_time:.2f} seconds, "
+            f"complete after {end_time - start_time:.2f} seconds."
+        )
+
+    if use_cache:
+        # The cache writes to SQLite, so it runs on the query executor rather than the event loop
+        await loop.run_in_executor(
+            get_query_executor(),
+            get_answer_cache().put,
+            question,
+            relevant_segments["ids"][0],
+            scope,
+            query_embedding,
+            answer,
+            end_time - llm_start_time,
+        )
+
+
 if __name__ == "__main__":
+    import gradio as gr
+
+    # Set up the span log and metrics endpoint, if configured
+    configure()
+
+    # Load the embedding model, open the database and create the LLM clients before serving requests
+    warmup()
+
     demo = gr.Interface(
-        fn=run_query,
+        fn=run_query_stream_async,
         inputs="text",
         outputs="text",
         title=GRADIO_TITLE,
@@ -54,4 +462,6 @@ if __name__ == "__main__":
         examples=GRADIO_EXAMPLES,
     )
 
+    # Let Gradio run as many requests at once as the query path allows
+    demo.queue(default_concurrency_limit=MAX_CONCURRENT_QUERIES)
     demo.launch(share=True)
@@ -1,22 +1,50 @@
+import hashlib
 import json
+import os
 import chromadb
 from datetime import datetime
 import math
-from typing import List, Dict
+import numpy as np
+from typing import Any, List, Dict
 
 from utils.general_utils import timeit
-from utils.embedding_utils import MyEmbeddingFunction
+from utils.instrumentation import increment
+from utils.embedding_utils import MyEmbeddingFunction, get_embedding_function, tokenize
+from utils.embedding_pool import EmbeddingPool
+from utils.chunking_utils import get_token_windows
+from utils.pipeline_utils import Stage, run_pipeline
+from utils.vector_store import EXPORT_PAGE_SIZE, export_vector_store, get_vector_store_path
+from utils.bm25_index import BM25Index, get_bm25_index_path
+from utils.hnsw_tuning import get_hnsw_params, read_collection, replace_collection, to_metadata
+from utils.line_store import LineStore, compact_metadata, get_line_store_path, get_source_url
+from utils.transcript_utils import (
+    fetch_with_retry,
+    fetch_cached_transcript,
+    fetch_transcripts,
+)
 from youtube_transcript_api import YouTubeTranscriptApi
 
-from constants import MAIN_VIDEOS_JSON_PATH, TABLE_NAME, DISTANCE_METRIC
+from constants import (
+    MAIN_VIDEOS_JSON_PATH,
+    TABLE_NAME,
+    DISTANCE_METRIC,
+    EMBEDDING_MODEL,
+    TRANSCRIPT_FETCH_WORKERS,
+    ETL_EMBEDDING_WORKERS,
+    COMPACT_STORAGE,
+    HNSW_PARAMS,
+)
 
 
 @timeit
-def get_video_transcript(video_id: str) -> List[Dict[str, str, str]]:
-    """Fetches the transcript for a given YouTube video ID using the YouTubeTranscriptApi.
+def get_video_transcript(
+    video_id: str, fetcher=YouTubeTranscriptApi
+) -> List[Dict[str, Any]]:
+    """Fetches the transcript for a given YouTube video ID using the YouTubeTranscriptApi. Failed fetches are retried with backoff.
 
     Args:
         video_id (str): The YouTube video ID.
+        fetcher: Any object with a YouTubeTranscriptApi-style get_transcript method. Default is YouTubeTranscriptApi.
 
     Returns:
         list: A list of dictionaries containing the transcript for the video.
@@ -24,9 +52,7 @@ def get_video_transcript(video_id: str) -> List[Dict[str, str, str]]:
     """
 
     try:
-        transcript = YouTubeTranscriptApi.get_transcript(
-            video_id, languages=["en", "en-US"]
-        )
+        transcript = fetch_with_retry(video_id, fetcher=fetcher)
         return transcript
     except Exception as e:
         print(f"Error fetching transcript for video {video_id}: {str(e)}")
@@ -39,7 +65,7 @@ def format_transcript(
     video_title: str,
     batch_size: int = None,
     overlap: int = None,
-) -> List[Dict[str, Dict[str, str, str, str]]]:
+) -> List[Dict[str, Any]]:
     """Formats the transcript into segments for loading into the database. Metadata is added to each segment to include the video ID, segment ID, title, and source URL. Batch size and overlap can be specified to create overlapping segments.
 
     Args:
@@ -57,15 +83,13 @@ def format_transcript(
                     'segment_id': 'The segment ID',
                     'title': 'The title of the video',
                     'source': 'The source URL'
-                    }
+                    },
+                'lines': 'The first and last (exclusive) caption lines of the segment'
                 }
     """
 
     # Initialize the list to store the formatted segments
     formatted_data = []
-    # Specify base YouTube URL and timestamp query parameter
-    base_url = f"https://www.youtube.com/watch?v={video_id}"
-    query_params = "&t={start}s"
 
     # If no batching, loop through each segment
     if not batch_size:
@@ -84,7 +108,7 @@ def format_transcript(
         text = " ".join(entry["text"] for entry in batch)
 
         # Set the URL for the start of the batch
-        url = base_url + query_params.format(start=start_time)
+        url = get_source_url(video_id, start_time)
 
         # Set metadata for the batch
         metadata = {
@@ -94,7 +118,7 @@ def format_transcript(
             "source": url,
         }
 
-        segment = {"text": text, "metadata": metadata}
+        segment = {"text": text, "metadata": metadata, "lines": (i, i + len(batch))}
 
         # Add this batch to the formatted data
         formatted_data.append(segment)
@@ -102,33 +126,136 @@ def format_transcript(
     return formatted_data
 
 
-# Initialize the embedding function
-embed_text = MyEmbeddingFunction()
+def format_transcript_by_tokens(
+    transcript: list,
+    video_id: str,
+    video_title: str,
+    max_tokens: int,
+    token_overlap: int = 0,
+) -> List[Dict[str, Any]]:
+    """Formats the transcript into segments for loading into the database, packing caption lines into segments of at most `max_tokens` embedding-model tokens. Segments end at sentence boundaries where possible and consecutive segments share up to `token_overlap` tokens. Metadata is the same as in format_transcript.
+
+    Args:
+        transcript (list): The transcript for the video.
+        video_id (str): The YouTube video ID.
+        video_title (str): The title of the video.
+        max_tokens (int): The maximum number of tokens in each segment.
+        token_overlap (int): The maximum number of overlapping tokens between each segment. Default is 0.
+
+    Returns:
+        list: A list of dictionaries containing the formatted segments, see format_transcript.
+    """
+
+    # Count the tokens of each caption line with the embedding tokenizer
+    texts = [entry["text"] for entry in transcript]
+    token_counts = [
+        len(ids) for ids in tokenize(texts, add_special_tokens=False)["input_ids"]
+    ]
+
+    formatted_data = []
+    for first, last in get_token_windows(texts, token_counts, max_tokens, token_overlap):
+        # The URL points to the start of the first line in the segment
+        url = get_source_url(video_id, transcript[first]["start"])
+
+        metadata = {
+            "video_id": video_id,
+            "segment_id": video_id + "__" + str(first),
+            "title": video_title,
+            "source": url,
+        }
+
+        formatted_data.append(
+            {"text": " ".join(texts[first:last]), "metadata": metadata, "lines": (first, last)}
+        )
+
+    return formatted_data
+
+
+def segment_transcript(
+    transcript: list,
+    video: dict,
+    batch_size: int = None,
+    overlap: int = None,
+    max_tokens: int = None,
+    token_overlap: int = None,
+) -> List[Dict[str, Any]]:
+    """Formats the transcript into segments, by token budget if `max_tokens` is given and by number of caption lines otherwise.
+
+    Args:
+        transcript (list): The transcript for the video.
+        video (dict): The video information. {'id': 'The YouTube video ID', 'title': 'The title of the video'}
+        batch_size (int): The number of segments to include in each batch. Default is None.
+        overlap (int): The number of overlapping segments between each batch. Default is None.
+        max_tokens (int): The maximum number of tokens in each segment. Default is None.
+        token_overlap (int): The maximum number of overlapping tokens between each segment. Default is None.
+
+    Returns:
+        list: A list of dictionaries containing the formatted segments, see format_transcript.
+    """
+
+    if max_tokens:
+        return format_transcript_by_tokens(
+            transcript, video["id"], video["title"], max_tokens, token_overlap or 0
+        )
+
+    return format_transcript(
+        transcript, video["id"], video["title"], batch_size=batch_size, overlap=overlap
+    )
 
 
-def initialize_db(db_path: str, distance_metric: str = DISTANCE_METRIC) -> None:
-    f"""Initializes the database with the specified distance metric.
+def initialize_db(
+    db_path: str,
+    distance_metric: str = DISTANCE_METRIC,
+    compact: bool = COMPACT_STORAGE,
+    hnsw_params: dict = None,
+) -> None:
+    f"""Initializes the database with the specified distance metric and HNSW index parameters.
 
     Args:
         db_path (str): The path to the database file.
         distance_metric (str): The distance metric to use for the database. Default is {DISTANCE_METRIC}.
+        compact (bool): Whether to store segments as line ranges into a line store next to the database. Default is {COMPACT_STORAGE}.
+        hnsw_params (dict): The HNSW index parameters, e.g. {{'M': 32, 'search_ef': 50}}. Default is None ({HNSW_PARAMS}).
     """
 
     # Create a persistent database client
     client = chromadb.PersistentClient(path=db_path)
 
-    # Create a table using the embedding function and specified distance metric
+    # Create a table using the shared embedding function (so the ETL and query paths embed text the same way)
+    # and the specified distance metric and index parameters, which Chroma reads from the metadata.
+    # The embedding model is recorded so retrieval can check it embeds queries with the same model.
+    metadata = {
+        "hnsw:space": distance_metric,
+        **to_metadata(HNSW_PARAMS if hnsw_params is None else hnsw_params),
+        "embedding_model": EMBEDDING_MODEL,
+    }
+    if compact:
+        metadata["storage"] = "compact"
     client.create_collection(
         name=TABLE_NAME,
-        embedding_function=embed_text,
-        metadata={"hnsw:space": distance_metric},
+        embedding_function=get_embedding_function(),
+        metadata=metadata,
     )
 
     print(f"Database created at {db_path}")
 
 
-def load_data_to_db(db_path: str, data: list) -> None:
-    """Loads the formatted data into the database.
+def is_compact(db_path: str) -> bool:
+    """Returns whether the database stores segments as line ranges into its line store, see initialize_db."""
+
+    client = chromadb.PersistentClient(path=db_path)
+    metadata = client.get_collection(TABLE_NAME).metadata or {}
+    return metadata.get("storage") == "compact"
+
+
+def load_data_to_db(
+    db_path: str,
+    data: list,
+    embeddings: np.ndarray = None,
+    embedding_function: MyEmbeddingFunction = None,
+    compact: bool = False,
+) -> None:
+    """Loads the formatted data into the database. Segments are embedded with the embedding function unless their embeddings are given.
 
     Args:
         db_path (str): The path to the database file.
@@ -141,10 +268,18 @@ def load_data_to_db(db_path: str, data: list) -> None:
                     'source': 'The source URL'
                     }
                 }
+        embeddings (np.ndarray): The embeddings of the segments, one row per segment. Default is None.
+        embedding_function (MyEmbeddingFunction): The embedding function, e.g. an EmbeddingPool. Default is None (the shared embedding function).
+        compact (bool): Whether to store each segment as its line range only. The caption lines of its video must be in the database's line store. Default is False.
     """
     # Access the database client
     client = chromadb.PersistentClient(path=db_path)
-    collection = client.get_collection(TABLE_NAME)
+    embedding_function = embedding_function or get_embedding_function()
+    collection = client.get_collection(TABLE_NAME, embedding_function=embedding_function)
+
+    # Compact segments have no text for the database to embed, so they are embedded here
+    if compact and embeddings is None:
+        embeddings = embedding_function.encode([segment["text"] for segment in data])
 
     # Load the data in batches. ChromaDB has a limit of 5461 documents per batch.
     num_rows = len(data)
@@ -155,15 +290,66 @@ def load_data_to_db(db_path: str, data: list) -> None:
         batch_data = data[i * batch_size : (i + 1) * batch_size]
         documents = [segment["text"] for segment in batch_data]
         metadata = [segment["metadata"] for segment in batch_data]
+        if compact:
+            documents = None
+            metadata = [compact_metadata(segment) for segment in batch_data]
         ids = [segment["metadata"]["segment_id"] for segment in batch_data]
+        batch_embeddings = (
+            embeddings[i * batch_size : (i + 1) * batch_size]
+            if embeddings is not None
+            else None
+        )
 
-        collection.add(documents=documents, metadatas=metadata, ids=ids)
+        # Upsert so segments re-sent after an interrupted load are not duplicated
+        collection.upsert(
+            documents=documents,
+            embeddings=batch_embeddings,
+            metadatas=metadata,
+            ids=ids,
+        )
         print(f"Batch {i+1} of {num_batches} loaded to database.")
 
     print(f"Data loaded to database at {db_path}.")
 
 
-def log_data_load(json_path: str, db_path: str, batch_size: int, overlap: int) -> None:
+def get_log_path(db_path: str, log_name: str) -> str:
+    """Returns the path of a log file for the database, e.g. data/logs/videos_load_log.json for data/videos.db and
+    data/logs/eval_indexes_lines_15_10_load_log.json for data/eval/indexes/lines_15_10.db.
+
+    Args:
+        db_path (str): The path to the database file.
+        log_name (str): The name of the log, e.g. load_log.
+
+    Returns:
+        str: The path to the log file.
+    """
+
+    # Name the log after the database's path under data/, so databases with the same name in different folders
+    # do not share logs. Databases outside data/ are named after their full path.
+    db_path = os.path.abspath(db_path)
+    relative_path = os.path.relpath(db_path, os.path.abspath("data"))
+    if relative_path.startswith(os.pardir):
+        relative_path = db_path.lstrip(os.sep)
+    db_name = os.path.splitext(relative_path)[0].replace(os.sep, "_")
+
+    return f"data/logs/{db_name}_{log_name}.json"
+
+
+def get_manifest_path(db_path: str) -> str:
+    """Returns the path of the checkpoint manifest of the data load, next to the database, e.g.
+    data/videos.etl_manifest.json for data/videos.db."""
+
+    return os.path.splitext(os.path.normpath(db_path))[0] + ".etl_manifest.json"
+
+
+def log_data_load(
+    json_path: str,
+    db_path: str,
+    batch_size: int,
+    overlap: int,
+    max_tokens: int = None,
+    token_overlap: int = None,
+) -> None:
     """Logs the data load to a JSON file.
 
     Args:
@@ -171,6 +357,8 @@ def log_data_load(json_path: str, db_path: str, batch_size: int, overlap: int) -
         db_path (str): The path to the database file.
         batch_size (int): The number of segments to include in each batch.
         overlap (int): The number of overlapping segments between each batch.
+        max_tokens (int): The maximum number of tokens in each segment. Default is None.
+        token_overlap (int): The maximum number of overlapping tokens between each segment. Default is None.
     """
 
     # Create a JSON string with the data load information
@@ -180,67 +368,479 @@ def log_data_load(json_path: str, db_path: str, batch_size: int, overlap: int) -
             "db_path": db_path,
             "batch_size": batch_size,
             "overlap": overlap,
+            "max_tokens": max_tokens,
+            "token_overlap": token_overlap,
             "load_time": str(datetime.now()),
         }
     )
 
-    # Get the database name from the path and set the log path
-    db_file = db_path.split("/")[-1]
-    db_name = db_file.split(".")[0]
-    log_path = f"data/logs/{db_name}_load_log.json"
-
     # Write the log to a JSON file
-    with open(log_path, "w") as f:
+    with open(get_log_path(db_path, "load_log"), "w") as f:
+        f.write(log_json)
+
+
+def load_manifest(db_path: str) -> dict:
+    """Returns the checkpoint manifest of the data load into the database, or None if there is none or the database
+    no longer exists.
+
+    Args:
+        db_path (str): The path to the database file.
+
+    Returns:
+        dict: The manifest.
+                {'videos_info_path': 'The path to the JSON file containing the video information',
+                'batch_size': 'The number of segments to include in each batch',
+                'overlap': 'The number of overlapping segments between each batch',
+                'max_tokens': 'The maximum number of tokens in each segment',
+                'token_overlap': 'The maximum number of overlapping tokens between each segment',
+                'loaded_video_ids': 'The IDs of the videos already loaded into the database'
+                }
+    """
+
+    manifest_path = get_manifest_path(db_path)
+    if not os.path.exists(manifest_path):
+        return None
+
+    # A manifest outliving its database (e.g. the database folder was deleted) describes nothing to resume
+    if not os.path.exists(db_path):
+        os.remove(manifest_path)
+        return None
+
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(db_path: str, manifest: dict) -> None:
+    """Writes the checkpoint manifest of the data load. The file is replaced atomically so a crash never leaves a partial manifest.
+
+    Args:
+        db_path (str): The path to the database file.
+        manifest (dict): The manifest, see load_manifest.
+    """
+
+    manifest_path = get_manifest_path(db_path)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def hash_video(
+    video: dict,
+    transcript: list,
+    batch_size: int,
+    overlap: int,
+    max_tokens: int = None,
+    token_overlap: int = None,
+) -> str:
+    """Returns a hash of everything that determines a video's segments: its title, transcript and the chunking settings.
+
+    Args:
+        video (dict): The video information. {'id': 'The YouTube video ID', 'title': 'The title of the video'}
+        transcript (list): The transcript for the video.
+        batch_size (int): The number of segments to include in each batch.
+        overlap (int): The number of overlapping segments between each batch.
+        max_tokens (int): The maximum number of tokens in each segment. Default is None.
+        token_overlap (int): The maximum number of overlapping tokens between each segment. Default is None.
+
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+
+    hashed = {
+        "title": video["title"],
+        "transcript": transcript,
+        "batch_size": batch_size,
+        "overlap": overlap,
+    }
+
+    # Token settings are only hashed when used, so hashes of line-batched videos stay the same
+    if max_tokens:
+        hashed["max_tokens"] = max_tokens
+        hashed["token_overlap"] = token_overlap
+
+    content = json.dumps(hashed, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_loaded_videos(db_path: str) -> Dict[str, str]:
+    """Returns the videos loaded in the database with the transcript hash of their segments.
+
+    Args:
+        db_path (str): The path to the database file.
+
+    Returns:
+        dict: The transcript hash keyed by video ID. Segments loaded before hashes were recorded have a hash of None.
+    """
+
+    client = chromadb.PersistentClient(path=db_path)
+    collection = client.get_collection(TABLE_NAME, embedding_function=get_embedding_function())
+
+    loaded_videos = {}
+    for metadata in collection.get(include=["metadatas"])["metadatas"]:
+        loaded_videos[metadata["video_id"]] = metadata.get("transcript_hash")
+
+    return loaded_videos
+
+
+def diff_videos(
+    video_hashes: Dict[str, str], loaded_videos: Dict[str, str], failed_video_ids: List[str] = None
+) -> dict:
+    """Compares the videos to load against the videos already in the database.
+
+    Args:
+        video_hashes (dict): The transcript hash of each video to load, keyed by video ID.
+        loaded_videos (dict): The transcript hash of each video in the database, keyed by video ID.
+        failed_video_ids (list): The videos to load whose transcript could not be fetched. They are skipped rather
+            than counted as removed, so their segments stay in the database. Default is None.
+
+    Returns:
+        dict: The video IDs that are new, changed, removed, unchanged and skipped.
+                {'added': [...], 'updated': [...], 'removed': [...], 'unchanged': [...], 'skipped': [...]}
+    """
+
+    diff = {"added": [], "updated": [], "removed": [], "unchanged": [], "skipped": list(failed_video_ids or [])}
+
+    for video_id, video_hash in video_hashes.items():
+        if video_id not in loaded_videos:
+            diff["added"].append(video_id)
+        elif loaded_videos[video_id] != video_hash:
+            diff["updated"].append(video_id)
+        else:
+            diff["unchanged"].append(video_id)
+
+    # Only videos no longer in the video information are removed
+    diff["removed"] = [
+        video_id
+        for video_id in loaded_videos
+        if video_id not in video_hashes and video_id not in diff["skipped"]
+    ]
+
+    return diff
+
+
+def delete_videos(db_path: str, video_ids: List[str]) -> None:
+    """Deletes all segments of the videos from the database.
+
+    Args:
+        db_path (str): The path to the database file.
+        video_ids (list): The YouTube video IDs.
+    """
+
+    client = chromadb.PersistentClient(path=db_path)
+    collection = client.get_collection(TABLE_NAME, embedding_function=get_embedding_function())
+
+    line_store = LineStore(get_line_store_path(db_path))
+    for video_id in video_ids:
+        collection.delete(where={"video_id": video_id})
+        line_store.delete_video(video_id)
+        print(f"Segments for video {video_id} deleted from database.")
+
+
+def log_video_diff(json_path: str, db_path: str, diff: dict) -> None:
+    """Logs the changes made by an incremental data load to a JSON file.
+
+    Args:
+        json_path (str): The path to the JSON file containing the video information.
+        db_path (str): The path to the database file.
+        diff (dict): The video IDs that are new, changed, removed, unchanged and skipped, see diff_videos.
+    """
+
+    log_json = json.dumps(
+        {
+            "videos_info_path": json_path,
+            "db_path": db_path,
+            "added": diff["added"],
+            "updated": diff["updated"],
+            "removed": diff["removed"],
+            "unchanged": len(diff["unchanged"]),
+            "skipped": diff["skipped"],
+            "load_time": str(datetime.now()),
+        }
+    )
+
+    with open(get_log_path(db_path, "diff_log"), "w") as f:
         f.write(log_json)
 
 
+def build_bm25_index(db_path: str) -> BM25Index:
+    """Builds the BM25 keyword index over the documents in the database and saves it next to the database.
+
+    Args:
+        db_path (str): The path to the database file.
+
+    Returns:
+        BM25Index: The index.
+    """
+
+    client = chromadb.PersistentClient(path=db_path)
+    collection = client.get_collection(TABLE_NAME)
+    stored = collection.get(include=["documents", "metadatas"])
+
+    # Rebuild the text of segments stored as line ranges
+    documents, _ = LineStore(get_line_store_path(db_path)).expand(
+        stored["ids"], stored["documents"], stored["metadatas"]
+    )
+
+    index = BM25Index.build(stored["ids"], documents)
+    index.save(get_bm25_index_path(db_path))
+    return index
+
+
+@timeit
+def reembed_db(db_path: str, embedding_workers: int = ETL_EMBEDDING_WORKERS) -> None:
+    f"""Re-embeds the segments stored in a database with the project's embedding model ({EMBEDDING_MODEL}). The IDs,
+    text, metadata, distance metric and HNSW parameters are kept, so no transcripts are fetched again. The new
+    database is built next to the old one and swapped in, and an exported vector store is re-exported.
+
+    This migrates databases embedded by another model, e.g. ones built before queries were embedded with the
+    project's model, which hold Chroma's default 384-dimensional vectors and are refused by retrieval.
+
+    Args:
+        db_path (str): The path to the database file.
+        embedding_workers (int): The number of processes that embed segments. Default is {ETL_EMBEDDING_WORKERS} (embed in this process).
+    """
+
+    metadata, segments = read_collection(db_path)
+
+    # Rebuild the text of segments stored as line ranges, which is what the ETL embeds
+    documents, _ = LineStore(get_line_store_path(db_path)).expand(
+        segments["ids"], segments["documents"], segments["metadatas"]
+    )
+
+    if embedding_workers > 1:
+        embedding_function = EmbeddingPool(embedding_workers)
+    else:
+        embedding_function = get_embedding_function()
+
+    try:
+        embeddings = []
+        for start in range(0, len(documents), EXPORT_PAGE_SIZE):
+            embeddings.extend(embedding_function(documents[start : start + EXPORT_PAGE_SIZE]))
+            print(f"{min(start + EXPORT_PAGE_SIZE, len(documents))} of {len(documents)} segments embedded.")
+    finally:
+        if embedding_workers > 1:
+            embedding_function.close()
+
+    segments["embeddings"] = embeddings
+    replace_collection(
+        db_path, {**metadata, "embedding_model": EMBEDDING_MODEL}, segments, get_hnsw_params(metadata)
+    )
+    print(f"Database at {db_path} re-embedded with {EMBEDDING_MODEL}.")
+
+    # Keep an exported vector store in step with the database
+    if os.path.exists(get_vector_store_path(db_path)):
+        info = export_vector_store(db_path)
+        print(f"Vector store at {get_vector_store_path(db_path)} re-exported ({info['count']} vectors).")
+
+
 @timeit
 def run_etl(
     json_path: str = MAIN_VIDEOS_JSON_PATH,
     db: str = None,
     batch_size: int = None,
     overlap: int = None,
+    fetcher=YouTubeTranscriptApi,
+    incremental: bool = False,
+    max_tokens: int = None,
+    token_overlap: int = None,
+    embedding_workers: int = ETL_EMBEDDING_WORKERS,
+    compact: bool = COMPACT_STORAGE,
+    hnsw_params: dict = None,
 ) -> None:
     f"""Runs the ETL process to fetch video transcripts, format the data, and load it into the database.
 
+    The load is a streaming pipeline (fetch -> format -> embed -> upsert) whose stages run concurrently and are
+    connected by bounded queues, so only a few videos are held in memory at a time. Transcripts are cached on disk,
+    so reruns never fetch them again. Progress is checkpointed per video in a manifest, so an interrupted load
+    resumes where it stopped when rerun with the same database.
+
+    In incremental mode an existing database is updated in place: the videos in the JSON file are compared to the
+    loaded ones by video ID and transcript hash, only new or changed videos are embedded and loaded, and segments of
+    removed videos are deleted. Videos whose transcript could not be fetched are skipped and keep their segments.
+    The changes are logged to data/logs/.
+
+    With several embedding workers, each video's segments are split across a pool of processes that each load the
+    model once and return their vectors through shared memory. Videos are still upserted in order by this process.
+
+    In compact mode, the caption lines of each video are stored once in a line store next to the database, and each
+    segment is stored as its line range only. Retrieval rebuilds the text, title and source of the segments it
+    returns. An existing database keeps the layout it was created with.
+
+    A new database is built with the given HNSW index parameters, recorded in its collection metadata. An existing
+    database keeps the parameters it was built with, e.g. the ones chosen by tune_hnsw.py.
+
     Args:
         json_path (str): The path to the JSON file containing the video information. Default is {MAIN_VIDEOS_JSON_PATH}.
         db (str): The path to the database file. Default is None.
         batch_size (int): The number of segments to include in each batch. Default is None.
         overlap (int): The number of overlapping segments between each batch. Default is None.
+        fetcher: Any object with a YouTubeTranscriptApi-style get_transcript method. Default is YouTubeTranscriptApi.
+        incremental (bool): Whether to update an existing database in place. Default is False.
+        max_tokens (int): The maximum number of tokens in each segment. If given, caption lines are packed by token budget instead of batched, and batch_size must not be given. Default is None.
+        token_overlap (int): The maximum number of overlapping tokens between each segment. Default is None.
+        embedding_workers (int): The number of processes that embed segments. Default is {ETL_EMBEDDING_WORKERS} (embed in this process).
+        compact (bool): Whether a new database stores segments as line ranges into a line store. Default is {COMPACT_STORAGE}.
+        hnsw_params (dict): The HNSW index parameters of a new database. Default is None ({HNSW_PARAMS}).
     """
 
+    # Token packing takes precedence in segment_transcript, so a line batch size given with it would be ignored
+    if batch_size and max_tokens:
+        raise ValueError("Give either a batch size (batch by lines) or max tokens (pack by tokens), not both.")
+
+    chunking = {
+        "batch_size": batch_size,
+        "overlap": overlap,
+        "max_tokens": max_tokens,
+        "token_overlap": token_overlap,
+    }
+
     # Load the video information from the JSON file
     with open(json_path) as f:
         video_info = json.load(f)
 
-    # Initialize the list to store the formatted segments
-    videos = []
-
-    # Loop through the video information and fetch the transcript for each video
-    for video in video_info:
-        video_id = video["id"]
-        video_title = video["title"]
-        transcript = get_video_transcript(video_id)
-        print(f"Transcript for video {video_id} fetched.")
-
-        # If the transcript is fetched, format the data and add it to the list
-        if transcript:
-            formatted_transcript = format_transcript(
-                transcript,
-                video_id,
-                video_title,
-                batch_size=batch_size,
-                overlap=overlap,
+    # If no database is specified, print the formatted data for troubleshooting
+    if not db:
+        transcripts = fetch_transcripts(
+            [video["id"] for video in video_info], fetcher=fetcher
+        )
+        videos = []
+        for video in video_info:
+            transcript = transcripts[video["id"]]
+            if transcript:
+                videos.extend(segment_transcript(transcript, video, **chunking))
+
+        print("No database specified. Skipping database load.")
+        print(videos)
+        return
+
+    if incremental and os.path.exists(db):
+        # Compare the videos to load against the database. Transcripts come from the local cache where possible.
+        transcripts = fetch_transcripts(
+            [video["id"] for video in video_info], fetcher=fetcher
+        )
+        video_hashes = {
+            video["id"]: hash_video(video, transcripts[video["id"]], **chunking)
+            for video in video_info
+            if transcripts[video["id"]]
+        }
+
+        # Videos whose transcript could not be fetched are left as they are in the database
+        failed_video_ids = [video_id for video_id, transcript in transcripts.items() if not transcript]
+        loaded_videos = get_loaded_videos(db)
+        diff = diff_videos(video_hashes, loaded_videos, failed_video_ids)
+        print(
+            f"Incremental load: {len(diff['added'])} added, {len(diff['updated'])} updated, "
+            f"{len(diff['removed'])} removed, {len(diff['unchanged'])} unchanged, {len(diff['skipped'])} skipped."
+        )
+
+        # Changed videos are deleted first since their number of segments may change
+        delete_videos(db, diff["removed"] + diff["updated"])
+        log_video_diff(json_path, db, diff)
+
+        manifest = {
+            "videos_info_path": json_path,
+            **chunking,
+            "loaded_video_ids": diff["unchanged"]
+            + [video_id for video_id in diff["skipped"] if video_id in loaded_videos],
+        }
+        save_manifest(db, manifest)
+        changed_video_ids = set(diff["added"] + diff["updated"])
+        pending_videos = [video for video in video_info if video["id"] in changed_video_ids]
+
+    else:
+        # Resume from the manifest if an earlier load into this database was interrupted, otherwise start a new database
+        manifest = load_manifest(db)
+        if manifest is None:
+            initialize_db(db, compact=compact, hnsw_params=hnsw_params)
+            manifest = {
+                "videos_info_path": json_path,
+                **chunking,
+                "loaded_video_ids": [],
+            }
+            save_manifest(db, manifest)
+        elif any(manifest.get(key) != value for key, value in chunking.items()):
+            loaded_chunking = {key: manifest.get(key) for key in chunking}
+            raise ValueError(
+                f"Database at {db} was loaded with {loaded_chunking}. "
+                "Use a new database path or incremental mode to load with different settings."
             )
+        else:
+            print(f"Resuming load: {len(manifest['loaded_video_ids'])} videos already loaded.")
+
+        # Skip videos that are already loaded
+        pending_videos = [
+            video for video in video_info if video["id"] not in manifest["loaded_video_ids"]
+        ]
+
+    # Follow the layout of the database rather than the argument, so a database never mixes layouts
+    compact = is_compact(db)
+    line_store = LineStore(get_line_store_path(db))
+
+    def fetch_video(video: dict) -> tuple:
+        transcript = fetch_cached_transcript(video["id"], fetcher=fetcher)
+        print(f"Transcript for video {video['id']} fetched.")
+
+        # Leave failed fetches for the next run
+        return (video, transcript) if transcript else None
 
-            videos.extend(formatted_transcript)
+    def format_video(item: tuple) -> tuple:
+        video, transcript = item
+        segments = segment_transcript(transcript, video, **chunking)
 
-    # If a database is specified, initialize the database, load the data, and log the data load
-    if db:
-        initialize_db(db)
-        load_data_to_db(db, videos)
-        log_data_load(json_path, db, batch_size, overlap)
+        # Record the transcript hash so incremental loads can detect changed videos
+        transcript_hash = hash_video(video, transcript, **chunking)
+        for segment in segments:
+            segment["metadata"]["transcript_hash"] = transcript_hash
+
+        return video, transcript, segments
+
+    # Embed on a pool of worker processes if asked to, each with its share of the CPU cores
+    if embedding_workers > 1:
+        embedding_function = EmbeddingPool(embedding_workers)
     else:
-        print("No database specified. Skipping database load.")
-        print(videos)  # Print the formatted data for troubleshooting
+        embedding_function = get_embedding_function()
+
+    def embed_video(item: tuple) -> tuple:
+        video, transcript, segments = item
+        embeddings = embedding_function.encode([segment["text"] for segment in segments])
+        return video, transcript, segments, embeddings
+
+    def upsert_video(item: tuple) -> None:
+        video, transcript, segments, embeddings = item
+
+        # Write the caption lines before the segments that point into them
+        if compact:
+            line_store.save_video(video, transcript, hash_video(video, transcript, **chunking))
+        load_data_to_db(db, segments, embeddings, embedding_function=embedding_function, compact=compact)
+        increment("segments_loaded", len(segments))
+
+        # Checkpoint the video as loaded
+        manifest["loaded_video_ids"].append(video["id"])
+        save_manifest(db, manifest)
+        print(f"Video {video['id']} loaded ({len(manifest['loaded_video_ids'])} of {len(video_info)}).")
+
+    try:
+        run_pipeline(
+            pending_videos,
+            [
+                Stage("fetch", fetch_video, workers=TRANSCRIPT_FETCH_WORKERS),
+                Stage("format", format_video),
+                Stage("embed", embed_video),
+                Stage("upsert", upsert_video),
+            ],
+        )
+    finally:
+        if embedding_workers > 1:
+            embedding_function.close()
+
+    log_data_load(json_path, db, **chunking)
+    print(f"Embedding cache: {embedding_function.cache.stats()}")
+
+    # Rebuild the keyword index over every segment in the database
+    index = build_bm25_index(db)
+    print(f"Keyword index at {get_bm25_index_path(db)} built ({len(index)} segments, {len(index.terms)} terms).")
+
+    # Keep an exported vector store in step with the database
+    if os.path.exists(get_vector_store_path(db)):
+        info = export_vector_store(db)
+        print(f"Vector store at {get_vector_store_path(db)} re-exported ({info['count']} vectors).")
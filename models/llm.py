@@ -1,17 +1,78 @@
-import openai
 import os
-from dotenv import load_dotenv
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
 
-from constants import DEFAULT_LLM_MODEL, DEFAULT_LLM_TEMP
+from utils.instrumentation import increment, span
+from constants import (
+    DEFAULT_LLM_MODEL,
+    DEFAULT_LLM_TEMP,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BACKOFF,
+)
 
-# Load environment variables from .env file
-load_dotenv()
+if TYPE_CHECKING:
+    import openai
 
-# Get the API key from the environment variable
-api_key = os.getenv("OPENAI_API_KEY")
+# The OpenAI clients are created on first use, so importing this module does not read .env or open connections.
+# Tests and benchmarks may assign their own clients to these names.
+client = None
+async_client = None
+_client_lock = threading.Lock()
+
+
+def get_api_key() -> str:
+    """Loads the environment variables from the .env file and returns the OpenAI API key."""
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return os.getenv("OPENAI_API_KEY")
+
+
+def get_client() -> "openai.OpenAI":
+    """Returns the shared OpenAI client, creating it on first use."""
+
+    global client
+    with _client_lock:
+        if client is None:
+            import openai
+
+            client = openai.OpenAI(api_key=get_api_key())
+        return client
+
+
+def get_async_client() -> "openai.AsyncOpenAI":
+    """Returns the shared async OpenAI client, creating it on first use. Its HTTP connections to the LLM endpoint
+    are pooled and kept alive between requests."""
+
+    global async_client
+    with _client_lock:
+        if async_client is None:
+            import httpx
+            import openai
+
+            async_client = openai.AsyncOpenAI(
+                api_key=get_api_key(),
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                    ),
+                    timeout=httpx.Timeout(60.0, connect=5.0),
+                ),
+            )
+        return async_client
+
+
+def warmup() -> None:
+    """Creates the OpenAI clients ahead of the first question."""
+
+    get_client()
+    get_async_client()
 
-# Create the OpenAI client
-client = openai.OpenAI(api_key=api_key)
 
 # Create base to provide context to LLM
 context_result_base = "CONTEXT: {text}\nTITLE: {title}\nSOURCE: {source}\n\n"
@@ -55,6 +116,43 @@ def format_context(db_query_results: dict) -> str:
     return formatted_context
 
 
+def build_messages(question: str, context: dict) -> list:
+    """Builds the chat messages for the LLM: the instruction, the relevant context and the user's question.
+
+    Args:
+        question (str): The user's question.
+        context (dict): The relevant context from the database query.
+
+    Returns:
+        list: The chat messages.
+    """
+
+    # Format the context so it can be read by the LLM
+    with span("format_context"):
+        formatted_context = format_context(context)
+
+    # Provide instruction to the LLM
+    instruction = LLM_INSTRUCTION
+
+    # Add RELEVANT CONTEXT heading for LLM
+    formatted_context = "RELEVANT CONTEXT:\n```" + formatted_context + "```"
+
+    return [
+        {"role": "system", "content": instruction},
+        {"role": "user", "content": formatted_context},
+        {"role": "user", "content": question},
+    ]
+
+
+def record_usage(response) -> None:
+    """Adds the prompt and completion tokens of an LLM response to the token counters, if the response reports them."""
+
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        increment("prompt_tokens", usage.prompt_tokens)
+        increment("completion_tokens", usage.completion_tokens)
+
+
 def answer_with_context(
     question: str,
     context: dict,
@@ -73,24 +171,167 @@ def answer_with_context(
         str: The LLM response to the user's question.
     """
 
-    # Format the context so it can be read by the LLM
-    formatted_context = format_context(context)
+    # Get LLM response by providing instruction, context, and question
+    messages = build_messages(question, context)
+    with span("llm", model=model):
+        response = get_client().chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=messages,
+        )
+    record_usage(response)
 
-    # Provide instruction to the LLM
-    instruction = LLM_INSTRUCTION
+    return response.choices[0].message.content
 
-    # Add RELEVANT CONTEXT heading for LLM
-    formatted_context = "RELEVANT CONTEXT:\n```" + formatted_context + "```"
 
-    # Get LLM response by providing instruction, context, and question
-    response = client.chat.completions.create(
+def get_retry_delay(error: Exception, attempt: int, backoff: float = LLM_RETRY_BACKOFF) -> float | None:
+    f"""Returns the number of seconds to wait before retrying a failed LLM call, or None if a retry would fail too.
+
+    Rate limits (429), server errors (5xx) and lost connections are retried. The wait is the Retry-After the server
+    sent, if any, and otherwise grows exponentially with jitter so parallel callers do not retry in lockstep.
+
+    Args:
+        error (Exception): The error raised by the call.
+        attempt (int): The number of retries so far.
+        backoff (float): The wait before the first retry in seconds. Default is {LLM_RETRY_BACKOFF}.
+
+    Returns:
+        float | None: The wait in seconds, or None if the error should not be retried.
+    """
+
+    import openai
+
+    status_code = getattr(error, "status_code", None)
+    if status_code is None and not isinstance(error, openai.APIConnectionError):
+        return None
+    if status_code is not None and status_code != 429 and status_code < 500:
+        return None
+
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return backoff * 2**attempt * random.uniform(0.5, 1.5)
+
+
+def answer_with_retry(
+    question: str,
+    context: dict,
+    model: str = DEFAULT_LLM_MODEL,
+    temperature: float = DEFAULT_LLM_TEMP,
+    max_retries: int = LLM_MAX_RETRIES,
+    backoff: float = LLM_RETRY_BACKOFF,
+) -> tuple:
+    f"""Answers the user's question like answer_with_context, retrying rate limits and transient errors.
+
+    Args:
+        question (str): The user's question.
+        context (dict): The relevant context from the database query.
+        model (str): The LLM model to use. Default is {DEFAULT_LLM_MODEL}.
+        temperature (float): The sampling temperature to use. Default is {DEFAULT_LLM_TEMP}.
+        max_retries (int): The number of retries after the first attempt. Default is {LLM_MAX_RETRIES}.
+        backoff (float): The wait before the first retry in seconds. Default is {LLM_RETRY_BACKOFF}.
+
+    Returns:
+        tuple: The LLM response to the user's question (str) and the number of retries it took (int).
+    """
+
+    for attempt in range(max_retries + 1):
+        try:
+            return answer_with_context(question, context, model=model, temperature=temperature), attempt
+        except Exception as error:
+            delay = get_retry_delay(error, attempt, backoff)
+            if delay is None or attempt == max_retries:
+                raise
+            increment("llm_retries")
+            time.sleep(delay)
+
+
+def stream_answer_with_context(
+    question: str,
+    context: dict,
+    model: str = DEFAULT_LLM_MODEL,
+    temperature: float = DEFAULT_LLM_TEMP,
+) -> Iterator[str]:
+    f"""Answers the user's question using the LLM model and relevant context, yielding the response as it is generated.
+
+    Args:
+        question (str): The user's question.
+        context (dict): The relevant context from the database query.
+        model (str): The LLM model to use. Default is {DEFAULT_LLM_MODEL}.
+        temperature (float): The sampling temperature to use. Default is {DEFAULT_LLM_TEMP}.
+
+    Yields:
+        str: The next piece of the LLM response.
+    """
+
+    stream = get_client().chat.completions.create(
         model=model,
         temperature=temperature,
-        messages=[
-            {"role": "system", "content": instruction},
-            {"role": "user", "content": formatted_context},
-            {"role": "user", "content": question},
-        ],
+        messages=build_messages(question, context),
+        stream=True,
     )
 
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def async_answer_with_context(
+    question: str,
+    context: dict,
+    model: str = DEFAULT_LLM_MODEL,
+    temperature: float = DEFAULT_LLM_TEMP,
+) -> str:
+    f"""Answers the user's question using the LLM model and relevant context, without blocking the event loop.
+
+    Args:
+        question (str): The user's question.
+        context (dict): The relevant context from the database query.
+        model (str): The LLM model to use. Default is {DEFAULT_LLM_MODEL}.
+        temperature (float): The sampling temperature to use. Default is {DEFAULT_LLM_TEMP}.
+
+    Returns:
+        str: The LLM response to the user's question.
+    """
+
+    messages = build_messages(question, context)
+    with span("llm", model=model):
+        response = await get_async_client().chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=messages,
+        )
+    record_usage(response)
+
     return response.choices[0].message.content
+
+
+async def async_stream_answer_with_context(
+    question: str,
+    context: dict,
+    model: str = DEFAULT_LLM_MODEL,
+    temperature: float = DEFAULT_LLM_TEMP,
+) -> AsyncIterator[str]:
+    f"""Answers the user's question using the LLM model and relevant context, yielding the response as it is generated without blocking the event loop.
+
+    Args:
+        question (str): The user's question.
+        context (dict): The relevant context from the database query.
+        model (str): The LLM model to use. Default is {DEFAULT_LLM_MODEL}.
+        temperature (float): The sampling temperature to use. Default is {DEFAULT_LLM_TEMP}.
+
+    Yields:
+        str: The next piece of the LLM response.
+    """
+
+    stream = await get_async_client().chat.completions.create(
+        model=model,
+        temperature=temperature,
+        messages=build_messages(question, context),
+        stream=True,
+    )
+
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
@@ -1,6 +1,422 @@
+import os
+import threading
+from typing import List
+
 import chromadb
+import numpy as np
+
+from utils.batching_utils import MicroBatcher
+from utils.bm25_index import BM25Index, get_bm25_index_path, reciprocal_rank_fusion
+from utils.embedding_utils import MyEmbeddingFunction, get_embedding_function
+from utils.general_utils import close_chroma_system
+from utils.instrumentation import span
+from utils.line_store import LineStore, get_line_store_path
+from utils.vector_store import VectorStore, get_vector_store_path
+from constants import (
+    TABLE_NAME,
+    DEFAULT_QUERY_RESULTS,
+    EMBEDDING_MODEL,
+    QUERY_BATCH_MAX_WAIT,
+    QUERY_BATCH_MAX_SIZE,
+    VECTOR_STORE,
+    RETRIEVAL_MODE,
+    HYBRID_VECTOR_WEIGHT,
+    HYBRID_BM25_WEIGHT,
+    HYBRID_RRF_K,
+    HYBRID_CANDIDATES,
+)
+
+
+class Retriever:
+    """A long-lived handle to one database. The client and collection are opened once and reused across queries.
+
+    If the database is rebuilt (e.g. by the ETL) the collection is reopened on the next query. Queries are
+    embedded with the project's embedding function, which must be the model that produced the stored vectors.
+
+    Single queries from concurrent callers are micro-batched: questions arriving within a short window are embedded
+    in one forward pass and searched with one multi-query lookup.
+
+    Lookups go to the Chroma collection, or to the memory-mapped vector store exported next to the database if the
+    store is "mmap". The vector store is also reopened when it is re-exported.
+
+    In "hybrid" mode, the embedding search is fused with a BM25 keyword search over the index built by the ETL, so
+    segments that contain the exact terms of the query rank higher.
+
+    Segments of a compact database are stored as line ranges, and their text, title and source are rebuilt from the
+    line store next to the database before they are returned.
+
+    Functions:
+        query: Gets the relevant segments from the database for the user's query.
+        search: Gets the relevant segments for a query and its embedding, in the retriever's mode.
+        hybrid_search: Gets the relevant segments by fusing the embedding and keyword searches.
+        embed_query: Embeds the user's query.
+        embed_queries: Embeds several queries in one forward pass.
+        query_by_embedding: Gets the relevant segments from the database for an embedded query.
+        query_by_embeddings: Gets the relevant segments from the database for several embedded queries in one lookup.
+        reload: Reopens the database client and collection.
+        warmup: Opens the database and loads the embedding model ahead of the first query.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        embedding_function: MyEmbeddingFunction = None,
+        max_wait: float = QUERY_BATCH_MAX_WAIT,
+        max_batch_size: int = QUERY_BATCH_MAX_SIZE,
+        store: str = VECTOR_STORE,
+        mode: str = RETRIEVAL_MODE,
+        vector_weight: float = HYBRID_VECTOR_WEIGHT,
+        bm25_weight: float = HYBRID_BM25_WEIGHT,
+    ) -> None:
+        f"""Initializes the retriever. The database is opened on the first query.
+
+        Args:
+            db_path (str): The path to the database file.
+            embedding_function (MyEmbeddingFunction): The function used to embed queries. Default is None (the shared embedding function).
+            max_wait (float): The number of seconds to wait for concurrent queries to batch with. Default is {QUERY_BATCH_MAX_WAIT}.
+            max_batch_size (int): The maximum number of queries in a batch, or 1 to disable batching. Default is {QUERY_BATCH_MAX_SIZE}.
+            store (str): Where to search, "chroma" or "mmap". Default is {VECTOR_STORE}.
+            mode (str): The retrieval mode, "vector" or "hybrid". Default is {RETRIEVAL_MODE}.
+            vector_weight (float): The weight of the embedding search in hybrid mode. Default is {HYBRID_VECTOR_WEIGHT}.
+            bm25_weight (float): The weight of the keyword search in hybrid mode. Default is {HYBRID_BM25_WEIGHT}.
+        """
+
+        if store not in ("chroma", "mmap"):
+            raise ValueError(f"Unknown vector store {store}. Choose chroma or mmap.")
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode {mode}. Choose vector or hybrid.")
+
+        self.db_path = db_path
+        self.store = store
+        self.mode = mode
+        self.vector_weight = vector_weight
+        self.bm25_weight = bm25_weight
+        self.embedding_function = embedding_function or get_embedding_function()
+        self.line_store = LineStore(get_line_store_path(db_path))
+        self._lock = threading.Lock()
+        self._client = None
+        self._collection = None
+        self._db_version = None
+        self._vector_store = None
+        self._vector_store_version = None
+        self._bm25_index = None
+        self._bm25_index_version = None
+        self.embed_batcher = MicroBatcher(self.embed_queries, max_wait, max_batch_size)
+        self.search_batcher = MicroBatcher(self._search_batch, max_wait, max_batch_size)
+
+    def _current_db_version(self) -> tuple:
+        """Returns the inode and modification time of the database's SQLite file, which change when the database is rebuilt."""
+
+        try:
+            stat = os.stat(os.path.join(self.db_path, "chroma.sqlite3"))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _current_vector_store_version(self) -> tuple:
+        """Returns the inode and modification time of the vector store's info file, which change when it is re-exported."""
+
+        try:
+            stat = os.stat(os.path.join(get_vector_store_path(self.db_path), "store.json"))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _current_bm25_index_version(self) -> tuple:
+        """Returns the inode and modification time of the keyword index file, which change when it is rebuilt."""
+
+        try:
+            stat = os.stat(get_bm25_index_path(self.db_path))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _load(self) -> None:
+        """Opens the database client and collection. Must be called with the lock held."""
+
+        # Stop the system of the old client so a rebuilt database is read from disk. Other paths keep theirs.
+        if self._client is not None:
+            close_chroma_system(self.db_path)
+
+        self._db_version = self._current_db_version()
+        self._client = chromadb.PersistentClient(self.db_path)
+        self._collection = self._client.get_collection(
+            TABLE_NAME, embedding_function=self.embedding_function
+        )
+        self._check_embedding_model()
+
+    def _check_embedding_model(self) -> None:
+        """Raises a ValueError if the stored vectors were not produced by the query embedding model."""
+
+        metadata = self._collection.metadata or {}
+        stored_model = metadata.get("embedding_model")
+        if stored_model is not None and stored_model != EMBEDDING_MODEL:
+            raise ValueError(
+                f"Database at {self.db_path} was embedded with {stored_model}, "
+                f"but queries are embedded with {EMBEDDING_MODEL}. Re-embed it with: python reembed_db.py"
+            )
+
+        # Databases built before the model was recorded can only be checked by dimension
+        if stored_model is None:
+            stored = self._collection.get(limit=1, include=["embeddings"])["embeddings"]
+            if stored and len(stored[0]) != self.embedding_function.dimension:
+                raise ValueError(
+                    f"Database at {self.db_path} holds {len(stored[0])}-dimensional vectors, "
+                    f"but {EMBEDDING_MODEL} produces {self.embedding_function.dimension}. Re-embed it with: python reembed_db.py"
+                )
+
+    def reload(self) -> None:
+        """Reopens the database client and collection."""
+
+        with self._lock:
+            self._load()
+
+    @property
+    def collection(self) -> chromadb.Collection:
+        """The database collection (table), opened on first use and reopened if the database has changed."""
+
+        with self._lock:
+            if self._collection is None or self._current_db_version() != self._db_version:
+                self._load()
+            return self._collection
+
+    @property
+    def vector_store(self) -> VectorStore:
+        """The memory-mapped vector store, opened on first use and reopened if it has been re-exported."""
+
+        with self._lock:
+            # Keep reading the open store if it is missing for a moment while a re-export moves it
+            version = self._current_vector_store_version()
+            if self._vector_store is None or version not in (None, self._vector_store_version):
+                path = get_vector_store_path(self.db_path)
+                if not os.path.exists(path):
+                    raise FileNotFoundError(
+                        f"No vector store at {path}. Export it with: python export_vector_store.py"
+                    )
+                self._vector_store_version = version
+                self._vector_store = VectorStore(path)
+
+                # The store records the model of the database it was exported from
+                info = self._vector_store.info
+                if info["embedding_model"] not in (None, EMBEDDING_MODEL) or (
+                    info["dimension"] != self.embedding_function.dimension
+                ):
+                    raise ValueError(
+                        f"Vector store at {path} holds {info['dimension']}-dimensional vectors embedded with "
+                        f"{info['embedding_model']}, but queries are embedded with {EMBEDDING_MODEL}. "
+                        "Rebuild the database with run_etl and export it again."
+                    )
+            return self._vector_store
+
+    @property
+    def bm25_index(self) -> BM25Index:
+        """The keyword index of the database, loaded on first use and reloaded if it has been rebuilt."""
+
+        with self._lock:
+            version = self._current_bm25_index_version()
+            if self._bm25_index is None or version != self._bm25_index_version:
+                path = get_bm25_index_path(self.db_path)
+                if version is None:
+                    raise FileNotFoundError(
+                        f"No keyword index at {path}. Load the database with run_etl to build it."
+                    )
+                self._bm25_index_version = version
+                self._bm25_index = BM25Index.load(path)
+            return self._bm25_index
+
+    def query(self, query: str, n_results: int = DEFAULT_QUERY_RESULTS) -> dict:
+        f"""Gets the relevant segments from the database for the user's query.
+
+        Args:
+            query (str): The user's query.
+            n_results (int): The number of results to return. Default is {DEFAULT_QUERY_RESULTS}.
+
+        Returns:
+            dict: The relevant segments from the database.
+        """
+
+        return self.search(query, self.embed_query(query), n_results=n_results)
+
+    def search(
+        self, query: str, query_embedding: np.ndarray, n_results: int = DEFAULT_QUERY_RESULTS
+    ) -> dict:
+        f"""Gets the relevant segments from the database for a query and its embedding, in the retriever's mode.
 
-from constants import TABLE_NAME, DEFAULT_QUERY_RESULTS
+        Args:
+            query (str): The user's query.
+            query_embedding (np.ndarray): The embedding of the user's query.
+            n_results (int): The number of results to return. Default is {DEFAULT_QUERY_RESULTS}.
+
+        Returns:
+            dict: The relevant segments from the database.
+        """
+
+        with span("search", mode=self.mode, store=self.store):
+            if self.mode == "hybrid":
+                return self.hybrid_search(query, query_embedding, n_results=n_results)
+            return self.query_by_embedding(query_embedding, n_results=n_results)
+
+    def hybrid_search(
+        self, query: str, query_embedding: np.ndarray, n_results: int = DEFAULT_QUERY_RESULTS
+    ) -> dict:
+        f"""Gets the relevant segments by fusing the ranks of the embedding search and the BM25 keyword search.
+
+        Args:
+            query (str): The user's query.
+            query_embedding (np.ndarray): The embedding of the user's query.
+            n_results (int): The number of results to return. Default is {DEFAULT_QUERY_RESULTS}.
+
+        Returns:
+            dict: The relevant segments from the database. Distances are the embedding distances, or None for
+            segments found only by the keyword search.
+        """
+
+        # Over-fetch from both searches so the fusion can promote candidates below the top results
+        num_candidates = max(n_results, HYBRID_CANDIDATES)
+        vector_results = self.query_by_embedding(query_embedding, n_results=num_candidates)
+        keyword_ids, _ = self.bm25_index.search(query, num_candidates)
+        ids = reciprocal_rank_fusion(
+            [vector_results["ids"][0], keyword_ids],
+            [self.vector_weight, self.bm25_weight],
+            HYBRID_RRF_K,
+        )[:n_results]
+
+        # Take the segments from the embedding results, and look up the ones only the keyword search found
+        segments = {
+            id: (document, metadata, distance)
+            for id, document, metadata, distance in zip(
+                vector_results["ids"][0],
+                vector_results["documents"][0],
+                vector_results["metadatas"][0],
+                vector_results["distances"][0],
+            )
+        }
+        missing = [id for id in ids if id not in segments]
+        if missing:
+            if self.store == "mmap":
+                found = self.vector_store.get(missing)
+            else:
+                found = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            documents, metadatas = self.line_store.expand(found["ids"], found["documents"], found["metadatas"])
+            for id, document, metadata in zip(found["ids"], documents, metadatas):
+                segments[id] = (document, metadata, None)
+
+        ids = [id for id in ids if id in segments]
+        return {
+            "ids": [ids],
+            "distances": [[segments[id][2] for id in ids]],
+            "metadatas": [[segments[id][1] for id in ids]],
+            "documents": [[segments[id][0] for id in ids]],
+            "embeddings": None,
+            "uris": None,
+            "data": None,
+        }
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embeds the user's query with the same model as the stored vectors, batched with concurrent queries."""
+
+        with span("embed"):
+            return self.embed_batcher.submit(query)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embeds several queries in one forward pass and returns one row per query."""
+
+        return self.embedding_function.encode(queries)
+
+    def query_by_embedding(
+        self, query_embedding: np.ndarray, n_results: int = DEFAULT_QUERY_RESULTS
+    ) -> dict:
+        f"""Gets the relevant segments from the database for an embedded query, batched with concurrent queries.
+
+        Args:
+            query_embedding (np.ndarray): The embedding of the user's query.
+            n_results (int): The number of results to return. Default is {DEFAULT_QUERY_RESULTS}.
+
+        Returns:
+            dict: The relevant segments from the database.
+        """
+
+        return self.search_batcher.submit((query_embedding, n_results))
+
+    def query_by_embeddings(
+        self, query_embeddings: np.ndarray, n_results: int = DEFAULT_QUERY_RESULTS
+    ) -> List[dict]:
+        f"""Gets the relevant segments from the database for several embedded queries in one lookup.
+
+        Args:
+            query_embeddings (np.ndarray): The embeddings of the queries, one row per query.
+            n_results (int): The number of results to return per query. Default is {DEFAULT_QUERY_RESULTS}.
+
+        Returns:
+            list: The relevant segments from the database for each query, in the format of a single-query result.
+        """
+
+        if self.store == "mmap":
+            results = self.vector_store.query(query_embeddings, n_results=n_results)
+        else:
+            multi_results = self.collection.query(
+                query_embeddings=np.asarray(query_embeddings).tolist(), n_results=n_results
+            )
+
+            # Split the multi-query result into one result per query
+            results = [
+                {
+                    key: None if value is None else [value[i]]
+                    for key, value in multi_results.items()
+                }
+                for i in range(len(query_embeddings))
+            ]
+
+        # Rebuild the segments of a compact database
+        return [self.line_store.expand_results(result) for result in results]
+
+    def _search_batch(self, items: list) -> List[dict]:
+        """Searches a batch of (query embedding, number of results) pairs with one lookup of the largest number of
+        results, then cuts each result down to its own number of results."""
+
+        n_results = max(n for _, n in items)
+        results = self.query_by_embeddings(
+            np.stack([query_embedding for query_embedding, _ in items]), n_results=n_results
+        )
+
+        for result, (_, n) in zip(results, items):
+            for key, value in result.items():
+                if value is not None and value[0] is not None:
+                    result[key] = [value[0][:n]]
+        return results
+
+    def warmup(self) -> None:
+        """Opens the database and loads the embedding model ahead of the first query."""
+
+        if self.store == "mmap":
+            self.vector_store
+        else:
+            self.collection
+        if self.mode == "hybrid":
+            self.bm25_index
+        self.embedding_function.embed(["warmup"])
+
+
+# Process-wide registry of retrievers, one per database path
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+
+def get_retriever(db_path: str) -> Retriever:
+    """Returns the shared retriever for the database, creating it on first use.
+
+    Args:
+        db_path (str): The path to the database file.
+
+    Returns:
+        Retriever: The retriever for the database.
+    """
+
+    key = os.path.abspath(db_path)
+    with _retrievers_lock:
+        if key not in _retrievers:
+            _retrievers[key] = Retriever(db_path)
+        return _retrievers[key]
 
 
 def get_relevant_segments(
@@ -17,11 +433,6 @@ def get_relevant_segments(
         dict: The relevant segments from the database.
     """
 
-    # Access the database client and collection (table)
-    client = chromadb.PersistentClient(db_path)
-    collection = client.get_collection(TABLE_NAME)
-
-    # Query the database for the relevant segments
-    results = collection.query(query_texts=[query], n_results=n_results)
-
-    return results
+    # Query the shared retriever so the client and collection are reused between queries
+    with span("get_relevant_segments"):
+        return get_retriever(db_path).query(query, n_results=n_results)
@@ -0,0 +1,234 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import numpy as np
+
+from models.retrieval import Retriever, get_retriever
+from utils.bm25_index import reciprocal_rank_fusion
+from utils.instrumentation import in_current_context, span
+from constants import DEFAULT_QUERY_RESULTS, HYBRID_RRF_K, RETRIEVAL_SHARDS, SHARD_QUERY_WORKERS
+
+
+def get_shard_name(shard: dict) -> str:
+    """Returns the name of a shard: its "name" key, or the file name of its database without the extension."""
+
+    return shard.get("name") or os.path.splitext(os.path.basename(os.path.normpath(shard["db_path"])))[0]
+
+
+def shard_matches(shard: dict, where: dict) -> bool:
+    """Returns whether the shard's metadata has every key and value of the filter. A list value matches any of its
+    items, e.g. {"playlist": ["fitness", "sleep"]}."""
+
+    for key, value in where.items():
+        allowed = value if isinstance(value, list) else [value]
+        if shard.get(key) not in allowed:
+            return False
+    return True
+
+
+def merge_results(shard_results: List[tuple], n_results: int, by_rank: bool = False) -> dict:
+    f"""Merges the results of several shards into a global top k, by distance or by rank.
+
+    Each shard returns its own top k, so the global top k is among them. By distance, segments without a distance
+    rank after all others in shard order. Hybrid shards rank by fused ranks rather than distance, so their results
+    are merged by rank instead: the shard rankings are fused by reciprocal rank (k = {HYBRID_RRF_K}). Segments that
+    appear in several shards with the same text are kept once, with the copy from the shard that ranks them best.
+
+    Args:
+        shard_results (list): The (shard name, single-query results) of each shard.
+        n_results (int): The number of results to return.
+        by_rank (bool): Whether to merge by rank rather than by distance. Default is False.
+
+    Returns:
+        dict: The merged results in the format of a single-query database result. Each metadata is a copy with the
+        name of its shard added under "shard".
+    """
+
+    # Keep the best copy of segments found in several shards
+    candidates = {}
+    rankings = []
+    for shard_name, results in shard_results:
+        distances = results.get("distances") or [[None] * len(results["ids"][0])]
+        ranking = []
+        for rank, id in enumerate(results["ids"][0]):
+            distance = distances[0][rank]
+            document = results["documents"][0][rank]
+            if by_rank:
+                sort_key = rank
+            else:
+                sort_key = (distance is None, distance if distance is not None else 0.0, rank)
+
+            key = (id, document)
+            ranking.append(key)
+            if key not in candidates or sort_key < candidates[key][0]:
+                metadata = {**results["metadatas"][0][rank], "shard": shard_name}
+                candidates[key] = (sort_key, id, distance, document, metadata)
+        rankings.append(ranking)
+
+    if by_rank:
+        keys = reciprocal_rank_fusion(rankings, [1.0] * len(rankings), HYBRID_RRF_K)
+    else:
+        keys = sorted(candidates, key=lambda key: candidates[key][0])
+    merged = [candidates[key][1:] for key in keys[:n_results]]
+
+    return {
+        "ids": [[id for id, _, _, _ in merged]],
+        "distances": [[distance for _, distance, _, _ in merged]],
+        "metadatas": [[metadata for _, _, _, metadata in merged]],
+        "documents": [[document for _, _, document, _ in merged]],
+        "embeddings": None,
+        "uris": None,
+        "data": None,
+    }
+
+
+class ShardedRetriever:
+    """Searches several databases (e.g. one per playlist or per chunking setting) as shards of one index.
+
+    The query is embedded once, every selected shard is searched in parallel on a thread pool, and the results are
+    merged by distance into a global top k, or by rank if a shard is in hybrid mode. All shards must be embedded with
+    the same model and distance metric so their distances are comparable; each shard's retriever checks the model.
+
+    Shards carry metadata (any keys besides "db_path" and "name", e.g. {"playlist": "fitness"}), and a query can be
+    routed to the shards whose metadata matches a filter.
+
+    Functions:
+        select_shards: Returns the shards whose metadata matches a filter.
+        embed_query: Embeds the user's query.
+        search: Gets the relevant segments of the selected shards for a query and its embedding.
+        query: Gets the relevant segments of the selected shards for the user's query.
+        warmup: Opens every shard ahead of the first query.
+    """
+
+    def __init__(
+        self,
+        shards: List[dict] = None,
+        max_workers: int = SHARD_QUERY_WORKERS,
+        make_retriever: Callable[[str], Retriever] = get_retriever,
+    ) -> None:
+        f"""Initializes the sharded retriever. The shard databases are opened on the first query.
+
+        Args:
+            shards (list): The shards, each a dict with the "db_path" of its database and optional "name" and
+                routing metadata. Default is None (RETRIEVAL_SHARDS in constants).
+            max_workers (int): The number of shards searched at once. Default is {SHARD_QUERY_WORKERS}.
+            make_retriever (function): Returns the retriever of a database path. Default is get_retriever (the shared
+                retriever of each database).
+        """
+
+        self.shards = list(shards if shards is not None else RETRIEVAL_SHARDS)
+        if not self.shards:
+            raise ValueError("A sharded retriever needs at least one shard.")
+        names = [get_shard_name(shard) for shard in self.shards]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Shard names must be unique, got {names}.")
+
+        self.retrievers = {
+            name: make_retriever(shard["db_path"]) for name, shard in zip(names, self.shards)
+        }
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard")
+
+    def select_shards(self, where: dict = None) -> List[str]:
+        """Returns the names of the shards whose metadata matches the filter, or of every shard if there is none."""
+
+        return [
+            get_shard_name(shard)
+            for shard in self.shards
+            if where is None or shard_matches(shard, where)
+        ]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embeds the user's query once for all shards. The shards share the embedding model."""
+
+        return next(iter(self.retrievers.values())).embed_query(query)
+
+    def search(
+        self,
+        query: str,
+        query_embedding: np.ndarray,
+        n_results: int = DEFAULT_QUERY_RESULTS,
+        where: dict = None,
+    ) -> dict:
+        f"""Gets the relevant segments of the selected shards for a query and its embedding.
+
+        Args:
+            query (str): The user's query.
+            query_embedding (np.ndarray): The embedding of the user's query.
+            n_results (int): The number of results to return. Default is {DEFAULT_QUERY_RESULTS}.
+            where (dict): The metadata the shards must match, e.g. {{"playlist": "fitness"}}. Default is None (all shards).
+
+        Returns:
+            dict: The global top segments, see merge_results.
+        """
+
+        names = self.select_shards(where)
+        if not names:
+            raise ValueError(f"No shard matches {where}.")
+
+        with span("sharded_search", shards=len(names)):
+            # Search the shards in parallel, in this context so their spans are children of this one
+            futures = [
+                self.executor.submit(
+                    in_current_context(self.retrievers[name].search, query, query_embedding, n_results)
+                )
+                for name in names
+            ]
+            shard_results = [(name, future.result()) for name, future in zip(names, futures)]
+
+            # Distances of hybrid shards do not reflect their ranking, so they are merged by rank
+            by_rank = any(self.retrievers[name].mode == "hybrid" for name in names)
+            return merge_results(shard_results, n_results, by_rank=by_rank)
+
+    def query(self, query: str, n_results: int = DEFAULT_QUERY_RESULTS, where: dict = None) -> dict:
+        f"""Gets the relevant segments of the selected shards for the user's query.
+
+        Args:
+            query (str): The user's query.
+            n_results (int): The number of results to return. Default is {DEFAULT_QUERY_RESULTS}.
+            where (dict): The metadata the shards must match. Default is None (all shards).
+
+        Returns:
+            dict: The global top segments, see merge_results.
+        """
+
+        return self.search(query, self.embed_query(query), n_results=n_results, where=where)
+
+    def warmup(self) -> None:
+        """Opens every shard and loads the embedding model ahead of the first query."""
+
+        for retriever in self.retrievers.values():
+            retriever.warmup()
+
+
+# The shared sharded retriever over RETRIEVAL_SHARDS
+_sharded_retriever = None
+_sharded_retriever_lock = threading.Lock()
+
+
+def get_sharded_retriever() -> ShardedRetriever:
+    """Returns the shared sharded retriever over the shards in constants, creating it on first use."""
+
+    global _sharded_retriever
+    with _sharded_retriever_lock:
+        if _sharded_retriever is None:
+            _sharded_retriever = ShardedRetriever()
+        return _sharded_retriever
+
+
+def get_sharded_segments(query: str, n_results: int = DEFAULT_QUERY_RESULTS, where: dict = None) -> dict:
+    f"""Gets the relevant segments for the user's query from the shards in constants, like get_relevant_segments
+    does from one database.
+
+    Args:
+        query (str): The user's query.
+        n_results (int): The number of results to return. Default is {DEFAULT_QUERY_RESULTS}.
+        where (dict): The metadata the shards must match, e.g. {{"playlist": "fitness"}}. Default is None (all shards).
+
+    Returns:
+        dict: The global top segments, with the shard of each segment in its metadata.
+    """
+
+    with span("get_sharded_segments"):
+        return get_sharded_retriever().query(query, n_results=n_results, where=where)
@@ -0,0 +1,8 @@
+from models.etl import reembed_db
+from constants import MAIN_VIDEOS_DB_PATH
+
+if __name__ == "__main__":
+    db_path = input(f"Enter path to database (leave blank for {MAIN_VIDEOS_DB_PATH}): ")
+    db_path = db_path or MAIN_VIDEOS_DB_PATH
+
+    reembed_db(db_path)
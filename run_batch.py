@@ -0,0 +1,359 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List
+
+import main
+from models import llm, retrieval
+from models.retrieval import Retriever
+from utils.answer_cache import AnswerCache, normalize_question
+from utils.context_utils import count_tokens
+from utils.instrumentation import configure, increment, span
+from constants import (
+    MAIN_VIDEOS_DB_PATH,
+    DEFAULT_QUERY_RESULTS,
+    DEFAULT_LLM_MODEL,
+    DEFAULT_LLM_TEMP,
+    BATCH_QUERY_SIZE,
+    BATCH_LLM_WORKERS,
+)
+
+
+def load_batch_questions(path: str) -> List[dict]:
+    """Loads the questions to answer, one JSON object per line with a "question" and an optional "id".
+
+    Args:
+        path (str): The path to the JSON lines file.
+
+    Returns:
+        list: The questions, each a dict with "id" (the line number if the line has none) and "question".
+    """
+
+    questions = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            questions.append({"id": record.get("id", line_number), "question": record["question"]})
+    return questions
+
+
+def load_answered(output_path: str) -> set:
+    """Returns the IDs of the questions answered in the output file. The records of questions whose LLM call failed
+    are removed from the file so they are retried, as is a partial last record left by an interrupted run.
+
+    Args:
+        output_path (str): The path to the answer records.
+
+    Returns:
+        set: The IDs of the answered questions.
+    """
+
+    if not os.path.exists(output_path):
+        return set()
+
+    with open(output_path) as f:
+        data = f.read()
+
+    # Text after the last newline is a partial record
+    lines = [line for line in data[: data.rfind("\n") + 1].splitlines() if line.strip()]
+    records = [json.loads(line) for line in lines]
+    kept = [line for line, record in zip(lines, records) if record.get("error") is None]
+
+    if len(kept) < len(lines) or not data.endswith("\n"):
+        with open(output_path + ".tmp", "w") as f:
+            f.write("".join(line + "\n" for line in kept))
+        os.replace(output_path + ".tmp", output_path)
+
+    return {record["id"] for record in records if record.get("error") is None}
+
+
+def retrieve_batch(
+    retriever: Retriever,
+    questions: List[str],
+    num_rel_segments: int,
+    scope: str,
+    use_cache: bool,
+    token_counter: Callable[[List[str]], List[int]] = count_tokens,
+) -> List[dict]:
+    """Embeds the questions in one pass, searches for all of them in one multi-query lookup and builds the context
+    of each, stopping early for questions whose answer is cached.
+
+    Args:
+        retriever (Retriever): The retriever of the database.
+        questions (list): The questions.
+        num_rel_segments (int): The number of relevant segments per question.
+        scope (str): The answer cache scope of the query settings.
+        use_cache (bool): Whether to use the answer cache.
+        token_counter (function): Returns the number of tokens in each of a list of texts. Default is count_tokens.
+
+    Returns:
+        list: For each question, a dict with the cached answer (or None), the relevant segments, the query
+        embedding and the time in milliseconds of each stage. The embedding and search times are those of the
+        batch divided by its number of questions.
+    """
+
+    start_time = time.perf_counter()
+    with span("embed", queries=len(questions)):
+        query_embeddings = retriever.embed_queries(questions)
+    embed_ms = (time.perf_counter() - start_time) * 1000 / len(questions)
+
+    # Check for answers to similar questions
+    items = []
+    for query_embedding in query_embeddings:
+        answer = main.get_answer_cache().get_similar(query_embedding, scope) if use_cache else None
+        if answer is not None:
+            increment("answer_cache_hits")
+        items.append(
+            {
+                "answer": answer,
+                "relevant_segments": None,
+                "query_embedding": query_embedding,
+                "timings_ms": {"embed": embed_ms},
+            }
+        )
+
+    # Search for the rest in one lookup. Hybrid retrieval fuses the rankings of each question on its own.
+    to_search = [i for i, item in enumerate(items) if item["answer"] is None]
+    num_candidates = main.get_num_candidates(num_rel_segments)
+    start_time = time.perf_counter()
+    with span("search", mode=retriever.mode, store=retriever.store, queries=len(to_search)):
+        if not to_search:
+            all_candidates = []
+        elif retriever.mode == "hybrid":
+            all_candidates = [
+                retriever.hybrid_search(questions[i], query_embeddings[i], n_results=num_candidates)
+                for i in to_search
+            ]
+        else:
+            all_candidates = retriever.query_by_embeddings(
+                query_embeddings[to_search], n_results=num_candidates
+            )
+    search_ms = (time.perf_counter() - start_time) * 1000 / max(len(to_search), 1)
+
+    for i, candidates in zip(to_search, all_candidates):
+        start_time = time.perf_counter()
+        items[i]["answer"], items[i]["relevant_segments"] = main.select_context(
+            questions[i], candidates, num_rel_segments, scope, use_cache, token_counter=token_counter
+        )
+        items[i]["timings_ms"]["search"] = search_ms
+        items[i]["timings_ms"]["context"] = (time.perf_counter() - start_time) * 1000
+
+    return items
+
+
+def answer_question(
+    question: str,
+    item: dict,
+    llm_model: str,
+    llm_temp: float,
+    scope: str,
+    use_cache: bool,
+) -> dict:
+    """Gets the LLM answer to a retrieved question, retrying rate limits, and caches it.
+
+    Args:
+        question (str): The question.
+        item (dict): The retrieval result of the question, see retrieve_batch.
+        llm_model (str): The LLM model to use.
+        llm_temp (float): The sampling temperature to use.
+        scope (str): The answer cache scope of the query settings.
+        use_cache (bool): Whether to use the answer cache.
+
+    Returns:
+        dict: The fields of the question's answer record.
+    """
+
+    record = {"answer": None, "cached": False, "retries": 0, "error": None, "timings_ms": item["timings_ms"]}
+    start_time = time.perf_counter()
+    try:
+        record["answer"], record["retries"] = llm.answer_with_retry(
+            question, item["relevant_segments"], model=llm_model, temperature=llm_temp
+        )
+    except Exception as error:
+        # Record the failure and carry on with the other questions
+        record["error"] = f"{type(error).__name__}: {error}"
+        increment("batch_errors")
+        return record
+    finally:
+        llm_seconds = time.perf_counter() - start_time
+        record["timings_ms"]["llm"] = llm_seconds * 1000
+
+    if use_cache:
+        main.get_answer_cache().put(
+            question,
+            item["relevant_segments"]["ids"][0],
+            scope,
+            item["query_embedding"],
+            record["answer"],
+            llm_seconds,
+        )
+    return record
+
+
+def write_answers(pending: deque, results: dict, f, keep: int = 0) -> int:
+    """Writes the answer records of the pending questions in input order, waiting for their answers, until at most
+    `keep` questions are pending. Returns the number of records written."""
+
+    written = 0
+    while len(pending) > keep:
+        question, key, duplicate = pending.popleft()
+        record = {
+            "id": question["id"],
+            "question": question["question"],
+            **results[key].result(),
+            "duplicate": duplicate,
+        }
+        f.write(json.dumps(record) + "\n")
+        written += 1
+    f.flush()
+    return written
+
+
+def run_batch(
+    input_path: str,
+    output_path: str,
+    db_path: str = MAIN_VIDEOS_DB_PATH,
+    num_rel_segments: int = DEFAULT_QUERY_RESULTS,
+    llm_model: str = DEFAULT_LLM_MODEL,
+    llm_temp: float = DEFAULT_LLM_TEMP,
+    use_cache: bool = True,
+    batch_size: int = BATCH_QUERY_SIZE,
+    llm_workers: int = BATCH_LLM_WORKERS,
+    retriever: Retriever = None,
+    token_counter: Callable[[List[str]], List[int]] = count_tokens,
+) -> dict:
+    f"""Answers the questions in a JSON lines file and writes one answer record per question to a JSON lines file,
+    in input order, as the answers come in. Questions are answered the way run_query answers them, but in batches:
+    each batch is embedded in one forward pass and searched in one multi-query lookup, and its LLM calls run in
+    parallel (retrying rate limits) while the next batch is retrieved. Repeated questions are answered once.
+
+    The run resumes after an interruption: questions that already have a record in the output file are skipped, by
+    ID. Questions whose LLM call failed are recorded with the error, and are retried (and their records replaced at
+    the end of the file) when the run is resumed.
+
+    Args:
+        input_path (str): The path to the questions, see load_batch_questions.
+        output_path (str): The path to the answer records.
+        db_path (str): The path to the database. Default is {MAIN_VIDEOS_DB_PATH}.
+        num_rel_segments (int): The number of relevant segments to retrieve. Default is {DEFAULT_QUERY_RESULTS}.
+        llm_model (str): The LLM model to use. Default is {DEFAULT_LLM_MODEL}.
+        llm_temp (float): The sampling temperature to use. Default is {DEFAULT_LLM_TEMP}.
+        use_cache (bool): Whether to use the answer cache. Default is True.
+        batch_size (int): The number of questions embedded and searched together. Default is {BATCH_QUERY_SIZE}.
+        llm_workers (int): The number of LLM calls in flight. Default is {BATCH_LLM_WORKERS}.
+        retriever (Retriever): The retriever to search with. Default is None (the shared retriever of the database).
+        token_counter (function): Returns the number of tokens in each of a list of texts, see build_context.
+            Default is count_tokens.
+
+    Returns:
+        dict: The numbers of questions, questions skipped as already answered, unique questions, cached answers
+        and errors, and the run time in seconds.
+    """
+
+    start_time = time.perf_counter()
+    questions = load_batch_questions(input_path)
+    answered = load_answered(output_path)
+    remaining = [question for question in questions if question["id"] not in answered]
+    num_answered = len(questions) - len(remaining)
+    if num_answered:
+        print(f"Resuming: {num_answered} of {len(questions)} questions already answered.")
+
+    retriever = retriever or retrieval.get_retriever(db_path)
+    scope = AnswerCache.scope(db_path, num_rel_segments, llm_model, llm_temp)
+
+    results = {}
+    pending = deque()
+    num_cached = 0
+    written = 0
+    with open(output_path, "a") as f, ThreadPoolExecutor(max_workers=llm_workers) as executor:
+        for start in range(0, len(remaining), batch_size):
+            batch = remaining[start : start + batch_size]
+
+            # Only retrieve questions not seen before in this run
+            new = {}
+            for question in batch:
+                key = normalize_question(question["question"])
+                pending.append((question, key, key in results or key in new))
+                if key not in results:
+                    new.setdefault(key, question["question"])
+
+            if new:
+                with span("batch", questions=len(new)):
+                    items = retrieve_batch(
+                        retriever, list(new.values()), num_rel_segments, scope, use_cache, token_counter
+                    )
+                for (key, text), item in zip(new.items(), items):
+                    if item["answer"] is not None:
+                        num_cached += 1
+                        results[key] = Future()
+                        results[key].set_result(
+                            {
+                                "answer": item["answer"],
+                                "cached": True,
+                                "retries": 0,
+                                "error": None,
+                                "timings_ms": item["timings_ms"],
+                            }
+                        )
+                    else:
+                        results[key] = executor.submit(
+                            answer_question, text, item, llm_model, llm_temp, scope, use_cache
+                        )
+
+            # Write the earlier batches while this one is being answered
+            written += write_answers(pending, results, f, keep=len(batch))
+            print(f"{num_answered + written} of {len(questions)} questions answered.")
+
+        written += write_answers(pending, results, f)
+
+    errors = sum(1 for future in results.values() if future.result()["error"] is not None)
+    summary = {
+        "questions": len(questions),
+        "skipped": num_answered,
+        "unique": len(results),
+        "cached": num_cached,
+        "errors": errors,
+        "seconds": time.perf_counter() - start_time,
+    }
+    print(f"Answers written to {output_path}: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answers the questions in a JSON lines file without the UI.")
+    parser.add_argument("input", help='Questions, one JSON object per line with a "question" and an optional "id".')
+    parser.add_argument("output", help="Answer records (JSON lines). An existing file is resumed.")
+    parser.add_argument("--db", default=MAIN_VIDEOS_DB_PATH, help="Database to retrieve from.")
+    parser.add_argument("--num-segments", type=int, default=DEFAULT_QUERY_RESULTS, help="Relevant segments per question.")
+    parser.add_argument("--model", default=DEFAULT_LLM_MODEL, help="LLM model.")
+    parser.add_argument("--temperature", type=float, default=DEFAULT_LLM_TEMP, help="LLM sampling temperature.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_QUERY_SIZE, help="Questions embedded and searched together.")
+    parser.add_argument("--workers", type=int, default=BATCH_LLM_WORKERS, help="LLM calls in flight.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the answer cache.")
+    parser.add_argument("--stub-llm", action="store_true", help="Answer with a local stub instead of the LLM.")
+    args = parser.parse_args()
+
+    if args.stub_llm:
+        from utils.stub_llm import StubOpenAIClient
+
+        llm.client = StubOpenAIClient()
+
+    # Set up the span log and metrics endpoint, if configured
+    configure()
+
+    run_batch(
+        args.input,
+        args.output,
+        db_path=args.db,
+        num_rel_segments=args.num_segments,
+        llm_model=args.model,
+        llm_temp=args.temperature,
+        use_cache=not args.no_cache,
+        batch_size=args.batch_size,
+        llm_workers=args.workers,
+    )
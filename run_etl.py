@@ -3,11 +3,29 @@ from models.etl import run_etl
 if __name__ == "__main__":
     json_path = input("Enter path to JSON file: ")
     db_path = input("Enter path to database: ")
-    batch_size = int(input("Enter batch size (leave blank for no batching): "))
 
-    if batch_size:
-        overlap = int(input("Enter overlap (leave blank for no overlap): "))
+    # Segments are either batches of caption lines or packed by token count, so only ask for one mode's settings
+    chunking_mode = input("Chunk segments by caption lines or by tokens? (lines/tokens, leave blank for lines): ") or "lines"
+    if chunking_mode not in ("lines", "tokens"):
+        raise ValueError(f"Unknown chunking mode {chunking_mode}. Choose lines or tokens.")
+
+    batch_size = overlap = max_tokens = token_overlap = None
+    if chunking_mode == "lines":
+        batch_size = int(input("Enter batch size (leave blank for no batching): ") or 0)
+        if batch_size:
+            overlap = int(input("Enter overlap (leave blank for no overlap): ") or 0)
     else:
-        overlap = None
+        max_tokens = int(input("Enter max tokens per segment: "))
+        token_overlap = int(input("Enter token overlap (leave blank for no overlap): ") or 0)
+
+    incremental = input("Update an existing database incrementally? (y/n): ") == "y"
 
-    run_etl(json_path=json_path, db=db_path, batch_size=batch_size, overlap=overlap)
+    run_etl(
+        json_path=json_path,
+        db=db_path,
+        batch_size=batch_size,
+        overlap=overlap,
+        incremental=incremental,
+        max_tokens=max_tokens,
+        token_overlap=token_overlap,
+    )
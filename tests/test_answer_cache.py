@@ -0,0 +1,73 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from models import llm
+from utils.answer_cache import AnswerCache
+from utils.stub_llm import StubOpenAIClient
+
+TEST_SEGMENTS = {
+    "ids": [["video_a__0", "video_b__5"]],
+    "documents": [["Sleep helps muscle recovery.", "Protein supports muscle growth."]],
+    "metadatas": [
+        [
+            {"title": "Video A", "source": "https://www.youtube.com/watch?v=video_a&t=0s"},
+            {"title": "Video B", "source": "https://www.youtube.com/watch?v=video_b&t=5s"},
+        ]
+    ],
+}
+
+
+def test_answer_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests exact and semantic hits, TTL expiry, LRU eviction and persistence, with a stub LLM client."""
+
+    monkeypatch.setattr(llm, "client", StubOpenAIClient())
+    question = "How can I promote muscle recovery?"
+    segment_ids = TEST_SEGMENTS["ids"][0]
+    query_embedding = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "answer_cache.sqlite3")
+        cache = AnswerCache(path=path, max_entries=2, semantic_threshold=0.95)
+        scope = AnswerCache.scope("data/videos.db", 5, "gpt", 0.1)
+
+        # The first request goes to the LLM
+        assert cache.get(question, segment_ids, scope) is None
+        answer = llm.answer_with_context(question, TEST_SEGMENTS)
+        cache.put(question, segment_ids, scope, query_embedding, answer, llm_seconds=1.5)
+        assert llm.client.calls == 1
+
+        # Exact tier: same question up to case/punctuation and the same segments
+        assert cache.get("how can I promote muscle recovery", segment_ids, scope) == answer
+        assert cache.get(question, segment_ids[:1], scope) is None
+
+        # Semantic tier: similar embeddings within the same scope only
+        similar = np.array([0.99, 0.1, 0.0], dtype=np.float32)
+        assert cache.get_similar(similar, scope) == answer
+        assert cache.get_similar(np.array([0.0, 1.0, 0.0], dtype=np.float32), scope) is None
+        assert cache.get_similar(similar, AnswerCache.scope("other.db", 5, "gpt", 0.1)) is None
+
+        stats = cache.stats()
+        assert stats["exact_hits"] == 1 and stats["semantic_hits"] == 1
+        assert stats["saved_seconds"] == 3.0
+
+        # Persistence: a new cache on the same file serves the answer
+        reopened = AnswerCache(path=path)
+        assert reopened.get(question, segment_ids, scope) == answer
+
+        # LRU eviction: the least recently used entry is dropped above max_entries
+        for i in range(2):
+            cache.put(f"question {i}", segment_ids, scope, query_embedding, "answer", 1.0)
+        assert cache.get(question, segment_ids, scope) is None
+
+        # TTL: expired entries are not served
+        expiring = AnswerCache(path=os.path.join(tmp_dir, "ttl.sqlite3"), ttl=0)
+        expiring.put(question, segment_ids, scope, query_embedding, answer, 1.0)
+        assert expiring.get(question, segment_ids, scope) is None
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_answer_cache(monkeypatch)
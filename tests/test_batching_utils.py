@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.batching_utils import MicroBatcher
+
+
+def test_micro_batcher() -> None:
+    """Tests that concurrent calls are coalesced into batches and each caller gets its own result."""
+
+    batch_sizes = []
+
+    def square_all(items: list) -> list:
+        batch_sizes.append(len(items))
+        return [item * item for item in items]
+
+    # Concurrent callers within the window share batches, up to the maximum batch size
+    batcher = MicroBatcher(square_all, max_wait=0.05, max_batch_size=4)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(batcher.submit, range(8)))
+    assert results == [i * i for i in range(8)]
+    assert max(batch_sizes) <= 4 and len(batch_sizes) < 8
+    assert batcher.stats()["items"] == 8
+
+    # Errors are raised in every caller of the batch
+    def fail(items: list) -> list:
+        raise ValueError("batch failed")
+
+    batcher = MicroBatcher(fail, max_wait=0.0, max_batch_size=4)
+    with pytest.raises(ValueError):
+        batcher.submit(1)
+
+    # A result list of the wrong length fails every caller of the batch instead of leaving some waiting
+    batcher = MicroBatcher(lambda items: items[1:], max_wait=0.05, max_batch_size=4)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(batcher.submit, i) for i in range(2)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+
+    # A batch size of 1 runs each item on its own
+    batch_sizes.clear()
+    assert MicroBatcher(square_all, max_batch_size=1).submit(3) == 9
+    assert batch_sizes == [1]
+
+
+if __name__ == "__main__":
+    test_micro_batcher()
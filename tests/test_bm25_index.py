@@ -0,0 +1,48 @@
+import os
+import tempfile
+
+from utils.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize_terms
+
+
+def test_bm25_index() -> None:
+    """Tests that segments with rare query terms rank first and that a saved index loads back the same."""
+
+    assert tokenize_terms("Zone 2 cardio & VO2-max") == ["zone", "2", "cardio", "vo2", "max"]
+
+    ids = ["a__0", "a__1", "b__0", "b__1"]
+    documents = [
+        "today we talk about sleep and light",
+        "creatine and creatine dosing for muscle",
+        "zone 2 cardio and VO2 max training",
+        "sleep and caffeine timing",
+    ]
+    index = BM25Index.build(ids, documents)
+
+    segment_ids, scores = index.search("creatine dosing", n_results=3)
+    assert segment_ids == ["a__1"] and scores[0] > 0
+    segment_ids, _ = index.search("VO2 max", n_results=3)
+    assert segment_ids == ["b__0"]
+    segment_ids, _ = index.search("sleep caffeine", n_results=3)
+    assert segment_ids == ["b__1", "a__0"]
+    assert index.search("unknown words", n_results=3)[0] == []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.bm25.npz")
+        index.save(path)
+        loaded = BM25Index.load(path)
+        assert loaded.search("sleep caffeine", n_results=3)[0] == ["b__1", "a__0"]
+
+
+def test_reciprocal_rank_fusion() -> None:
+    """Tests that segments ranked high by both rankings come first and that weights shift the order."""
+
+    vector = ["a", "b", "c"]
+    keyword = ["c", "a", "d"]
+    assert reciprocal_rank_fusion([vector, keyword], [1.0, 1.0], k=60)[0] == "a"
+    assert reciprocal_rank_fusion([vector, keyword], [1.0, 3.0], k=60)[0] == "c"
+    assert set(reciprocal_rank_fusion([vector, keyword], [1.0, 1.0], k=60)) == {"a", "b", "c", "d"}
+
+
+if __name__ == "__main__":
+    test_bm25_index()
+    test_reciprocal_rank_fusion()
@@ -0,0 +1,24 @@
+from utils.chunking_utils import get_token_windows
+
+
+def test_token_windows() -> None:
+    """Tests that windows respect the token budget, prefer sentence boundaries and overlap by whole lines."""
+
+    texts = ["one two", "three four.", "five six", "seven eight", "nine ten."]
+    token_counts = [2, 2, 2, 2, 2]
+
+    # Without sentence endings in reach, windows are packed up to the budget
+    windows = get_token_windows(texts, token_counts, max_tokens=6)
+    assert windows == [(0, 2), (2, 5)]
+
+    # Windows share up to `token_overlap` tokens and every line is covered
+    windows = get_token_windows(texts, token_counts, max_tokens=4, token_overlap=2)
+    assert windows == [(0, 2), (1, 3), (2, 4), (3, 5)]
+
+    # A line longer than the budget gets a window of its own
+    windows = get_token_windows(["a long line", "short."], [10, 1], max_tokens=4)
+    assert windows == [(0, 1), (1, 2)]
+
+
+if __name__ == "__main__":
+    test_token_windows()
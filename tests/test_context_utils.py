@@ -0,0 +1,77 @@
+from utils.context_utils import build_context, merge_overlapping_text, pack_to_budget
+
+
+def make_results(ids: list, documents: list) -> dict:
+    """Returns single-query database results for the segments."""
+
+    return {
+        "ids": [ids],
+        "documents": [documents],
+        "metadatas": [[{"segment_id": id, "title": id, "source": id} for id in ids]],
+        "distances": [[0.1 * i for i in range(len(ids))]],
+    }
+
+
+def count_words(texts: list) -> list:
+    """Counts words in place of tokens."""
+
+    return [len(text.split()) for text in texts]
+
+
+def test_merge_overlapping_text() -> None:
+    """Tests that overlapping windows are joined without the shared words and that unrelated windows are not."""
+
+    assert merge_overlapping_text("a b c d e f", "c d e f g h") == "a b c d e f g h"
+    assert merge_overlapping_text("a b c d e f", "d e") == "a b c d e f"
+    assert merge_overlapping_text("a b c d e f", "f g h") is None
+    assert merge_overlapping_text("a b c", "x y z") is None
+
+
+def test_pack_to_budget() -> None:
+    """Tests that texts are packed in order, cut when enough budget is left and skipped otherwise."""
+
+    texts = ["a b c d", "e f g h i j", "k l"]
+    assert pack_to_budget(texts, count_words(texts), max_tokens=8, min_tokens=3) == [
+        (0, "a b c d"),
+        (1, "e f g h"),
+    ]
+    assert pack_to_budget(texts, count_words(texts), max_tokens=7, min_tokens=4) == [
+        (0, "a b c d"),
+        (2, "k l"),
+    ]
+
+
+def test_build_context() -> None:
+    """Tests that overlapping windows of a video become one passage and the context fits the budget."""
+
+    results = make_results(
+        ["v1__0", "v1__5", "v2__0", "v1__40"],
+        [
+            "one two three four five six seven eight",
+            "six seven eight nine ten eleven",
+            "alpha beta gamma delta",
+            "creatine dosing and timing",
+        ],
+    )
+
+    context = build_context(results, num_segments=4, max_tokens=100, token_counter=count_words)
+    assert context["ids"][0] == ["v1__0", "v2__0", "v1__40"]
+    assert context["documents"][0][0] == "one two three four five six seven eight nine ten eleven"
+    assert context["distances"][0][0] == 0.0
+
+    context = build_context(results, num_segments=4, max_tokens=12, token_counter=count_words)
+    assert sum(count_words(context["documents"][0])) <= 12
+
+    # Diverse segments further down the ranking never make the context longer than the top segments
+    results = make_results(
+        ["v1__0", "v2__0", "v3__0"],
+        ["creatine dosing and timing", "creatine dosing and timing", " ".join(["word"] * 20)],
+    )
+    context = build_context(results, num_segments=2, max_tokens=100, mmr_lambda=0.5, token_counter=count_words)
+    assert context["ids"][0] == ["v1__0"]
+
+
+if __name__ == "__main__":
+    test_merge_overlapping_text()
+    test_pack_to_budget()
+    test_build_context()
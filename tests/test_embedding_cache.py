@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+import numpy as np
+
+from utils.embedding_cache import EmbeddingCache
+
+VECTORS = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+
+def test_hits_and_misses() -> None:
+    """Tests that cached texts are returned with their vectors and counted as hits, and other texts as misses."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = EmbeddingCache(os.path.join(tmp_dir, "cache.sqlite3"), model_name="model-a")
+        cache.put_many(["a", "b"], VECTORS[:2])
+
+        found = cache.get_many(["a", "b", "c"])
+        assert set(found) == {"a", "b"}
+        assert np.array_equal(found["b"], VECTORS[1])
+        assert cache.stats() == {"hits": 2, "misses": 1, "entries": 2}
+
+
+def test_evicts_least_recently_used() -> None:
+    """Tests that the least recently used vectors are evicted above max_entries, where a lookup counts as a use."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = EmbeddingCache(os.path.join(tmp_dir, "cache.sqlite3"), model_name="model-a", max_entries=2)
+        cache.put_many(["a"], VECTORS[:1])
+        cache.put_many(["b"], VECTORS[1:2])
+
+        # Using "a" leaves "b" as the least recently used
+        cache.get_many(["a"])
+        cache.put_many(["c"], VECTORS[2:])
+
+        assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+        assert cache.stats()["entries"] == 2
+
+
+def test_keeps_vectors_of_other_models() -> None:
+    """Tests that vectors of each model are kept side by side, only returned for their own model, and evicted by LRU across models."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cache.sqlite3")
+        EmbeddingCache(path, model_name="model-a", max_entries=3).put_many(["a", "b"], VECTORS[:2])
+
+        # Switching to another model keeps the vectors of the first one but does not return them
+        cache = EmbeddingCache(path, model_name="model-b", max_entries=3)
+        assert cache.get_many(["a"]) == {}
+        cache.put_many(["a"], VECTORS[2:])
+        assert cache.stats()["entries"] == 3
+
+        # Switching back finds the vectors of the first model, which makes "a" the most recently used
+        cache = EmbeddingCache(path, model_name="model-a", max_entries=3)
+        found = cache.get_many(["a"])
+        assert np.array_equal(found["a"], VECTORS[0])
+
+        # A new vector evicts the least recently used one, "b" of model-a
+        cache.put_many(["c"], VECTORS[2:])
+        assert cache.stats()["entries"] == 3
+        assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+        assert set(EmbeddingCache(path, model_name="model-b").get_many(["a"])) == {"a"}
+
+
+if __name__ == "__main__":
+    test_hits_and_misses()
+    test_evicts_least_recently_used()
+    test_keeps_vectors_of_other_models()
@@ -0,0 +1,30 @@
+import numpy as np
+
+from utils.embedding_pool import EmbeddingPool
+from utils.embedding_utils import MyEmbeddingFunction, cosine_agreement
+
+DOCUMENTS = [
+    "Zone two training builds the mitochondria of slow twitch muscle fibers.",
+    "Get morning sunlight in your eyes to set your circadian clock.",
+    "Creatine supports strength and may help cognition.",
+    "Protein intake matters most for muscle protein synthesis after training.",
+    "Cold exposure raises dopamine for hours.",
+] * 20
+
+
+def test_pool_matches_in_process() -> None:
+    """Tests that the pool returns the same vectors as the in-process embedding function, in input order."""
+
+    reference = MyEmbeddingFunction(batch_size=8).embed(DOCUMENTS)
+    with EmbeddingPool(2, batch_size=8, use_cache=False) as pool:
+        embeddings = pool.embed(DOCUMENTS)
+        empty = pool.embed([])
+
+    assert embeddings.shape == reference.shape
+    assert embeddings.dtype == np.float32
+    assert cosine_agreement(embeddings, reference).min() > 0.999
+    assert empty.shape == (0, reference.shape[1])
+
+
+if __name__ == "__main__":
+    test_pool_matches_in_process()
@@ -0,0 +1,40 @@
+import tempfile
+
+import chromadb
+import numpy as np
+
+from utils.embedding_utils import MyEmbeddingFunction
+
+DOCUMENTS = [
+    "Zone two training builds the mitochondria of slow twitch muscle fibers.",
+    "Get morning sunlight in your eyes to set your circadian clock.",
+    "Creatine supports strength.",
+    "Protein intake matters most for muscle protein synthesis after training, spread over the day.",
+    "Cold exposure raises dopamine for hours.",
+]
+
+
+def test_add_to_chroma_collection() -> None:
+    """Tests that ChromaDB accepts the embeddings of the function, stores the batched vectors and embeds queries
+    with it."""
+
+    embedding_function = MyEmbeddingFunction(batch_size=2)
+    ids = [f"doc_{i}" for i in range(len(DOCUMENTS))]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collection = chromadb.PersistentClient(tmp_dir).create_collection(
+            "test_collection", embedding_function=embedding_function
+        )
+        collection.add(ids=ids, documents=DOCUMENTS)
+
+        stored = collection.get(ids=ids, include=["embeddings"])
+        embeddings = dict(zip(stored["ids"], stored["embeddings"]))
+        expected = embedding_function.encode(DOCUMENTS)
+        assert np.allclose([embeddings[id] for id in ids], expected, atol=1e-5)
+
+        results = collection.query(query_texts=[DOCUMENTS[1]], n_results=1)
+        assert results["ids"][0] == ["doc_1"]
+
+
+if __name__ == "__main__":
+    test_add_to_chroma_collection()
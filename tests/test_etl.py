@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+
+import pytest
+from chromadb.api.client import SharedSystemClient
+
+from models.etl import get_loaded_videos, get_log_path, get_manifest_path, load_manifest, run_etl, save_manifest
+from utils.transcript_utils import JsonTranscriptFetcher
+
+
+def test_log_paths() -> None:
+    """Tests that databases with the same name in different folders get their own logs and manifests."""
+
+    assert get_log_path("data/videos.db", "load_log") == "data/logs/videos_load_log.json"
+    assert get_log_path("./data/videos.db/", "load_log") == "data/logs/videos_load_log.json"
+    assert get_log_path("data/eval/indexes/videos.db", "load_log") == "data/logs/eval_indexes_videos_load_log.json"
+
+    assert get_manifest_path("data/videos.db") == os.path.join("data", "videos.etl_manifest.json")
+    assert get_manifest_path("data/videos.db") != get_manifest_path("data/eval/indexes/videos.db")
+
+
+def test_stale_manifest() -> None:
+    """Tests that the manifest of a database that no longer exists is dropped rather than resumed from."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "test.db")
+        os.makedirs(db_path)
+        manifest = {"videos_info_path": "videos.json", "batch_size": 10, "overlap": 5, "loaded_video_ids": ["a"]}
+        save_manifest(db_path, manifest)
+        assert load_manifest(db_path) == manifest
+
+        os.rmdir(db_path)
+        assert load_manifest(db_path) is None
+        assert not os.path.exists(get_manifest_path(db_path))
+
+
+class StubFetcher(JsonTranscriptFetcher):
+    """A fixture fetcher that fails for the given videos."""
+
+    def __init__(self, fixtures_dir: str, failing_video_ids: list = ()) -> None:
+        super().__init__(fixtures_dir)
+        self.failing_video_ids = failing_video_ids
+
+    def get_transcript(self, video_id: str, languages: list = None) -> list:
+        if video_id in self.failing_video_ids:
+            raise ConnectionError("Simulated network failure")
+        return super().get_transcript(video_id, languages)
+
+
+def test_rejects_both_chunking_modes() -> None:
+    with pytest.raises(ValueError):
+        run_etl("unused.json", "unused.db", batch_size=10, max_tokens=256)
+
+
+def test_incremental_load() -> None:
+    """Tests that an incremental load adds, updates and removes videos, and leaves videos whose transcript could not
+    be fetched in the database."""
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Logs and the transcript cache are written under data/
+        os.chdir(tmp_dir)
+        try:
+            os.makedirs("data/logs")
+            os.makedirs("fixtures")
+            for i, video_id in enumerate(["a", "b", "c", "d", "e"]):
+                lines = [{"text": f"line {j} of video {video_id}", "start": j * 2.0, "duration": 2.0} for j in range(6 + i)]
+                with open(os.path.join("fixtures", f"{video_id}.json"), "w") as f:
+                    json.dump(lines, f)
+
+            def load(videos: list, fetcher: StubFetcher) -> None:
+                with open("videos.json", "w") as f:
+                    json.dump([{"id": video_id, "title": title} for video_id, title in videos], f)
+                run_etl("videos.json", "test.db", batch_size=3, overlap=1, fetcher=fetcher, incremental=True)
+
+            load([("a", "A"), ("b", "B"), ("c", "C"), ("e", "E")], StubFetcher("fixtures"))
+            loaded_videos = get_loaded_videos("test.db")
+            assert set(loaded_videos) == {"a", "b", "c", "e"}
+
+            # "c" is not in the transcript cache any more and its fetch fails
+            os.remove(os.path.join("data", "transcripts", "c.json"))
+            load([("a", "A"), ("b", "B, renamed"), ("c", "C"), ("d", "D")], StubFetcher("fixtures", ["c"]))
+
+            with open(get_log_path("test.db", "diff_log")) as f:
+                diff_log = json.load(f)
+            assert diff_log["added"] == ["d"]
+            assert diff_log["updated"] == ["b"]
+            assert diff_log["removed"] == ["e"]
+            assert diff_log["unchanged"] == 1
+            assert diff_log["skipped"] == ["c"]
+
+            reloaded_videos = get_loaded_videos("test.db")
+            assert set(reloaded_videos) == {"a", "b", "c", "d"}
+            assert reloaded_videos["c"] == loaded_videos["c"]
+            assert reloaded_videos["b"] != loaded_videos["b"]
+        finally:
+            os.chdir(cwd)
+            SharedSystemClient.clear_system_cache()
+
+
+if __name__ == "__main__":
+    test_log_paths()
+    test_stale_manifest()
+    test_rejects_both_chunking_modes()
+    test_incremental_load()
@@ -0,0 +1,29 @@
+from utils.eval_utils import get_video_ids, load_questions, recall_at_k, reciprocal_rank
+
+
+def test_metrics() -> None:
+    """Tests recall@k and reciprocal rank on video IDs taken from segment IDs."""
+
+    results = {"metadatas": [[{"segment_id": "a__0"}, {"segment_id": "b__15"}, {"segment_id": "a__30"}]]}
+    video_ids = get_video_ids(results)
+    assert video_ids == ["a", "b", "a"]
+
+    assert recall_at_k(video_ids, ["b", "c"], k=1) == 0.0
+    assert recall_at_k(video_ids, ["b", "c"], k=2) == 0.5
+    assert reciprocal_rank(video_ids, ["b"]) == 0.5
+    assert reciprocal_rank(video_ids, ["c"]) == 0.0
+
+
+def test_load_questions() -> None:
+    """Tests that every evaluation question has a question and at least one expected video."""
+
+    questions = load_questions()
+    assert questions
+    for question in questions:
+        assert question["question"]
+        assert question["expected_video_ids"]
+
+
+if __name__ == "__main__":
+    test_metrics()
+    test_load_questions()
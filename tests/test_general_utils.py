@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+
+import chromadb
+from chromadb.api.client import SharedSystemClient
+
+from utils.general_utils import close_chroma_system
+from constants import TABLE_NAME
+
+
+def test_close_chroma_system() -> None:
+    """Tests that closing one database's system leaves other databases open and makes a rebuild visible."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, name) for name in ("a.db", "b.db")]
+        for path in paths:
+            collection = chromadb.PersistentClient(path).create_collection(TABLE_NAME)
+            collection.add(ids=["v__0"], embeddings=[[1.0, 0.0]])
+        other = chromadb.PersistentClient(paths[1]).get_collection(TABLE_NAME)
+
+        # Rebuild the first database with two segments
+        close_chroma_system(paths[0])
+        shutil.rmtree(paths[0])
+        collection = chromadb.PersistentClient(paths[0]).create_collection(TABLE_NAME)
+        collection.add(ids=["v__0", "v__1"], embeddings=[[1.0, 0.0], [0.0, 1.0]])
+        close_chroma_system(paths[0])
+
+        assert paths[0] not in SharedSystemClient._identifer_to_system
+        assert chromadb.PersistentClient(paths[0]).get_collection(TABLE_NAME).count() == 2
+        assert paths[1] in SharedSystemClient._identifer_to_system and other.count() == 1
+
+        for path in paths:
+            close_chroma_system(path)
+
+
+if __name__ == "__main__":
+    test_close_chroma_system()
@@ -0,0 +1,142 @@
+import json
+import os
+import tempfile
+
+import chromadb
+import numpy as np
+import pytest
+
+from utils import embedding_utils
+from utils.hnsw_tuning import (
+    apply_hnsw_params,
+    choose_params,
+    exact_top_k,
+    get_hnsw_params,
+    get_queries,
+    read_collection,
+    replace_collection,
+    tune_hnsw,
+)
+from constants import TABLE_NAME, EMBEDDING_MODEL
+
+
+class FakeEmbeddingFunction:
+    """Embeds every text as a vector of ones."""
+
+    def encode(self, texts: list) -> np.ndarray:
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def create_database(db_path: str, vectors: np.ndarray) -> chromadb.Collection:
+    """Creates a database holding the vectors as segments."""
+
+    collection = chromadb.PersistentClient(db_path).create_collection(
+        TABLE_NAME, metadata={"hnsw:space": "cosine", "embedding_model": "test"}
+    )
+    collection.add(
+        ids=[f"v__{i}" for i in range(len(vectors))],
+        embeddings=vectors.tolist(),
+        documents=[f"segment {i}" for i in range(len(vectors))],
+        metadatas=[{"video_id": "v"} for _ in range(len(vectors))],
+    )
+    return collection
+
+
+def test_exact_top_k() -> None:
+    """Tests that brute-force search ranks neighbours by the collection's distance metric."""
+
+    vectors = np.array([[1.0, 0.0], [0.0, 1.0], [10.0, 1.0]], dtype=np.float32)
+    queries = np.array([[1.0, 0.0], [9.0, 0.0]], dtype=np.float32)
+
+    assert exact_top_k(vectors, queries, 2, "cosine").tolist() == [[0, 2], [0, 2]]
+    assert exact_top_k(vectors, queries, 2, "l2").tolist() == [[0, 1], [2, 0]]
+    assert exact_top_k(vectors, queries, 5, "ip").tolist() == [[2, 0, 1], [2, 0, 1]]
+
+
+def test_tune_and_apply() -> None:
+    """Tests that tuning leaves the database as it is, and that applying parameters rebuilds it with the same
+    segments and records the parameters in its collection metadata."""
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "test.db")
+        collection = create_database(db_path, vectors)
+
+        results = tune_hnsw(db_path, {"M": [4, 16], "search_ef": [10, 100]}, k=10, num_queries=20)
+        assert len(results) == 4
+        assert all(0.0 <= result["recall"] <= 1.0 and result["disk_bytes"] > 0 for result in results)
+        assert get_hnsw_params(collection.metadata) == {"M": 16, "construction_ef": 100, "search_ef": 10}
+
+        chosen = choose_params(results, target_recall=0.0)
+        assert chosen["p95_ms"] == min(result["p95_ms"] for result in results)
+        assert choose_params(results, target_recall=1.1)["recall"] == max(result["recall"] for result in results)
+
+        apply_hnsw_params(db_path, {"M": 8, "construction_ef": 50, "search_ef": 40})
+        rebuilt = chromadb.PersistentClient(db_path).get_collection(TABLE_NAME)
+        assert rebuilt.metadata["embedding_model"] == "test"
+        assert get_hnsw_params(rebuilt.metadata) == {"M": 8, "construction_ef": 50, "search_ef": 40}
+        assert rebuilt.count() == len(vectors)
+        assert rebuilt.get(ids=["v__7"])["documents"] == ["segment 7"]
+
+
+def test_get_queries(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that the evaluation questions are embedded as queries for a database of the query embedding model, and
+    that stored vectors with noise are used otherwise."""
+
+    monkeypatch.setattr(embedding_utils, "get_embedding_function", FakeEmbeddingFunction)
+    vectors = np.zeros((50, 4), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        questions_path = os.path.join(tmp_dir, "questions.jsonl")
+        with open(questions_path, "w") as f:
+            for question in ("a", "b", "c"):
+                f.write(json.dumps({"question": question, "expected_video_ids": []}) + "\n")
+
+        queries, source = get_queries({"embedding_model": EMBEDDING_MODEL}, vectors, 2, questions_path)
+        assert queries.tolist() == np.ones((2, 4)).tolist() and source.startswith("2 questions")
+
+        # Another model's vectors, or no question file, fall back to stored vectors with noise
+        queries, _ = get_queries({"embedding_model": "test"}, vectors, 10, questions_path)
+        assert queries.shape == (10, 4) and not np.all(queries == 1)
+        missing_path = os.path.join(tmp_dir, "missing.jsonl")
+        assert get_queries({"embedding_model": EMBEDDING_MODEL}, vectors, 10, missing_path)[0].shape == (10, 4)
+
+
+def test_replace_rolls_back(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that the old database is restored if it is reopened between the two renames of the swap."""
+
+    vectors = np.random.default_rng(0).normal(size=(50, 4)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "test.db")
+        create_database(db_path, vectors)
+        metadata, segments = read_collection(db_path)
+
+        # A client opened after the old database is moved away creates an empty database in its place
+        rename = os.rename
+
+        def reopen_between_renames(src: str, dst: str) -> None:
+            rename(src, dst)
+            if dst.endswith(".old"):
+                chromadb.PersistentClient(db_path)
+
+        monkeypatch.setattr(os, "rename", reopen_between_renames)
+        with pytest.raises(RuntimeError):
+            replace_collection(db_path, metadata, segments, {"M": 8, "construction_ef": 50, "search_ef": 40})
+        monkeypatch.undo()
+
+        restored = chromadb.PersistentClient(db_path).get_collection(TABLE_NAME)
+        assert restored.count() == len(vectors)
+        assert get_hnsw_params(restored.metadata) == {"M": 16, "construction_ef": 100, "search_ef": 10}
+        assert not os.path.exists(db_path + ".old") and not os.path.exists(db_path + ".tmp")
+
+
+if __name__ == "__main__":
+    test_exact_top_k()
+    test_tune_and_apply()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_get_queries(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_replace_rolls_back(monkeypatch)
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+
+# Importing these modules must not load the embedding model, the LLM client libraries or the UI
+LIGHT_MODULES = ["models.llm", "models.retrieval", "models.etl", "utils.embedding_utils", "main", "run_etl", "run_batch", "tune_hnsw", "reembed_db"]
+HEAVY_MODULES = ["torch", "transformers", "openai", "gradio"]
+
+
+def test_imports_are_lazy() -> None:
+    """Tests that importing the top-level modules does not pull in the model, the OpenAI client or Gradio."""
+
+    code = (
+        "import sys\n"
+        + "".join(f"import {module}\n" for module in LIGHT_MODULES)
+        + f"print([name for name in {HEAVY_MODULES} if name in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip().splitlines()[-1] == "[]"
+
+
+def test_main_resources_are_lazy() -> None:
+    """Tests that importing main does not open the answer cache or start the query executor."""
+
+    code = "import main\nprint(main.answer_cache is None and main.query_executor is None)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip().splitlines()[-1] == "True"
+
+
+if __name__ == "__main__":
+    test_imports_are_lazy()
+    test_main_resources_are_lazy()
@@ -0,0 +1,139 @@
+import contextlib
+import io
+import json
+import time
+import urllib.request
+
+from utils import instrumentation
+from utils.general_utils import timeit
+from utils.pipeline_utils import Stage, run_pipeline
+from utils.instrumentation import (
+    Histogram,
+    JsonLinesExporter,
+    PrometheusServer,
+    increment,
+    record_span,
+    registry,
+    render_prometheus,
+    span,
+)
+
+
+def test_histogram() -> None:
+    """Tests that percentiles are estimated within the bucket of the observation."""
+
+    histogram = Histogram(buckets=(1.0, 2.0, 4.0))
+    for value in [0.5] * 50 + [3.0] * 50:
+        histogram.observe(value)
+
+    assert histogram.count == 100 and histogram.sum == 175.0
+    assert 0.0 < histogram.percentile(25) <= 1.0
+    assert 2.0 < histogram.percentile(99) <= 4.0
+
+
+def test_spans_and_exporters() -> None:
+    """Tests that nested spans are recorded with their parents and exported as JSON lines and Prometheus text."""
+
+    registry.reset()
+    stream = io.StringIO()
+    exporter = JsonLinesExporter()
+    exporter.stream = stream
+    registry.add_exporter(exporter)
+    try:
+        with span("query", question="q"):
+            with span("search"):
+                time.sleep(0.001)
+            record_span("llm", 0.25, model="stub")
+        increment("segments_retrieved", 5)
+    finally:
+        registry.exporters.remove(exporter)
+
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [event["path"] for event in events] == ["query/search", "query/llm", "query"]
+    assert events[0]["duration_ms"] >= 1.0 and events[2]["question"] == "q"
+
+    snapshot = registry.snapshot()
+    assert snapshot["counters"] == {"segments_retrieved": 5}
+    assert snapshot["spans"]["llm"]["count"] == 1
+
+    text = render_prometheus()
+    assert "huberman_qa_segments_retrieved_total 5" in text
+    assert 'huberman_qa_span_seconds_bucket{span="llm",le="0.25"} 1' in text
+    assert 'huberman_qa_span_seconds_count{span="query"} 1' in text
+
+    # The same text is served at /metrics
+    server = PrometheusServer(port=0, host="127.0.0.1").start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            assert response.read().decode() == render_prometheus()
+    finally:
+        server.stop()
+
+
+def test_pipeline_spans() -> None:
+    """Tests that timed functions and the stages of a pipeline they run are recorded as nested spans."""
+
+    registry.reset()
+    stream = io.StringIO()
+    exporter = JsonLinesExporter()
+    exporter.stream = stream
+    registry.add_exporter(exporter)
+
+    @timeit
+    def load(items: list) -> None:
+        run_pipeline(items, [Stage("fetch", lambda item: item, workers=2), Stage("upsert", lambda item: None)])
+
+    try:
+        load([1, 2, 3])
+    finally:
+        registry.exporters.remove(exporter)
+
+    paths = [json.loads(line)["path"] for line in stream.getvalue().splitlines()]
+    assert paths.count("load/fetch") == 3 and paths.count("load/upsert") == 3
+    assert paths[-1] == "load"
+
+
+def test_disabled() -> None:
+    """Tests that nothing is recorded when instrumentation is disabled, while timeit still returns the result."""
+
+    registry.reset()
+    registry.enabled = False
+    try:
+        with span("query") as query_span:
+            query_span.set_attribute("cached", True)
+        increment("answer_cache_hits")
+        assert timeit(lambda: 42)() == 42
+    finally:
+        registry.enabled = instrumentation.INSTRUMENTATION_ENABLED
+
+    assert registry.snapshot() == {"counters": {}, "spans": {}}
+
+
+def test_timeit_prints_without_exporters() -> None:
+    """Tests that timeit prints the wall time while no exporter is configured, and only exports the span otherwise."""
+
+    registry.reset()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        assert timeit(lambda: 42)() == 42
+    assert output.getvalue().startswith("<lambda> took ")
+
+    exporter = JsonLinesExporter()
+    exporter.stream = io.StringIO()
+    registry.add_exporter(exporter)
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            timeit(lambda: 42)()
+    finally:
+        registry.exporters.remove(exporter)
+    assert output.getvalue() == ""
+    assert registry.snapshot()["spans"]["<lambda>"]["count"] == 2
+
+
+if __name__ == "__main__":
+    test_histogram()
+    test_spans_and_exporters()
+    test_pipeline_spans()
+    test_disabled()
+    test_timeit_prints_without_exporters()
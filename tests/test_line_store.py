@@ -0,0 +1,48 @@
+import os
+import tempfile
+
+from models.etl import format_transcript
+from utils.line_store import LineStore, compact_metadata
+
+VIDEO = {"id": "abc", "title": "Sleep & Light — Episode 1"}
+TRANSCRIPT = [
+    {"text": f"line {i} about sleep, café and light", "start": i * 2.5, "duration": 2.5}
+    for i in range(23)
+]
+
+
+def test_compact_windows_rebuild_the_same_segments() -> None:
+    """Tests that windows stored as line ranges rebuild the text and metadata of the full segments."""
+
+    segments = format_transcript(TRANSCRIPT, VIDEO["id"], VIDEO["title"], batch_size=5, overlap=2)
+    for segment in segments:
+        segment["metadata"]["transcript_hash"] = "hash1"
+    assert segments[-1]["lines"] == (21, 23)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        line_store = LineStore(os.path.join(tmp_dir, "test.lines"))
+        line_store.save_video(VIDEO, TRANSCRIPT, "hash1")
+
+        ids = [segment["metadata"]["segment_id"] for segment in segments]
+        documents, metadatas = LineStore(line_store.path).expand(
+            ids, [None] * len(ids), [compact_metadata(segment) for segment in segments]
+        )
+        assert documents == [segment["text"] for segment in segments]
+        assert metadatas == [segment["metadata"] for segment in segments]
+
+        # Segments stored with their text are returned as they are
+        assert line_store.expand(["x__0"], ["text"], [{"title": "t"}]) == (["text"], [{"title": "t"}])
+
+        # A reloaded video is read again when a window carries its new hash
+        line_store.get_video(VIDEO["id"])
+        changed = [{**entry, "text": entry["text"].upper()} for entry in TRANSCRIPT]
+        LineStore(line_store.path).save_video(VIDEO, changed, "hash2")
+        metadata = {**compact_metadata(segments[0]), "transcript_hash": "hash2"}
+        assert line_store.get_window(ids[0], metadata)[0] == segments[0]["text"].upper()
+
+        line_store.delete_video(VIDEO["id"])
+        assert not os.path.exists(os.path.join(line_store.path, "abc.npz"))
+
+
+if __name__ == "__main__":
+    test_compact_windows_rebuild_the_same_segments()
@@ -0,0 +1,73 @@
+import asyncio
+
+import openai
+import pytest
+
+from models import llm
+from utils.stub_llm import StubLLMServer, stub_answer
+
+from constants import FITNESS_TEST_QUESTION, FITNESS_TEST_QUESTION_1
+
+TEST_SEGMENTS = {
+    "ids": [["video_a__0"]],
+    "documents": [["Sprint intervals improve anaerobic capacity."]],
+    "metadatas": [
+        [{"title": "Video A", "source": "https://www.youtube.com/watch?v=video_a&t=0s"}]
+    ],
+}
+
+
+def test_streaming_with_fake_server(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests the blocking and streaming LLM answers against a local OpenAI-compatible server."""
+
+    server = StubLLMServer().start()
+    try:
+        monkeypatch.setattr(llm, "client", openai.OpenAI(base_url=server.url, api_key="stub"))
+        question = FITNESS_TEST_QUESTION
+        expected = stub_answer(llm.build_messages(question, TEST_SEGMENTS))
+
+        answer = llm.answer_with_context(question, TEST_SEGMENTS)
+        assert answer == expected
+
+        tokens = list(llm.stream_answer_with_context(question, TEST_SEGMENTS))
+        assert len(tokens) > 1
+        assert "".join(tokens) == expected
+        assert server.calls == 2
+    finally:
+        server.stop()
+
+
+def test_async_with_fake_server(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests the async blocking and streaming LLM answers against a local OpenAI-compatible server."""
+
+    server = StubLLMServer().start()
+
+    async def ask(question: str) -> tuple:
+        answer = await llm.async_answer_with_context(question, TEST_SEGMENTS)
+        tokens = [
+            token async for token in llm.async_stream_answer_with_context(question, TEST_SEGMENTS)
+        ]
+        return answer, tokens
+
+    async def ask_all(questions: list) -> list:
+        return await asyncio.gather(*(ask(question) for question in questions))
+
+    try:
+        monkeypatch.setattr(llm, "async_client", openai.AsyncOpenAI(base_url=server.url, api_key="stub"))
+        questions = [FITNESS_TEST_QUESTION, FITNESS_TEST_QUESTION_1]
+        results = asyncio.run(ask_all(questions))
+
+        for question, (answer, tokens) in zip(questions, results):
+            expected = stub_answer(llm.build_messages(question, TEST_SEGMENTS))
+            assert answer == expected
+            assert "".join(tokens) == expected
+        assert server.calls == 4
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_streaming_with_fake_server(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_async_with_fake_server(monkeypatch)
@@ -0,0 +1,137 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+import openai
+import pytest
+
+import main
+from models import llm
+from utils.answer_cache import AnswerCache
+from utils.instrumentation import JsonLinesExporter, registry, span
+from utils.stub_llm import StubLLMServer, stub_answer
+
+QUESTIONS = [f"What is the best way to train for event {i}?" for i in range(6)]
+
+
+class FakeRetriever:
+    """Returns one fixed segment of a different video for each question."""
+
+    def embed_query(self, query: str) -> np.ndarray:
+        with span("embed"):
+            return np.eye(8, dtype=np.float32)[len(query) % 8]
+
+    def search(self, query: str, query_embedding: np.ndarray, n_results: int) -> dict:
+        video_id = f"video_{int(np.argmax(query_embedding))}"
+        return {
+            "ids": [[f"{video_id}__0"]],
+            "distances": [[0.1]],
+            "documents": [[f"Text of {video_id}."]],
+            "metadatas": [[{"video_id": video_id, "title": video_id, "source": f"https://www.youtube.com/watch?v={video_id}&t=0s"}]],
+        }
+
+
+def test_run_query_async(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that async queries are answered through the stub server, that no more than MAX_CONCURRENT_QUERIES reach
+    the LLM at once, and that answers are cached off the event loop."""
+
+    server = StubLLMServer(delay=0.1).start()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = AnswerCache(path=os.path.join(tmp_dir, "answer_cache.sqlite3"))
+        monkeypatch.setattr(main, "answer_cache", cache)
+        monkeypatch.setattr(main, "MAX_CONCURRENT_QUERIES", 2)
+        monkeypatch.setattr(main, "CONTEXT_MAX_TOKENS", None)
+        monkeypatch.setattr(main.retrieval, "get_retriever", lambda db_path: FakeRetriever())
+        monkeypatch.setattr(llm, "async_client", openai.AsyncOpenAI(base_url=server.url, api_key="stub"))
+
+        # Count the LLM calls in flight
+        in_flight, max_in_flight = 0, 0
+        async_answer_with_context = llm.async_answer_with_context
+
+        async def counting_answer(*args, **kwargs) -> str:
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            try:
+                return await async_answer_with_context(*args, **kwargs)
+            finally:
+                in_flight -= 1
+
+        monkeypatch.setattr(llm, "async_answer_with_context", counting_answer)
+
+        # Record the threads the cache is written from
+        put_threads = []
+        put = cache.put
+
+        def recording_put(*args, **kwargs) -> None:
+            put_threads.append(threading.current_thread())
+            put(*args, **kwargs)
+
+        monkeypatch.setattr(cache, "put", recording_put)
+
+        async def ask_all() -> list:
+            return await asyncio.gather(*(main.run_query_async(question) for question in QUESTIONS))
+
+        try:
+            answers = asyncio.run(ask_all())
+            for question, answer in zip(QUESTIONS, answers):
+                retriever = FakeRetriever()
+                segments = retriever.search(question, retriever.embed_query(question), 1)
+                assert answer == stub_answer(llm.build_messages(question, segments))
+            assert server.calls == len(QUESTIONS)
+            assert max_in_flight == 2
+            assert len(put_threads) == len(QUESTIONS)
+            assert threading.main_thread() not in put_threads
+
+            # Asking again is served from the cache without reaching the LLM
+            assert asyncio.run(ask_all()) == answers
+            assert server.calls == len(QUESTIONS)
+        finally:
+            server.stop()
+
+
+def test_run_query_stream_async(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that the async stream yields the answer so far and that retrieval spans are children of the query span."""
+
+    server = StubLLMServer().start()
+    stream = io.StringIO()
+    exporter = JsonLinesExporter()
+    exporter.stream = stream
+    registry.add_exporter(exporter)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        monkeypatch.setattr(main, "answer_cache", AnswerCache(path=os.path.join(tmp_dir, "answer_cache.sqlite3")))
+        monkeypatch.setattr(main, "CONTEXT_MAX_TOKENS", None)
+        monkeypatch.setattr(main.retrieval, "get_retriever", lambda db_path: FakeRetriever())
+        monkeypatch.setattr(llm, "async_client", openai.AsyncOpenAI(base_url=server.url, api_key="stub"))
+
+        async def ask(question: str) -> list:
+            return [answer async for answer in main.run_query_stream_async(question)]
+
+        try:
+            question = QUESTIONS[0]
+            answers = asyncio.run(ask(question))
+            retriever = FakeRetriever()
+            segments = retriever.search(question, retriever.embed_query(question), 1)
+            assert len(answers) > 1 and answers[-1] == stub_answer(llm.build_messages(question, segments))
+
+            # The cached answer is yielded at once
+            assert asyncio.run(ask(question)) == answers[-1:]
+        finally:
+            registry.exporters.remove(exporter)
+            server.stop()
+
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    paths = [event["path"] for event in events]
+    assert paths.count("query/embed") == 2 and paths.count("query") == 2 and "llm" in paths
+    assert [event.get("cached") for event in events if event["path"] == "query"] == [None, True]
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_run_query_async(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_run_query_stream_async(monkeypatch)
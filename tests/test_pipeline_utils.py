@@ -0,0 +1,78 @@
+import threading
+
+from utils.pipeline_utils import Stage, run_pipeline
+
+
+def run_with_timeout(source, stages: list, timeout: float = 10.0) -> list:
+    """Runs the pipeline on a thread and returns the exceptions it raised, failing if it does not finish in time."""
+
+    errors = []
+
+    def target() -> None:
+        try:
+            run_pipeline(source, stages, queue_size=2)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "pipeline deadlocked"
+    return errors
+
+
+def test_pipeline_order() -> None:
+    """Tests that every item passes through every stage, in source order when each stage has one worker."""
+
+    written = []
+    stages = [
+        Stage("double", lambda item: item * 2),
+        Stage("increment", lambda item: item + 1),
+        Stage("write", written.append),
+    ]
+
+    assert run_with_timeout(range(50), stages) == []
+    assert written == [item * 2 + 1 for item in range(50)]
+    assert [stage.items for stage in stages] == [50, 50, 50]
+
+
+def test_pipeline_drops_none() -> None:
+    """Tests that items a stage returns None for are dropped before the next stage."""
+
+    written = []
+    stages = [
+        Stage("filter", lambda item: item if item % 3 else None),
+        Stage("write", written.append),
+    ]
+
+    assert run_with_timeout(range(10), stages) == []
+    assert written == [1, 2, 4, 5, 7, 8]
+    assert stages[1].items == 6
+
+
+def test_pipeline_error() -> None:
+    """Tests that an exception in a stage stops the pipeline, without deadlocking on full queues, and is re-raised."""
+
+    def fail_on_five(item: int) -> int:
+        if item == 5:
+            raise ValueError("stage failed")
+        return item
+
+    written = []
+    stages = [
+        Stage("fail", fail_on_five),
+        Stage("write", written.append),
+    ]
+
+    # The source is longer than the queues hold, so it is still being fed when the stage fails
+    errors = run_with_timeout(range(1000), stages)
+    assert len(errors) == 1 and isinstance(errors[0], ValueError)
+
+    # Items after the failing one never reach the next stage; earlier ones may be dropped on stopping
+    assert written == list(range(len(written))) and len(written) <= 5
+
+
+if __name__ == "__main__":
+    test_pipeline_order()
+    test_pipeline_drops_none()
+    test_pipeline_error()
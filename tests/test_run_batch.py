@@ -0,0 +1,187 @@
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import run_batch
+from models import llm
+from utils.stub_llm import StubOpenAIClient
+
+QUESTIONS = [
+    {"id": "q1", "question": "How does caffeine affect my workout?"},
+    {"id": "q2", "question": "What is zone two training?"},
+    {"id": "q3", "question": "how does caffeine affect my workout"},
+    {"question": "Should I get morning sunlight?"},
+]
+
+
+class FakeRetriever:
+    """Returns one fixed segment of a different video for each query."""
+
+    mode = "vector"
+    store = "chroma"
+
+    def embed_queries(self, queries: list) -> np.ndarray:
+        return np.eye(8, dtype=np.float32)[[len(query) % 8 for query in queries]]
+
+    def query_by_embeddings(self, query_embeddings: np.ndarray, n_results: int) -> list:
+        return [self._result(int(np.argmax(query_embedding))) for query_embedding in query_embeddings]
+
+    def hybrid_search(self, query: str, query_embedding: np.ndarray, n_results: int) -> dict:
+        return self._result(int(np.argmax(query_embedding)))
+
+    @staticmethod
+    def _result(video: int) -> dict:
+        video_id = f"video_{video}"
+        return {
+            "ids": [[f"{video_id}__0"]],
+            "distances": [[0.1]],
+            "documents": [[f"Text of {video_id}."]],
+            "metadatas": [
+                [
+                    {
+                        "video_id": video_id,
+                        "segment_id": f"{video_id}__0",
+                        "title": video_id,
+                        "source": f"https://www.youtube.com/watch?v={video_id}&t=0s",
+                    }
+                ]
+            ],
+        }
+
+
+class RateLimitError(Exception):
+    """An error shaped like openai.RateLimitError, asking to retry right away."""
+
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after": "0"})
+
+
+class RateLimitedClient(StubOpenAIClient):
+    """Fails the first `failures` completions with a rate limit, then answers like the stub."""
+
+    def __init__(self, failures: int) -> None:
+        super().__init__()
+        self.failures = failures
+
+    def create(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RateLimitError("Rate limit reached")
+        return super().create(*args, **kwargs)
+
+
+class FailingClient(StubOpenAIClient):
+    """Fails the completions of questions containing `text` with an error that is not retried."""
+
+    def __init__(self, text: str) -> None:
+        super().__init__()
+        self.text = text
+
+    def create(self, model: str, messages: list, **kwargs):
+        if self.text in messages[-1]["content"]:
+            raise ValueError("Invalid request")
+        return super().create(model, messages, **kwargs)
+
+
+def count_words(texts: list) -> list:
+    """Counts words in place of tokens, so the tests do not load the tokenizer."""
+
+    return [len(text.split()) for text in texts]
+
+
+def read_records(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def write_questions(tmp_dir: str) -> tuple:
+    """Writes the test questions and returns the input and output paths."""
+
+    input_path = os.path.join(tmp_dir, "questions.jsonl")
+    output_path = os.path.join(tmp_dir, "answers.jsonl")
+    with open(input_path, "w") as f:
+        f.write("".join(json.dumps(question) + "\n" for question in QUESTIONS))
+    return input_path, output_path
+
+
+def test_batch_answers_in_order(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that answers are written in input order, repeated questions are answered once and rate limits are
+    retried."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path, output_path = write_questions(tmp_dir)
+
+        monkeypatch.setattr(llm, "client", RateLimitedClient(failures=1))
+        summary = run_batch.run_batch(
+            input_path,
+            output_path,
+            use_cache=False,
+            batch_size=2,
+            llm_workers=2,
+            retriever=FakeRetriever(),
+            token_counter=count_words,
+        )
+        records = read_records(output_path)
+
+        assert [record["id"] for record in records] == ["q1", "q2", "q3", 4]
+        assert all(record["answer"] and record["error"] is None for record in records)
+        assert records[2]["duplicate"] and records[2]["answer"] == records[0]["answer"]
+        assert sum(record["retries"] for record in records if not record["duplicate"]) == 1
+        assert set(records[0]["timings_ms"]) == {"embed", "search", "context", "llm"}
+        assert llm.client.calls == 3
+        assert summary["unique"] == 3 and summary["errors"] == 0
+
+
+def test_batch_resumes(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that an interrupted run is resumed after its last complete record."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path, output_path = write_questions(tmp_dir)
+
+        # Two complete records and a partial one
+        with open(output_path, "w") as f:
+            f.write('{"id": "q1"}\n{"id": "q2"}\n{"id": "q3", "ans')
+
+        monkeypatch.setattr(llm, "client", StubOpenAIClient())
+        summary = run_batch.run_batch(
+            input_path, output_path, use_cache=False, retriever=FakeRetriever(), token_counter=count_words
+        )
+
+        assert [record["id"] for record in read_records(output_path)] == ["q1", "q2", "q3", 4]
+        assert summary["skipped"] == 2
+        assert llm.client.calls == 2
+
+
+def test_batch_retries_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that questions whose LLM call failed are recorded with the error and retried when the run is resumed."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path, output_path = write_questions(tmp_dir)
+
+        monkeypatch.setattr(llm, "client", FailingClient("zone two"))
+        summary = run_batch.run_batch(
+            input_path, output_path, use_cache=False, retriever=FakeRetriever(), token_counter=count_words
+        )
+        records = read_records(output_path)
+        assert records[1]["id"] == "q2" and records[1]["error"].startswith("ValueError")
+        assert summary["errors"] == 1
+
+        monkeypatch.setattr(llm, "client", StubOpenAIClient())
+        summary = run_batch.run_batch(
+            input_path, output_path, use_cache=False, retriever=FakeRetriever(), token_counter=count_words
+        )
+        records = read_records(output_path)
+        assert [record["id"] for record in records] == ["q1", "q3", 4, "q2"]
+        assert all(record["error"] is None for record in records)
+        assert summary["skipped"] == 3 and summary["errors"] == 0
+        assert llm.client.calls == 1
+
+
+if __name__ == "__main__":
+    for test in (test_batch_answers_in_order, test_batch_resumes, test_batch_retries_errors):
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test(monkeypatch)
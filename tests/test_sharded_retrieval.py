@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from models.sharded_retrieval import ShardedRetriever, merge_results, shard_matches
+
+
+class FakeRetriever:
+    """Returns fixed segments with distances for any query."""
+
+    mode = "vector"
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.segments = {
+            "a.db": [("a__0", 0.1), ("a__5", 0.4)],
+            "b.db": [("b__0", 0.2), ("b__5", 0.3)],
+            "c.db": [("c__0", 0.05)],
+        }[db_path]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return np.zeros(4, dtype=np.float32)
+
+    def search(self, query: str, query_embedding: np.ndarray, n_results: int) -> dict:
+        segments = self.segments[:n_results]
+        return {
+            "ids": [[id for id, _ in segments]],
+            "distances": [[distance for _, distance in segments]],
+            "documents": [[f"text of {id}" for id, _ in segments]],
+            "metadatas": [[{"segment_id": id} for id, _ in segments]],
+        }
+
+
+def test_merge_results() -> None:
+    """Tests that shard results are merged by distance, deduplicated and tagged with their shard."""
+
+    a = {"ids": [["x__0", "y__0"]], "distances": [[0.3, 0.5]], "documents": [["x", "y"]], "metadatas": [[{}, {}]]}
+    b = {"ids": [["x__0", "z__0"]], "distances": [[0.2, 0.4]], "documents": [["x", "z"]], "metadatas": [[{}, {}]]}
+    merged = merge_results([("a", a), ("b", b)], n_results=3)
+
+    assert merged["ids"][0] == ["x__0", "z__0", "y__0"]
+    assert merged["distances"][0] == [0.2, 0.4, 0.5]
+    assert [metadata["shard"] for metadata in merged["metadatas"][0]] == ["b", "b", "a"]
+
+    # Hybrid shards are merged by rank: segments both shards rank highly come first, whatever their distances
+    a = {"ids": [["x__0", "y__0"]], "distances": [[None, 0.1]], "documents": [["x", "y"]], "metadatas": [[{}, {}]]}
+    b = {"ids": [["z__0", "x__0"]], "distances": [[0.9, 0.8]], "documents": [["z", "x"]], "metadatas": [[{}, {}]]}
+    merged = merge_results([("a", a), ("b", b)], n_results=3, by_rank=True)
+
+    assert merged["ids"][0] == ["x__0", "z__0", "y__0"]
+    assert merged["distances"][0] == [None, 0.9, 0.1]
+    assert [metadata["shard"] for metadata in merged["metadatas"][0]] == ["a", "b", "a"]
+
+
+def test_sharded_retriever() -> None:
+    """Tests the global top k over all shards and routing by shard metadata."""
+
+    retriever = ShardedRetriever(
+        [
+            {"db_path": "a.db", "playlist": "fitness"},
+            {"db_path": "b.db", "playlist": "fitness"},
+            {"db_path": "c.db", "playlist": "sleep"},
+        ],
+        make_retriever=FakeRetriever,
+    )
+
+    assert retriever.query("question", n_results=3)["ids"][0] == ["c__0", "a__0", "b__0"]
+    assert retriever.query("question", n_results=3, where={"playlist": "fitness"})["ids"][0] == [
+        "a__0",
+        "b__0",
+        "b__5",
+    ]
+    assert retriever.select_shards({"playlist": ["sleep", "recovery"]}) == ["c"]
+    assert shard_matches({"playlist": "fitness"}, {"playlist": "fitness"})
+    assert not shard_matches({"playlist": "fitness"}, {"chunking": "lines15"})
+
+    # An explicit empty list of shards is an error rather than the shards in constants
+    with pytest.raises(ValueError):
+        ShardedRetriever([], make_retriever=FakeRetriever)
+
+
+if __name__ == "__main__":
+    test_merge_results()
+    test_sharded_retriever()
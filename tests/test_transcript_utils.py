@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+
+from utils.transcript_utils import JsonTranscriptFetcher, fetch_transcripts
+
+TEST_TRANSCRIPT = [
+    {"text": "Welcome to the podcast.", "start": 0.0, "duration": 2.5},
+    {"text": "Today we talk about recovery.", "start": 2.5, "duration": 3.0},
+]
+
+
+class FlakyFetcher(JsonTranscriptFetcher):
+    """A fixture fetcher that fails the first time each video is requested and counts the calls."""
+
+    def __init__(self, fixtures_dir: str) -> None:
+        super().__init__(fixtures_dir)
+        self.calls = {}
+
+    def get_transcript(self, video_id: str, languages: list = None) -> list:
+        self.calls[video_id] = self.calls.get(video_id, 0) + 1
+        if self.calls[video_id] == 1:
+            raise ConnectionError("Simulated network failure")
+        return super().get_transcript(video_id, languages)
+
+
+def test_fetch_transcripts() -> None:
+    """Tests concurrent fetching with retries, the raw transcript cache, and missing videos."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixtures_dir = os.path.join(tmp_dir, "fixtures")
+        cache_dir = os.path.join(tmp_dir, "cache")
+        os.makedirs(fixtures_dir)
+        for video_id in ["video_a", "video_b"]:
+            with open(os.path.join(fixtures_dir, f"{video_id}.json"), "w") as f:
+                json.dump(TEST_TRANSCRIPT, f)
+
+        # Each video fails once and is retried, the missing video fails every attempt
+        fetcher = FlakyFetcher(fixtures_dir)
+        transcripts = fetch_transcripts(
+            ["video_a", "video_b", "missing"],
+            fetcher=fetcher,
+            cache_dir=cache_dir,
+            backoff=0.01,
+        )
+
+        assert list(transcripts) == ["video_a", "video_b", "missing"]
+        assert transcripts["video_a"] == TEST_TRANSCRIPT
+        assert transcripts["missing"] is None
+        assert fetcher.calls["video_a"] == 2
+
+        # A rerun is served from the cache without calling the fetcher
+        fetcher.calls = {}
+        transcripts = fetch_transcripts(
+            ["video_a", "video_b"], fetcher=fetcher, cache_dir=cache_dir
+        )
+
+        assert transcripts["video_b"] == TEST_TRANSCRIPT
+        assert fetcher.calls == {}
+
+
+if __name__ == "__main__":
+    test_fetch_transcripts()
@@ -0,0 +1,110 @@
+import os
+import tempfile
+
+import chromadb
+import numpy as np
+
+from utils.vector_store import (
+    VectorStore,
+    export_vector_store,
+    get_vector_store_path,
+    get_vector_store_versions,
+    remove_vector_store,
+)
+from constants import TABLE_NAME
+
+
+def test_vector_store() -> None:
+    """Tests that float16 and int8 stores exported from Chroma return the same neighbours as Chroma."""
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    queries = rng.normal(size=(10, 16)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "test.db")
+        # A wide HNSW search makes Chroma exact on this small collection, so its neighbours can be compared one to one
+        collection = chromadb.PersistentClient(db_path).create_collection(
+            TABLE_NAME, metadata={"hnsw:space": "cosine", "hnsw:construction_ef": 400, "hnsw:search_ef": 400}
+        )
+        ids = [f"video__{i}" for i in range(len(vectors))]
+        collection.add(
+            ids=ids,
+            embeddings=vectors.tolist(),
+            documents=[f"segment {i}" for i in range(len(vectors))],
+            metadatas=[{"segment_id": id} for id in ids],
+        )
+        expected = collection.query(query_embeddings=queries.tolist(), n_results=5)
+
+        assert get_vector_store_path(db_path) == os.path.join(tmp_dir, "test.vectors")
+        for dtype in ("float16", "int8"):
+            info = export_vector_store(db_path, dtype=dtype)
+            assert info["count"] == len(vectors) and info["metric"] == "cosine"
+
+            results = VectorStore(get_vector_store_path(db_path)).query(queries, n_results=5)
+            for i, result in enumerate(results):
+                assert result["ids"][0][0] == expected["ids"][i][0]
+                assert len(set(result["ids"][0]) & set(expected["ids"][i])) >= 4
+                assert np.allclose(result["distances"][0], expected["distances"][i], atol=0.02)
+                assert result["documents"][0][0] == f"segment {ids.index(result['ids'][0][0])}"
+
+        # A query for no results returns none
+        assert VectorStore(get_vector_store_path(db_path)).query(queries[:2], n_results=0)[1]["ids"] == [[]]
+
+
+def test_empty_vector_store() -> None:
+    """Tests that a collection whose segments were all deleted exports to an empty store that returns no results."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "test.db")
+        collection = chromadb.PersistentClient(db_path).create_collection(TABLE_NAME)
+        collection.add(ids=["video__0"], embeddings=[[1.0, 0.0, 0.0]])
+        assert export_vector_store(db_path)["dimension"] == 3
+        collection.delete(ids=["video__0"])
+
+        # The empty collection has no vectors to measure, so the dimension of the existing store is kept
+        info = export_vector_store(db_path)
+        assert info["count"] == 0 and info["dimension"] == 3
+
+        store = VectorStore(get_vector_store_path(db_path))
+        assert len(store) == 0
+        results = store.query(np.array([[1.0, 0.0, 0.0]], dtype=np.float32), n_results=5)
+        assert results[0]["ids"] == [[]] and results[0]["distances"] == [[]]
+
+
+def test_reexport_swaps_versions() -> None:
+    """Tests that a re-export publishes a new version through the symlink, that a store opened before it keeps
+    working, and that only the current and previous versions are kept."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "test.db")
+        collection = chromadb.PersistentClient(db_path).create_collection(TABLE_NAME)
+        collection.add(ids=["video__0"], embeddings=[[1.0, 0.0, 0.0]], documents=["first"])
+        path = get_vector_store_path(db_path)
+
+        # A store exported before versioning is a plain directory, which becomes the oldest version
+        export_vector_store(db_path)
+        os.rename(os.path.realpath(path), path + ".legacy")
+        os.remove(path)
+        os.rename(path + ".legacy", path)
+        old_store = VectorStore(path)
+
+        collection.update(ids=["video__0"], embeddings=[[1.0, 0.0, 0.0]], documents=["second"])
+        export_vector_store(db_path)
+        assert os.path.islink(path)
+        assert VectorStore(path).documents == ["second"]
+        assert old_store.documents == ["first"] and len(old_store.query(np.ones((1, 3)), n_results=1)[0]["ids"][0]) == 1
+
+        export_vector_store(db_path)
+        versions = get_vector_store_versions(path)
+        assert len(versions) == 2 and versions[-1] == os.path.realpath(path)
+        assert not os.path.exists(path + ".tmp")
+
+        remove_vector_store(path)
+        assert not os.path.lexists(path) and get_vector_store_versions(path) == []
+
+
+if __name__ == "__main__":
+    test_vector_store()
+    test_empty_vector_store()
+    test_reexport_swaps_versions()
@@ -0,0 +1,51 @@
+import argparse
+import json
+
+from utils.hnsw_tuning import apply_hnsw_params, choose_params, tune_hnsw
+from constants import (
+    MAIN_VIDEOS_DB_PATH,
+    HNSW_TUNING_GRID,
+    HNSW_TUNING_K,
+    HNSW_TUNING_QUERIES,
+    HNSW_TARGET_RECALL,
+    EVAL_QUESTIONS_PATH,
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures recall and latency of a database's HNSW index over a grid of parameters and rebuilds "
+        "the database with the fastest parameters that reach the target recall."
+    )
+    parser.add_argument("db", nargs="?", default=MAIN_VIDEOS_DB_PATH, help="Database to tune.")
+    parser.add_argument("--M", type=int, nargs="+", default=HNSW_TUNING_GRID["M"], help="Values of M to try.")
+    parser.add_argument(
+        "--construction-ef", type=int, nargs="+", default=HNSW_TUNING_GRID["construction_ef"], help="Values of construction_ef to try."
+    )
+    parser.add_argument(
+        "--search-ef", type=int, nargs="+", default=HNSW_TUNING_GRID["search_ef"], help="Values of search_ef to try."
+    )
+    parser.add_argument("--k", type=int, default=HNSW_TUNING_K, help="Number of neighbours recall is measured at.")
+    parser.add_argument("--queries", type=int, default=HNSW_TUNING_QUERIES, help="Maximum number of queries measured.")
+    parser.add_argument(
+        "--questions", default=EVAL_QUESTIONS_PATH, help="Questions embedded as queries (stored vectors with noise if missing)."
+    )
+    parser.add_argument("--target-recall", type=float, default=HNSW_TARGET_RECALL, help="Recall the parameters must reach.")
+    parser.add_argument("--output", help="Write the results of every combination to this JSON file.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report, do not rebuild the database.")
+    args = parser.parse_args()
+
+    grid = {"M": args.M, "construction_ef": args.construction_ef, "search_ef": args.search_ef}
+    results = tune_hnsw(args.db, grid, k=args.k, num_queries=args.queries, questions_path=args.questions)
+    chosen = choose_params(results, target_recall=args.target_recall)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"db_path": args.db, "k": args.k, "results": results, "chosen": chosen}, f, indent=4)
+
+    if chosen["recall"] < args.target_recall:
+        print(f"No parameters reach recall@{args.k} {args.target_recall}; the highest recall is {chosen['recall']:.3f}.")
+    print(f"Chosen: {chosen['params']} (recall@{args.k} {chosen['recall']:.3f}, p95 {chosen['p95_ms']:.2f} ms)")
+
+    if not args.dry_run:
+        apply_hnsw_params(args.db, chosen["params"])
+        print(f"Database at {args.db} rebuilt with {chosen['params']}.")
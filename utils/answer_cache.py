@@ -0,0 +1,245 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+from constants import (
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SEMANTIC_THRESHOLD,
+)
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases the question, collapses whitespace and strips trailing punctuation."""
+
+    question = re.sub(r"\s+", " ", question.lower()).strip()
+    return question.rstrip("?!. ")
+
+
+class AnswerCache:
+    """A two-level cache of LLM answers, persisted in SQLite.
+
+    The exact tier matches the normalized question, the IDs of the retrieved segments and the query settings. The
+    optional semantic tier reuses an answer to a different question when the query embeddings are within a cosine
+    similarity threshold. Entries expire after a TTL and the least recently used entries are evicted above a size limit.
+
+    Functions:
+        scope: Returns the scope string of the query settings.
+        get: Returns the cached answer for the exact question and segments.
+        get_similar: Returns the cached answer of the most similar earlier question.
+        put: Adds an answer to the cache.
+        stats: Returns the hit/miss counters and the LLM time saved by hits.
+    """
+
+    def __init__(
+        self,
+        path: str = ANSWER_CACHE_PATH,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: float = ANSWER_CACHE_TTL,
+        semantic_threshold: float = ANSWER_CACHE_SEMANTIC_THRESHOLD,
+    ) -> None:
+        f"""Opens (or creates) the cache.
+
+        Args:
+            path (str): The path to the SQLite file. Default is {ANSWER_CACHE_PATH}.
+            max_entries (int): The maximum number of cached answers. Default is {ANSWER_CACHE_MAX_ENTRIES}.
+            ttl (float): The number of seconds an answer stays valid. Default is {ANSWER_CACHE_TTL}.
+            semantic_threshold (float): The minimum cosine similarity for a semantic hit, or None to disable the semantic tier. Default is {ANSWER_CACHE_SEMANTIC_THRESHOLD}.
+        """
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                scope TEXT NOT NULL,
+                query_embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                llm_seconds REAL NOT NULL,
+                created REAL NOT NULL
+            )
+            """
+        )
+
+        # Keep the entries in memory in least recently used order
+        self._entries = OrderedDict()
+        rows = self._conn.execute(
+            "SELECT key, scope, query_embedding, answer, llm_seconds, created FROM answers ORDER BY created"
+        ).fetchall()
+        for key, scope, query_embedding, answer, llm_seconds, created in rows:
+            self._entries[key] = {
+                "scope": scope,
+                "query_embedding": np.frombuffer(query_embedding, dtype=np.float32),
+                "answer": answer,
+                "llm_seconds": llm_seconds,
+                "created": created,
+            }
+
+    @staticmethod
+    def scope(db_path: str, n_results: int, model: str, temperature: float) -> str:
+        """Returns the scope string of the query settings. Answers are only reused within the same scope."""
+
+        return json.dumps([db_path, n_results, model, temperature])
+
+    @staticmethod
+    def _key(question: str, segment_ids: List[str], scope: str) -> str:
+        """Returns the exact-tier key of the normalized question, segment IDs and scope."""
+
+        content = json.dumps([normalize_question(question), segment_ids, scope])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, entry: dict) -> bool:
+        return self.ttl is not None and time.time() - entry["created"] > self.ttl
+
+    def _delete(self, key: str) -> None:
+        """Deletes an entry. Must be called with the lock held."""
+
+        del self._entries[key]
+        with self._conn:
+            self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+
+    def _hit(self, key: str) -> str:
+        """Marks the entry as recently used and returns its answer. Must be called with the lock held."""
+
+        self._entries.move_to_end(key)
+        entry = self._entries[key]
+        self.saved_seconds += entry["llm_seconds"]
+        return entry["answer"]
+
+    def get(self, question: str, segment_ids: List[str], scope: str) -> str:
+        """Returns the cached answer for the exact question and segments, or None.
+
+        Args:
+            question (str): The user's question.
+            segment_ids (list): The IDs of the retrieved segments, in order.
+            scope (str): The scope string of the query settings.
+
+        Returns:
+            str: The cached answer.
+        """
+
+        key = self._key(question, segment_ids, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                self._delete(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.exact_hits += 1
+            return self._hit(key)
+
+    def get_similar(self, query_embedding: np.ndarray, scope: str) -> str:
+        """Returns the cached answer of the most similar earlier question in the scope, or None if the semantic tier is disabled or no question is similar enough.
+
+        Args:
+            query_embedding (np.ndarray): The embedding of the user's question.
+            scope (str): The scope string of the query settings.
+
+        Returns:
+            str: The cached answer.
+        """
+
+        if self.semantic_threshold is None:
+            return None
+
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if self._is_expired(entry)]:
+                self._delete(key)
+
+            keys = [key for key, entry in self._entries.items() if entry["scope"] == scope]
+            if not keys:
+                return None
+
+            # Cosine similarity of the question to every cached question in the scope
+            embeddings = np.stack([self._entries[key]["query_embedding"] for key in keys])
+            similarities = embeddings @ query_embedding
+            similarities /= np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding) + 1e-12
+
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.semantic_threshold:
+                return None
+
+            self.semantic_hits += 1
+            return self._hit(keys[best])
+
+    def put(
+        self,
+        question: str,
+        segment_ids: List[str],
+        scope: str,
+        query_embedding: np.ndarray,
+        answer: str,
+        llm_seconds: float,
+    ) -> None:
+        """Adds an answer to the cache and evicts the least recently used answers if the cache is full.
+
+        Args:
+            question (str): The user's question.
+            segment_ids (list): The IDs of the retrieved segments, in order.
+            scope (str): The scope string of the query settings.
+            query_embedding (np.ndarray): The embedding of the user's question.
+            answer (str): The LLM answer.
+            llm_seconds (float): How long the LLM call took, counted as saved time on later hits.
+        """
+
+        key = self._key(question, segment_ids, scope)
+        entry = {
+            "scope": scope,
+            "query_embedding": np.asarray(query_embedding, dtype=np.float32),
+            "answer": answer,
+            "llm_seconds": llm_seconds,
+            "created": time.time(),
+        }
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        scope,
+                        entry["query_embedding"].tobytes(),
+                        answer,
+                        llm_seconds,
+                        entry["created"],
+                    ),
+                )
+
+            while len(self._entries) > self.max_entries:
+                self._delete(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters, the hit rate and the LLM time saved by hits."""
+
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from constants import QUERY_BATCH_MAX_WAIT, QUERY_BATCH_MAX_SIZE
+
+
+class MicroBatcher:
+    """Coalesces single-item calls from concurrent callers into batched calls.
+
+    The first waiting item opens a window of `max_wait` seconds. Items submitted during the window (up to
+    `max_batch_size`) are passed to the function together and each caller gets back its own result. With a batch
+    size of 1 items are processed directly on the caller's thread.
+
+    Functions:
+        submit: Processes one item as part of a batch and returns its result.
+        stats: Returns the number of batches and items processed and the mean batch size.
+    """
+
+    def __init__(
+        self,
+        func: Callable,
+        max_wait: float = QUERY_BATCH_MAX_WAIT,
+        max_batch_size: int = QUERY_BATCH_MAX_SIZE,
+    ) -> None:
+        f"""Initializes the batcher. The worker thread is started on the first submitted item.
+
+        Args:
+            func (Callable): Takes a list of items and returns a list of results in the same order.
+            max_wait (float): The number of seconds to wait for more items after the first. Default is {QUERY_BATCH_MAX_WAIT}.
+            max_batch_size (int): The maximum number of items in a batch. Default is {QUERY_BATCH_MAX_SIZE}.
+        """
+
+        self.func = func
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, item: Any) -> Any:
+        """Processes one item as part of a batch and returns its result. Blocks until the batch is done.
+
+        Args:
+            item (Any): The item to process.
+
+        Returns:
+            Any: The result of the item.
+        """
+
+        if self.max_batch_size <= 1:
+            with self._lock:
+                self.batches += 1
+                self.items += 1
+            return self.func([item])[0]
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _next_batch(self) -> list:
+        """Waits for an item, then collects more until the window closes or the batch is full."""
+
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                timeout = deadline - time.perf_counter()
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    # The window is closed, but take the items that are already waiting
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self.func([item for item, _ in batch])
+
+                # A short result list would otherwise leave the callers of the missing results waiting forever
+                if len(results) != len(batch):
+                    raise ValueError(f"Batch function returned {len(results)} results for {len(batch)} items.")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Returns the number of batches and items processed and the mean batch size."""
+
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            }
@@ -0,0 +1,191 @@
+import os
+import re
+from typing import List
+
+import numpy as np
+
+from constants import BM25_K1, BM25_B
+
+# Terms are runs of letters and digits, so "VO2 max" matches "vo2" and "max", and "zone 2" matches "zone" and "2"
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def get_bm25_index_path(db_path: str) -> str:
+    """Returns the path of the keyword index built for the database, e.g. data/videos.bm25.npz for data/videos.db."""
+
+    return os.path.splitext(os.path.normpath(db_path))[0] + ".bm25.npz"
+
+
+def tokenize_terms(text: str) -> List[str]:
+    """Lowercases the text and splits it into terms."""
+
+    return TERM_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """An inverted index of segment documents with BM25 scoring.
+
+    The postings are stored in compressed sparse row form: the postings of term t are the slice
+    offsets[t]:offsets[t + 1] of the document and weight arrays. Each weight is the full BM25 contribution of the
+    term to the document, so a query only sums the slices of its terms.
+
+    Functions:
+        build: Builds the index from segment IDs and documents.
+        load: Loads an index saved with save.
+        save: Saves the index to an .npz file.
+        search: Returns the best-scoring segments for a query.
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        terms: np.ndarray,
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        weights: np.ndarray,
+    ) -> None:
+        """Initializes the index from its arrays. Use build or load to create one.
+
+        Args:
+            ids (np.ndarray): The segment ID of each document.
+            terms (np.ndarray): The terms, in term ID order.
+            offsets (np.ndarray): The start of each term's postings, plus the total number of postings.
+            postings (np.ndarray): The document number of each posting.
+            weights (np.ndarray): The BM25 weight of each posting.
+        """
+
+        self.ids = ids
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.weights = weights
+        self.term_ids = {term: i for i, term in enumerate(terms.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        ids: List[str],
+        documents: List[str],
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ) -> "BM25Index":
+        f"""Builds the index from segment IDs and documents.
+
+        Args:
+            ids (list): The segment ID of each document.
+            documents (list): The text of each document.
+            k1 (float): The BM25 term frequency saturation. Default is {BM25_K1}.
+            b (float): The BM25 document length normalization. Default is {BM25_B}.
+
+        Returns:
+            BM25Index: The index.
+        """
+
+        # Count the terms of each document
+        term_ids = {}
+        posting_terms, posting_docs, posting_counts = [], [], []
+        doc_lengths = np.zeros(len(documents), dtype=np.float32)
+        for doc, text in enumerate(documents):
+            counts = {}
+            for term in tokenize_terms(text):
+                counts[term] = counts.get(term, 0) + 1
+            doc_lengths[doc] = sum(counts.values())
+            for term, count in counts.items():
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_docs.append(doc)
+                posting_counts.append(count)
+
+        # Group the postings by term
+        posting_terms = np.array(posting_terms, dtype=np.int32)
+        order = np.argsort(posting_terms, kind="stable")
+        posting_terms = posting_terms[order]
+        postings = np.array(posting_docs, dtype=np.int32)[order]
+        counts = np.array(posting_counts, dtype=np.float32)[order]
+        document_frequency = np.bincount(posting_terms, minlength=len(term_ids))
+        offsets = np.concatenate([[0], np.cumsum(document_frequency)]).astype(np.int64)
+
+        # Precompute the BM25 weight of each posting
+        num_docs = len(documents)
+        idf = np.log(1 + (num_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = float(doc_lengths.mean()) if num_docs else 1.0
+        lengths = doc_lengths[postings] / max(average_length, 1.0)
+        weights = idf[posting_terms] * counts * (k1 + 1) / (counts + k1 * (1 - b + b * lengths))
+
+        return cls(
+            ids=np.array(ids, dtype=str),
+            terms=np.array(list(term_ids), dtype=str),
+            offsets=offsets,
+            postings=postings,
+            weights=weights.astype(np.float32),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Loads an index saved with save."""
+
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def save(self, path: str) -> None:
+        """Saves the index to an .npz file, replacing an existing file once the new one is written."""
+
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            ids=self.ids,
+            terms=self.terms,
+            offsets=self.offsets,
+            postings=self.postings,
+            weights=self.weights,
+        )
+        os.replace(tmp_path, path)
+
+    def search(self, query: str, n_results: int) -> tuple:
+        """Returns the best-scoring segments for a query.
+
+        Args:
+            query (str): The user's query.
+            n_results (int): The maximum number of segments to return.
+
+        Returns:
+            tuple: The segment IDs (list) and their BM25 scores (np.ndarray), best first. Segments that share no
+            term with the query are not returned.
+        """
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize_terms(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is not None:
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                scores[self.postings[start:end]] += self.weights[start:end]
+
+        # Exact top-k: partition out the k best, then sort only those
+        n_results = min(n_results, int(np.count_nonzero(scores)))
+        if n_results == 0:
+            return [], np.zeros(0, dtype=np.float32)
+        best = np.argpartition(-scores, n_results - 1)[:n_results]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return self.ids[best].tolist(), scores[best]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], weights: List[float], k: int) -> List[str]:
+    """Fuses rankings of segment IDs by weighted reciprocal rank: each ranking adds weight / (k + rank) to the
+    score of its segments.
+
+    Args:
+        rankings (list): The segment IDs of each ranking, best first.
+        weights (list): The weight of each ranking.
+        k (int): The rank offset, which limits how much the top ranks dominate.
+
+    Returns:
+        list: The fused segment IDs, best first.
+    """
+
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,71 @@
+from typing import List, Tuple
+
+# Caption lines ending with one of these characters end a sentence
+SENTENCE_ENDINGS = (".", "?", "!")
+
+# A window is only cut back to a sentence boundary if it keeps at least this share of the token budget
+MIN_SENTENCE_FILL = 0.5
+
+
+def ends_sentence(text: str) -> bool:
+    """Returns whether the caption line ends a sentence."""
+
+    return text.rstrip().endswith(SENTENCE_ENDINGS)
+
+
+def get_token_windows(
+    texts: List[str], token_counts: List[int], max_tokens: int, token_overlap: int = 0
+) -> List[Tuple[int, int]]:
+    """Packs consecutive caption lines into windows of at most `max_tokens` tokens.
+
+    A window that fills its budget is cut back to the last line that ends a sentence, as long as it keeps at least
+    half of the budget. Each window starts with the last lines of the previous window, up to `token_overlap` tokens.
+    A single line longer than the budget gets a window of its own.
+
+    Args:
+        texts (list): The text of each caption line.
+        token_counts (list): The number of tokens in each caption line.
+        max_tokens (int): The token budget of a window.
+        token_overlap (int): The maximum number of tokens shared by consecutive windows. Default is 0.
+
+    Returns:
+        list: The (first line, last line + 1) index range of each window.
+    """
+
+    windows = []
+    start = 0
+    previous_end = 0
+
+    while start < len(texts):
+        # Add lines to the window until the next one would exceed the budget
+        end = start + 1
+        num_tokens = token_counts[start]
+        while end < len(texts) and num_tokens + token_counts[end] <= max_tokens:
+            num_tokens += token_counts[end]
+            end += 1
+
+        # If the window was cut by the budget, prefer to end it at a sentence boundary that still adds new lines
+        min_end = max(start, previous_end) + 1
+        if end < len(texts) and end > min_end:
+            sentence_end = end
+            sentence_tokens = num_tokens
+            while sentence_end > min_end and not ends_sentence(texts[sentence_end - 1]):
+                sentence_end -= 1
+                sentence_tokens -= token_counts[sentence_end]
+            if ends_sentence(texts[sentence_end - 1]) and sentence_tokens >= MIN_SENTENCE_FILL * max_tokens:
+                end = sentence_end
+
+        windows.append((start, end))
+        previous_end = end
+        if end == len(texts):
+            break
+
+        # Start the next window with the last lines of this one, up to the token overlap
+        next_start = end
+        overlap_tokens = 0
+        while next_start - 1 > start and overlap_tokens + token_counts[next_start - 1] <= token_overlap:
+            next_start -= 1
+            overlap_tokens += token_counts[next_start]
+        start = next_start
+
+    return windows
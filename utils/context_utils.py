@@ -0,0 +1,219 @@
+from typing import Callable, List
+
+from utils.bm25_index import tokenize_terms
+from constants import CONTEXT_MAX_TOKENS, CONTEXT_MMR_LAMBDA, CONTEXT_MIN_PASSAGE_TOKENS
+
+# Windows of the same video are only merged if they share at least this many words, unless one contains the other
+MIN_OVERLAP_WORDS = 3
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    """Returns the number of embedding-model tokens in each text."""
+
+    from utils.embedding_utils import tokenize
+
+    return [len(ids) for ids in tokenize(texts, add_special_tokens=False, verbose=False)["input_ids"]]
+
+
+def get_segment_index(segment_id: str) -> tuple:
+    """Returns the video ID and the index of the first caption line of a segment, e.g. ("abc", 15) for "abc__15"."""
+
+    video_id, index = segment_id.rsplit("__", 1)
+    return video_id, int(index)
+
+
+def merge_overlapping_text(first: str, second: str) -> str | None:
+    """Joins two windows of the same transcript, where the second starts inside the first.
+
+    Args:
+        first (str): The text of the earlier window.
+        second (str): The text of the later window.
+
+    Returns:
+        str | None: The text covered by both windows without the shared words, or None if they do not overlap.
+    """
+
+    first_words = first.split()
+    second_words = second.split()
+    if not first_words or not second_words:
+        return None
+
+    # The longest overlap starts at the earliest position of the first window that matches the second's start
+    for position, word in enumerate(first_words):
+        if word != second_words[0]:
+            continue
+        overlap = min(len(first_words) - position, len(second_words))
+        contained = overlap == len(second_words)
+        if not contained and overlap < MIN_OVERLAP_WORDS:
+            break
+        if first_words[position : position + overlap] == second_words[:overlap]:
+            return first if contained else " ".join(first_words + second_words[overlap:])
+    return None
+
+
+def merge_overlapping_windows(results: dict) -> List[dict]:
+    """Merges retrieved windows of the same video that share text into single passages.
+
+    Args:
+        results (dict): The single-query results of a database query.
+
+    Returns:
+        list: The passages in rank order, each a dict with the id, document, metadata and distance of its first
+        window and the rank of its best-ranked window.
+    """
+
+    # Group the windows by video, in transcript order
+    windows_by_video = {}
+    for rank, id in enumerate(results["ids"][0]):
+        distances = results.get("distances")
+        window = {
+            "id": id,
+            "document": results["documents"][0][rank],
+            "metadata": results["metadatas"][0][rank],
+            "distance": distances[0][rank] if distances else None,
+            "rank": rank,
+        }
+        video_id, index = get_segment_index(id)
+        windows_by_video.setdefault(video_id, []).append((index, window))
+
+    # Merge each window into the previous passage of its video if they overlap
+    passages = []
+    for windows in windows_by_video.values():
+        windows.sort(key=lambda item: item[0])
+        passage = None
+        for _, window in windows:
+            merged = None
+            if passage is not None:
+                merged = merge_overlapping_text(passage["document"], window["document"])
+            if merged is None:
+                passage = dict(window)
+                passages.append(passage)
+                continue
+            passage["document"] = merged
+            passage["rank"] = min(passage["rank"], window["rank"])
+            if window["distance"] is not None and (
+                passage["distance"] is None or window["distance"] < passage["distance"]
+            ):
+                passage["distance"] = window["distance"]
+
+    return sorted(passages, key=lambda passage: passage["rank"])
+
+
+def select_mmr(texts: List[str], num_results: int, mmr_lambda: float = CONTEXT_MMR_LAMBDA) -> List[int]:
+    f"""Selects diverse texts from a ranked list by maximal marginal relevance. Relevance falls linearly with rank
+    and redundancy is the largest word overlap (Jaccard) with a text already selected.
+
+    Args:
+        texts (list): The texts, best first.
+        num_results (int): The number of texts to select.
+        mmr_lambda (float): The weight of relevance against redundancy, between 0 and 1. Default is {CONTEXT_MMR_LAMBDA}.
+
+    Returns:
+        list: The indices of the selected texts, in selection order.
+    """
+
+    terms = [set(tokenize_terms(text)) for text in texts]
+    redundancy = [0.0] * len(texts)
+    remaining = list(range(len(texts)))
+    selected = []
+    while remaining and len(selected) < num_results:
+        best = max(
+            remaining,
+            key=lambda i: mmr_lambda * (1 - i / len(texts)) - (1 - mmr_lambda) * redundancy[i],
+        )
+        selected.append(best)
+        remaining.remove(best)
+
+        # Update the redundancy of the rest with the new selection
+        for i in remaining:
+            union = len(terms[i] | terms[best])
+            if union:
+                redundancy[i] = max(redundancy[i], len(terms[i] & terms[best]) / union)
+
+    return selected
+
+
+def pack_to_budget(
+    texts: List[str],
+    token_counts: List[int],
+    max_tokens: int = CONTEXT_MAX_TOKENS,
+    min_tokens: int = CONTEXT_MIN_PASSAGE_TOKENS,
+) -> List[tuple]:
+    f"""Packs texts in order into a token budget. A text that does not fit is cut to the remaining budget if at
+    least `min_tokens` are left, and skipped otherwise.
+
+    Args:
+        texts (list): The texts, in order of preference.
+        token_counts (list): The number of tokens in each text.
+        max_tokens (int): The token budget. Default is {CONTEXT_MAX_TOKENS}.
+        min_tokens (int): The smallest cut of a text worth including. Default is {CONTEXT_MIN_PASSAGE_TOKENS}.
+
+    Returns:
+        list: The (index, text) of each packed text, in order.
+    """
+
+    packed = []
+    remaining = max_tokens
+    for i, (text, num_tokens) in enumerate(zip(texts, token_counts)):
+        if num_tokens <= remaining:
+            packed.append((i, text))
+            remaining -= num_tokens
+        elif remaining >= min_tokens:
+            # Cut by words in proportion to the tokens left
+            words = text.split()
+            packed.append((i, " ".join(words[: len(words) * remaining // num_tokens])))
+            remaining = 0
+    return packed
+
+
+def build_context(
+    results: dict,
+    num_segments: int,
+    max_tokens: int = CONTEXT_MAX_TOKENS,
+    mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+    token_counter: Callable[[List[str]], List[int]] = count_tokens,
+) -> dict:
+    f"""Turns over-fetched retrieval results into the context for the LLM. Distinct segments are selected by maximal
+    marginal relevance, overlapping windows of the same video among them are merged into one passage, and the
+    passages are packed into a token budget. The context is never longer than the top segments as retrieved.
+
+    Args:
+        results (dict): The single-query results of a database query, ideally with more segments than num_segments.
+        num_segments (int): The number of segments to select.
+        max_tokens (int): The token budget of the passage texts, capped at the tokens of the top `num_segments`
+            segments as retrieved. Default is {CONTEXT_MAX_TOKENS}.
+        mmr_lambda (float): The weight of relevance against redundancy. Default is {CONTEXT_MMR_LAMBDA}.
+        token_counter (function): Returns the number of tokens in each of a list of texts. Default is count_tokens.
+
+    Returns:
+        dict: The passages in the format of a single-query database result, each with the ID, metadata and source
+        link of its first window.
+    """
+
+    # Select distinct segments, keeping them in rank order
+    selected = sorted(select_mmr(results["documents"][0], num_segments, mmr_lambda))
+    selected_results = {
+        key: [[value[0][i] for i in selected]]
+        for key, value in results.items()
+        if key in ("ids", "documents", "metadatas", "distances") and value is not None
+    }
+
+    passages = merge_overlapping_windows(selected_results)
+    texts = [passage["document"] for passage in passages]
+    packed = []
+    if texts:
+        # Cap the budget at the length of the top segments as retrieved, counted in the same call
+        top_texts = results["documents"][0][:num_segments]
+        token_counts = token_counter(texts + top_texts)
+        budget = min(max_tokens, sum(token_counts[len(texts) :]))
+        packed = pack_to_budget(texts, token_counts[: len(texts)], budget)
+
+    return {
+        "ids": [[passages[i]["id"] for i, _ in packed]],
+        "distances": [[passages[i]["distance"] for i, _ in packed]],
+        "metadatas": [[passages[i]["metadata"] for i, _ in packed]],
+        "documents": [[text for _, text in packed]],
+        "embeddings": None,
+        "uris": None,
+        "data": None,
+    }
@@ -0,0 +1,209 @@
+import os
+
+import numpy as np
+import torch
+from transformers import AutoModel
+
+from constants import EMBEDDING_MODEL, EMBEDDING_ONNX_PATH, EMBEDDING_NUM_THREADS
+
+# The tokenizer outputs fed to the model, in the order of its forward arguments
+MODEL_INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+
+def mean_pool(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """Averages the token embeddings of each row, ignoring padded positions.
+
+    Args:
+        last_hidden_state (torch.Tensor): The model output of shape (batch, tokens, dim).
+        attention_mask (torch.Tensor): The tokenizer attention mask of shape (batch, tokens).
+
+    Returns:
+        torch.Tensor: The pooled embeddings of shape (batch, dim).
+    """
+
+    # Zero out the padded tokens so they do not contribute to the sum
+    mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+    summed = (last_hidden_state * mask).sum(dim=1)
+
+    # Divide by the number of real tokens in each row
+    counts = mask.sum(dim=1).clamp(min=1.0)
+    return summed / counts
+
+
+class PooledModel(torch.nn.Module):
+    """The embedding model followed by mean pooling, so one forward pass returns the document embeddings."""
+
+    def __init__(self, model: torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        token_type_ids: torch.Tensor,
+    ) -> torch.Tensor:
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=token_type_ids,
+        )
+        return mean_pool(outputs.last_hidden_state, attention_mask)
+
+
+def load_model(model_name: str = EMBEDDING_MODEL) -> torch.nn.Module:
+    f"""Loads the full-precision PyTorch model in evaluation mode.
+
+    Args:
+        model_name (str): The HuggingFace model name. Default is {EMBEDDING_MODEL}.
+
+    Returns:
+        torch.nn.Module: The model.
+    """
+
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    return model
+
+
+class TorchBackend:
+    """Runs the PyTorch model, in full precision or with its linear layers dynamically quantized to int8.
+
+    Functions:
+        __call__: Returns the pooled embeddings of a tokenized batch.
+    """
+
+    tensor_type = "pt"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, quantize: bool = False) -> None:
+        f"""Loads the model.
+
+        Args:
+            model_name (str): The HuggingFace model name. Default is {EMBEDDING_MODEL}.
+            quantize (bool): Whether to quantize the linear layers to int8. Default is False.
+        """
+
+        self.name = "torch_int8" if quantize else "torch"
+        model = load_model(model_name)
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.model = PooledModel(model)
+
+        # Quantized vectors differ slightly, so they are cached separately from the full-precision ones
+        self.cache_key = f"{model_name}:int8" if quantize else model_name
+
+    def __call__(self, tokens: dict) -> np.ndarray:
+        """Returns the pooled embeddings of a batch tokenized with return_tensors="pt"."""
+
+        with torch.inference_mode():  # Do not track gradients or version counters
+            return self.model(*(tokens[name] for name in MODEL_INPUT_NAMES)).numpy()
+
+
+class OnnxBackend:
+    """Runs the model exported to ONNX (with mean pooling included) on ONNX Runtime, without loading PyTorch weights.
+
+    Functions:
+        __call__: Returns the pooled embeddings of a tokenized batch.
+    """
+
+    name = "onnx"
+    tensor_type = "np"
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_ONNX_PATH,
+        model_name: str = EMBEDDING_MODEL,
+        num_threads: int = EMBEDDING_NUM_THREADS,
+    ) -> None:
+        f"""Opens the ONNX Runtime session.
+
+        Args:
+            path (str): The path to the exported model. Default is {EMBEDDING_ONNX_PATH}.
+            model_name (str): The HuggingFace model name the export was made from. Default is {EMBEDDING_MODEL}.
+            num_threads (int): The number of intra-op threads. Default is {EMBEDDING_NUM_THREADS} (ONNX Runtime default).
+
+        Raises:
+            FileNotFoundError: If the model has not been exported yet.
+        """
+
+        import onnxruntime
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"No ONNX model at {path}. Export it with: python export_embedding_model.py"
+            )
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+
+        # The exported graph matches the PyTorch model to float precision, so the vectors share its cache entries
+        self.cache_key = model_name
+
+    def __call__(self, tokens: dict) -> np.ndarray:
+        """Returns the pooled embeddings of a batch tokenized with return_tensors="np"."""
+
+        inputs = {name: tokens[name].astype(np.int64) for name in MODEL_INPUT_NAMES}
+        return self.session.run(None, inputs)[0]
+
+
+# The embedding backends that can be selected with EMBEDDING_BACKEND
+EMBEDDING_BACKENDS = {
+    "torch": lambda: TorchBackend(),
+    "torch_int8": lambda: TorchBackend(quantize=True),
+    "onnx": lambda: OnnxBackend(),
+}
+
+
+def load_backend(name: str) -> TorchBackend | OnnxBackend:
+    """Loads the embedding backend with the given name.
+
+    Args:
+        name (str): One of "torch", "torch_int8" or "onnx".
+
+    Returns:
+        TorchBackend | OnnxBackend: The backend, which maps a tokenized batch to its pooled embeddings.
+    """
+
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend {name}. Choose one of {list(EMBEDDING_BACKENDS)}."
+        )
+    return EMBEDDING_BACKENDS[name]()
+
+
+def export_onnx(
+    path: str = EMBEDDING_ONNX_PATH, model_name: str = EMBEDDING_MODEL
+) -> None:
+    f"""Exports the full-precision model with mean pooling to ONNX, with dynamic batch and sequence dimensions.
+
+    Args:
+        path (str): The path to write the model to. Default is {EMBEDDING_ONNX_PATH}.
+        model_name (str): The HuggingFace model name. Default is {EMBEDDING_MODEL}.
+    """
+
+    model = PooledModel(load_model(model_name))
+
+    # A small example batch to trace the graph with
+    example = {
+        name: torch.ones((2, 8), dtype=torch.long) for name in MODEL_INPUT_NAMES
+    }
+    example["token_type_ids"] = torch.zeros((2, 8), dtype=torch.long)
+    dynamic_axes = {name: {0: "batch", 1: "tokens"} for name in MODEL_INPUT_NAMES}
+    dynamic_axes["embeddings"] = {0: "batch"}
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    torch.onnx.export(
+        model,
+        tuple(example[name] for name in MODEL_INPUT_NAMES),
+        path,
+        input_names=MODEL_INPUT_NAMES,
+        output_names=["embeddings"],
+        dynamic_axes=dynamic_axes,
+        opset_version=14,
+    )
@@ -0,0 +1,152 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import List, Dict
+
+import numpy as np
+
+from constants import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+)
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_VARIABLES = 900
+
+
+def hash_text(text: str) -> str:
+    """Returns the SHA-256 hex digest of the text, used as the cache key."""
+
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """An on-disk embedding cache keyed by (model name, hash of text), stored in SQLite.
+
+    Vectors of each model name are kept side by side, so switching between embedding backends keeps
+    the vectors of the other one. Only vectors of this cache's model name are returned. The least
+    recently used entries of any model are evicted once the cache holds more than `max_entries` vectors.
+
+    Functions:
+        get_many: Returns the cached embeddings for the texts that are in the cache.
+        put_many: Adds embeddings to the cache and evicts old entries if needed.
+        stats: Returns the hit/miss counters and the number of cached vectors of all models.
+    """
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        model_name: str = EMBEDDING_MODEL,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ) -> None:
+        f"""Opens (or creates) the cache.
+
+        Args:
+            path (str): The path to the SQLite file. Default is {EMBEDDING_CACHE_PATH}.
+            model_name (str): The embedding model the vectors belong to. Default is {EMBEDDING_MODEL}.
+            max_entries (int): The maximum number of cached vectors. Default is {EMBEDDING_CACHE_MAX_ENTRIES}.
+        """
+
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+            """
+        )
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """Returns the cached embeddings for the texts that are in the cache.
+
+        Args:
+            texts (list): The texts to look up.
+
+        Returns:
+            dict: The cached embeddings keyed by text. Texts that are not cached are left out.
+        """
+
+        hashes = {hash_text(text): text for text in texts}
+        found = {}
+
+        with self._lock, self._conn:
+            keys = list(hashes)
+            for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+                chunk = keys[i : i + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    (self.model_name, *chunk),
+                ).fetchall()
+                for text_hash, vector in rows:
+                    found[hashes[text_hash]] = np.frombuffer(vector, dtype=np.float32)
+
+                # Mark the hits as recently used
+                now = time.time_ns()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_name, text_hash) for text_hash, _ in rows],
+                )
+
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+
+        return found
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray) -> None:
+        """Adds embeddings to the cache and evicts the least recently used entries if the cache is full.
+
+        Args:
+            texts (list): The texts that were embedded.
+            embeddings (np.ndarray): The embeddings, one row per text.
+        """
+
+        now = time.time_ns()
+        rows = [
+            (
+                self.model_name,
+                hash_text(text),
+                np.ascontiguousarray(embedding, dtype=np.float32).tobytes(),
+                now,
+            )
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+            # Evict the least recently used vectors of any model above the size limit
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE (model, text_hash) IN ("
+                    "SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the number of cached vectors of all models."""
+
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+        return {"hits": self.hits, "misses": self.misses, "entries": count}
@@ -0,0 +1,164 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from chromadb import Documents
+
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_utils import MyEmbeddingFunction
+from constants import EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE
+
+# The embedding function of a worker process, created once by the pool initializer
+_worker_embedding_function = None
+
+
+def get_threads_per_worker(num_workers: int) -> int:
+    """Returns the number of intra-op threads per worker that splits the CPU cores evenly among the workers."""
+
+    return max(1, (os.cpu_count() or 1) // num_workers)
+
+
+def _init_worker(num_threads: int, batch_size: int) -> None:
+    """Loads the embedding model once in a worker process, limited to its share of the CPU cores."""
+
+    global _worker_embedding_function
+
+    # OpenMP and MKL read these when PyTorch is first imported, which happens below
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+
+    if EMBEDDING_BACKEND == "onnx":
+        from utils.embedding_backends import OnnxBackend
+
+        backend = OnnxBackend(num_threads=num_threads)
+    else:
+        from utils.embedding_backends import load_backend
+
+        backend = load_backend(EMBEDDING_BACKEND)
+
+    _worker_embedding_function = MyEmbeddingFunction(
+        batch_size=batch_size, num_threads=num_threads, backend=backend
+    )
+
+
+def _get_cache_key() -> str:
+    """Returns the cache key of the worker's backend, so the parent does not need to load the model to know it."""
+
+    return _worker_embedding_function.backend.cache_key
+
+
+def _embed_rows(shm_name: str, shape: tuple, start: int, texts: list) -> int:
+    """Embeds the texts in a worker and writes them to their rows of the shared output matrix.
+
+    Args:
+        shm_name (str): The name of the shared memory block holding the output matrix.
+        shape (tuple): The shape of the output matrix.
+        start (int): The row of the first text.
+        texts (list): The texts to embed.
+
+    Returns:
+        int: The number of rows written.
+    """
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        output = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        output[start : start + len(texts)] = _worker_embedding_function.embed(texts)
+        del output  # Release the buffer before closing the block
+    finally:
+        shm.close()
+    return len(texts)
+
+
+class EmbeddingPool(MyEmbeddingFunction):
+    """An embedding function that embeds documents on a pool of worker processes, one per group of CPU cores.
+
+    Each worker loads the model once and runs it with its share of the cores, so the workers together do not
+    oversubscribe the CPU. The documents are split into contiguous chunks, one per worker, and each worker writes its
+    embeddings straight into a shared memory matrix rather than pickling them back to the parent. The embedding cache
+    is consulted in the parent, so only missing documents are sent to the workers.
+
+    Functions:
+        __call__: Embeds the input documents and returns the embeddings.
+        encode: Embeds the input documents and returns the embeddings as a float32 matrix.
+        embed: Runs the model over the input documents on the workers without consulting the cache.
+        close: Shuts the workers down.
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        threads_per_worker: int = None,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        use_cache: bool = True,
+    ) -> None:
+        f"""Starts the workers and loads the model in each of them.
+
+        Args:
+            num_workers (int): The number of worker processes.
+            threads_per_worker (int): The number of intra-op threads of each worker. Default is None (the CPU cores divided by the workers).
+            batch_size (int): The number of documents per forward pass. Default is {EMBEDDING_BATCH_SIZE}.
+            use_cache (bool): Whether to consult the embedding cache before embedding. Default is True.
+        """
+
+        super().__init__(batch_size=batch_size)
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or get_threads_per_worker(num_workers)
+
+        # Spawn rather than fork, so the workers do not inherit the parent's PyTorch thread pools
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, batch_size),
+        )
+
+        # Load the model in every worker now rather than on the first batch
+        futures = [self.executor.submit(_get_cache_key) for _ in range(num_workers)]
+        cache_keys = [future.result() for future in futures]
+        if use_cache:
+            self.cache = EmbeddingCache(model_name=cache_keys[0])
+
+    def embed(self, input: Documents) -> np.ndarray:
+        """Runs the model over the input documents on the workers and returns the embeddings as a float32 matrix."""
+
+        embeddings = np.empty((len(input), self.dimension), dtype=np.float32)
+        if not input:
+            return embeddings
+
+        # Give each worker a contiguous chunk of at least one batch
+        chunk_size = max(self.batch_size, math.ceil(len(input) / self.num_workers))
+
+        shm = shared_memory.SharedMemory(create=True, size=embeddings.nbytes)
+        try:
+            futures = [
+                self.executor.submit(
+                    _embed_rows, shm.name, embeddings.shape, start, list(input[start : start + chunk_size])
+                )
+                for start in range(0, len(input), chunk_size)
+            ]
+            for future in futures:
+                future.result()
+
+            shared = np.ndarray(embeddings.shape, dtype=np.float32, buffer=shm.buf)
+            embeddings[:] = shared
+            del shared  # Release the buffer before closing the block
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return embeddings
+
+    def close(self) -> None:
+        """Shuts the workers down."""
+
+        self.executor.shutdown()
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
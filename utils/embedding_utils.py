@@ -1,38 +1,229 @@
-import torch
-from transformers import AutoTokenizer, AutoModel
+import threading
+from typing import TYPE_CHECKING
+
+import chromadb
+import numpy as np
 from chromadb import Documents, EmbeddingFunction, Embeddings
 
-from constants import EMBEDDING_MODEL
+from utils.embedding_cache import EmbeddingCache
+from constants import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_NUM_THREADS,
+    TABLE_NAME,
+)
+
+if TYPE_CHECKING:
+    from transformers import PretrainedConfig, PreTrainedTokenizerBase
+    from utils.embedding_backends import OnnxBackend, TorchBackend
 
-# Initialize the tokenizer and model from HuggingFace
 model_name = EMBEDDING_MODEL
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModel.from_pretrained(model_name)
+
+# The tokenizer, model config and embedding backend are loaded on first use, so importing this module is cheap
+_tokenizer = None
+_config = None
+_embedding_backend = None
+_resources_lock = threading.Lock()
+
+# The fast tokenizer keeps padding/truncation state on a shared Rust object, so calls from several threads must not overlap
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer() -> "PreTrainedTokenizerBase":
+    """Returns the tokenizer of the embedding model, loading it on first use."""
+
+    global _tokenizer
+    with _resources_lock:
+        if _tokenizer is None:
+            from transformers import AutoTokenizer
+
+            _tokenizer = AutoTokenizer.from_pretrained(model_name)
+        return _tokenizer
+
+
+def get_config() -> "PretrainedConfig":
+    """Returns the configuration of the embedding model, loading it on first use."""
+
+    global _config
+    with _resources_lock:
+        if _config is None:
+            from transformers import AutoConfig
+
+            _config = AutoConfig.from_pretrained(model_name)
+        return _config
+
+
+def get_embedding_backend() -> "TorchBackend | OnnxBackend":
+    f"""Returns the embedding backend selected in constants ({EMBEDDING_BACKEND}), loading the model on first use."""
+
+    global _embedding_backend
+    with _resources_lock:
+        if _embedding_backend is None:
+            from utils.embedding_backends import load_backend
+
+            _embedding_backend = load_backend(EMBEDDING_BACKEND)
+        return _embedding_backend
+
+
+def tokenize(texts: list, **kwargs) -> dict:
+    """Runs the tokenizer over the texts. Safe to call from several threads."""
+
+    tokenizer = get_tokenizer()
+    with _tokenizer_lock:
+        return tokenizer(texts, **kwargs)
 
 
 class MyEmbeddingFunction(EmbeddingFunction[Documents]):
     """The embedding function for the database. The format of this class is compatible with ChromaDB.
 
+    Documents are embedded in micro-batches. Before batching they are sorted by token length so that
+    each batch holds documents of similar length and little compute is spent on padding. If an
+    embedding cache is given, cached documents are not run through the model again.
+
     Functions:
         __call__: Embeds the input documents and returns the embeddings.
+        encode: Embeds the input documents and returns the embeddings as a float32 matrix.
+        embed: Runs the model over the input documents without consulting the cache.
 
     For more information, see the ChromaDB documentation: https://docs.trychroma.com/embeddings
     """
 
+    def __init__(
+        self,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        num_threads: int = EMBEDDING_NUM_THREADS,
+        cache: EmbeddingCache = None,
+        backend: "TorchBackend | OnnxBackend" = None,
+    ) -> None:
+        f"""Initializes the embedding function.
+
+        Args:
+            batch_size (int): The number of documents per forward pass. Default is {EMBEDDING_BATCH_SIZE}.
+            num_threads (int): The number of PyTorch intra-op threads. Default is {EMBEDDING_NUM_THREADS} (PyTorch default).
+            cache (EmbeddingCache): The embedding cache to consult before running the model. Default is None (no cache).
+            backend (TorchBackend | OnnxBackend): The backend that runs the model. Default is None (the {EMBEDDING_BACKEND} backend selected in constants).
+        """
+
+        self.batch_size = batch_size
+        self.cache = cache
+        self._backend = backend
+
+        if num_threads:
+            import torch
+
+            torch.set_num_threads(num_threads)
+
+    @property
+    def backend(self) -> "TorchBackend | OnnxBackend":
+        """The backend that runs the model, loaded on first use."""
+
+        return self._backend or get_embedding_backend()
+
+    @property
+    def dimension(self) -> int:
+        """The number of dimensions of the embeddings."""
+
+        return get_config().hidden_size
+
     def __call__(self, input: Documents) -> Embeddings:
-        """Embeds the input documents and returns the embeddings."""
-
-        # Initilize the list to store the embeddings
-        embeddings_list = []
-
-        # Loop through the list of text documents
-        for text in input:
-            tokens = tokenizer(text, return_tensors="pt")
-            with torch.no_grad():  # Do not calculate gradients
-                outputs = model(**tokens)
-            embeddings = (
-                outputs.last_hidden_state.mean(dim=1).squeeze().detach().numpy()
+        """Embeds the input documents and returns the embeddings as lists of floats, the format ChromaDB validates against."""
+
+        return self.encode(input).tolist()
+
+    def encode(self, input: Documents) -> np.ndarray:
+        """Embeds the input documents and returns the embeddings as a float32 matrix (one row per document)."""
+
+        if self.cache is None:
+            return self.embed(input)
+
+        # Look up the cached documents and only embed the rest
+        cached = self.cache.get_many(input)
+        missing = list(dict.fromkeys(text for text in input if text not in cached))
+        if missing:
+            new_embeddings = self.embed(missing)
+            self.cache.put_many(missing, new_embeddings)
+            cached.update(zip(missing, new_embeddings))
+
+        embeddings = np.empty((len(input), self.dimension), dtype=np.float32)
+        for i, text in enumerate(input):
+            embeddings[i] = cached[text]
+
+        return embeddings
+
+    def embed(self, input: Documents) -> np.ndarray:
+        """Runs the model over the input documents and returns the embeddings as a float32 matrix."""
+
+        # Allocate the output matrix up front so the result is one contiguous block
+        embeddings = np.empty((len(input), self.dimension), dtype=np.float32)
+        if not input:
+            return embeddings
+
+        # Sort the documents by token length so each batch needs little padding
+        lengths = [len(ids) for ids in tokenize(list(input), truncation=True)["input_ids"]]
+        order = np.argsort(lengths, kind="stable")
+
+        # Loop through the sorted documents in batches
+        for start in range(0, len(order), self.batch_size):
+            batch_idx = order[start : start + self.batch_size]
+            tokens = tokenize(
+                [input[i] for i in batch_idx],
+                padding=True,
+                truncation=True,
+                return_tensors=self.backend.tensor_type,
             )
-            embeddings_list.append(embeddings)
 
-        return embeddings_list
+            # Write the batch back to the rows of the original documents
+            embeddings[batch_idx] = self.backend(tokens)
+
+        return embeddings
+
+
+# Process-wide embedding function shared by the ETL and query paths
+_embedding_function = None
+_embedding_function_lock = threading.Lock()
+
+
+def get_embedding_function() -> MyEmbeddingFunction:
+    """Returns the shared embedding function (backed by the on-disk embedding cache), creating it on first use."""
+
+    global _embedding_function
+    with _embedding_function_lock:
+        if _embedding_function is None:
+            _embedding_function = MyEmbeddingFunction(
+                cache=EmbeddingCache(model_name=get_embedding_backend().cache_key)
+            )
+        return _embedding_function
+
+
+def load_stored_sample(db_path: str, num_samples: int) -> tuple:
+    """Returns the documents and stored vectors of up to `num_samples` segments in the database.
+
+    Args:
+        db_path (str): The path to the database.
+        num_samples (int): The maximum number of segments to return.
+
+    Returns:
+        tuple: The documents (list) and their stored embeddings (np.ndarray, one row per document).
+    """
+
+    client = chromadb.PersistentClient(db_path)
+    collection = client.get_collection(TABLE_NAME)
+    stored = collection.get(limit=num_samples, include=["documents", "embeddings"])
+    return stored["documents"], np.array(stored["embeddings"], dtype=np.float32)
+
+
+def cosine_agreement(embeddings: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """Returns the cosine similarity of each row of `embeddings` to the same row of `reference`."""
+
+    dots = (embeddings * reference).sum(axis=1)
+    norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1)
+    return dots / np.maximum(norms, 1e-12)
+
+
+def warmup() -> None:
+    """Loads the tokenizer, model config and embedding backend ahead of the first query."""
+
+    get_tokenizer()
+    get_config()
+    get_embedding_backend()
@@ -0,0 +1,40 @@
+import json
+from typing import List
+
+from constants import EVAL_QUESTIONS_PATH
+
+
+def load_questions(path: str = EVAL_QUESTIONS_PATH) -> List[dict]:
+    f"""Loads the evaluation questions, one JSON object per line with the question and the IDs of the videos that answer it.
+
+    Args:
+        path (str): The path to the JSON lines file. Default is {EVAL_QUESTIONS_PATH}.
+
+    Returns:
+        list: The questions, each a dict with "question" and "expected_video_ids".
+    """
+
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_video_ids(results: dict) -> List[str]:
+    """Returns the video ID of each retrieved segment, in rank order."""
+
+    return [metadata["segment_id"].rsplit("__", 1)[0] for metadata in results["metadatas"][0]]
+
+
+def recall_at_k(video_ids: List[str], expected_video_ids: List[str], k: int) -> float:
+    """Returns the share of the expected videos that appear in the top k retrieved segments."""
+
+    found = set(video_ids[:k]) & set(expected_video_ids)
+    return len(found) / len(expected_video_ids)
+
+
+def reciprocal_rank(video_ids: List[str], expected_video_ids: List[str]) -> float:
+    """Returns 1 / the rank of the first retrieved segment from an expected video, or 0 if there is none."""
+
+    for rank, video_id in enumerate(video_ids, start=1):
+        if video_id in expected_video_ids:
+            return 1.0 / rank
+    return 0.0
@@ -1,13 +1,47 @@
+import functools
+import os
 import time
 
+from utils.instrumentation import registry, span
+
 
 def timeit(func):
+    """Decorator that runs the function in a span named after it, which records its wall time. While no exporter is
+    configured (see instrumentation.configure), the wall time is also printed so scripts still show it."""
+
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        execution_time = round(end_time - start_time, 2)
-        print(f"{func.__name__} took {execution_time} seconds.")
+        start_time = time.perf_counter()
+        with span(func.__name__):
+            result = func(*args, **kwargs)
+        if not registry.exporters:
+            print(f"{func.__name__} took {time.perf_counter() - start_time:.2f} seconds.")
         return result
 
     return wrapper
+
+
+def close_chroma_system(db_path: str) -> None:
+    """Stops the Chroma system cached for a database path and drops it from Chroma's cache, so the next client for
+    the path reads the database from disk. Chroma's own clear_system_cache drops the systems of every path without
+    stopping them, which leaks their SQLite connections and indexes.
+
+    Args:
+        db_path (str): The path the database's clients were opened with.
+    """
+
+    from chromadb.api.client import SharedSystemClient
+
+    system = SharedSystemClient._identifer_to_system.pop(db_path, None)
+    if system is not None:
+        system.stop()
+
+
+def get_size(path: str) -> int:
+    """Returns the total size in bytes of the files under a path."""
+
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
@@ -0,0 +1,320 @@
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from utils.general_utils import close_chroma_system, get_size
+from utils.vector_store import EXPORT_PAGE_SIZE
+from constants import (
+    TABLE_NAME,
+    EMBEDDING_MODEL,
+    EVAL_QUESTIONS_PATH,
+    HNSW_TUNING_K,
+    HNSW_TUNING_QUERIES,
+    HNSW_TARGET_RECALL,
+)
+
+# Chroma's defaults for the parameters it does not find in the collection metadata
+DEFAULT_HNSW_PARAMS = {"M": 16, "construction_ef": 100, "search_ef": 10}
+
+
+def get_hnsw_params(metadata: dict) -> dict:
+    """Returns the HNSW parameters recorded in collection metadata, with Chroma's defaults for the missing ones.
+
+    Args:
+        metadata (dict): The collection metadata, e.g. {'hnsw:space': 'cosine', 'hnsw:M': 32}.
+
+    Returns:
+        dict: The parameters. {'M': ..., 'construction_ef': ..., 'search_ef': ...}
+    """
+
+    metadata = metadata or {}
+    return {name: metadata.get(f"hnsw:{name}", default) for name, default in DEFAULT_HNSW_PARAMS.items()}
+
+
+def to_metadata(params: dict) -> dict:
+    """Returns the collection metadata entries of HNSW parameters, e.g. {'hnsw:M': 32} for {'M': 32}."""
+
+    return {f"hnsw:{name}": int(value) for name, value in params.items()}
+
+
+def read_collection(db_path: str) -> tuple:
+    """Reads the metadata and every stored segment of a database, a page at a time.
+
+    Args:
+        db_path (str): The path to the database file.
+
+    Returns:
+        tuple: The collection metadata (dict) and the segments (dict of 'ids', 'documents', 'metadatas' and
+        'embeddings' lists).
+    """
+
+    import chromadb
+
+    collection = chromadb.PersistentClient(db_path).get_collection(TABLE_NAME)
+    segments = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    while True:
+        page = collection.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=EXPORT_PAGE_SIZE,
+            offset=len(segments["ids"]),
+        )
+        for key in segments:
+            segments[key].extend(page[key])
+        if len(page["ids"]) < EXPORT_PAGE_SIZE:
+            break
+    return collection.metadata or {}, segments
+
+
+def build_collection(db_path: str, metadata: dict, segments: dict, params: dict) -> float:
+    """Creates a database holding the stored segments under new HNSW parameters, without embedding them again.
+
+    Args:
+        db_path (str): The path to the new database.
+        metadata (dict): The collection metadata to keep, see read_collection.
+        segments (dict): The segments with their embeddings, see read_collection.
+        params (dict): The HNSW parameters. {'M': ..., 'construction_ef': ..., 'search_ef': ...}
+
+    Returns:
+        float: The build time in seconds.
+    """
+
+    import chromadb
+
+    # Chroma copies the HNSW parameters into the index when the collection is created, so they cannot be changed later
+    metadata = {key: value for key, value in metadata.items() if key == "hnsw:space" or not key.startswith("hnsw:")}
+    start_time = time.perf_counter()
+    collection = chromadb.PersistentClient(db_path).create_collection(
+        TABLE_NAME, metadata={**metadata, **to_metadata(params)}
+    )
+
+    # Compact databases store no documents
+    has_documents = any(document is not None for document in segments["documents"])
+    for start in range(0, len(segments["ids"]), EXPORT_PAGE_SIZE):
+        end = start + EXPORT_PAGE_SIZE
+        collection.add(
+            ids=segments["ids"][start:end],
+            embeddings=segments["embeddings"][start:end],
+            documents=segments["documents"][start:end] if has_documents else None,
+            metadatas=segments["metadatas"][start:end],
+        )
+    return time.perf_counter() - start_time
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, metric: str) -> np.ndarray:
+    """Returns the row indices of the k nearest vectors of each query under the collection's distance metric, by
+    brute force in float32.
+
+    Args:
+        vectors (np.ndarray): The stored vectors, one per row.
+        queries (np.ndarray): The queries, one per row.
+        k (int): The number of neighbours.
+        metric (str): The distance metric, "cosine", "l2" or "ip".
+
+    Returns:
+        np.ndarray: The indices of the k nearest vectors, one row per query, nearest first.
+    """
+
+    if metric == "cosine":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+    # Smaller is nearer for every metric
+    products = queries @ vectors.T
+    if metric == "l2":
+        distances = (vectors**2).sum(axis=1) - 2 * products
+    else:
+        distances = -products
+
+    k = min(k, len(vectors))
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def sample_queries(vectors: np.ndarray, num_queries: int, seed: int = 0) -> np.ndarray:
+    """Returns query vectors near the stored ones: a random sample of the stored vectors with Gaussian noise of
+    their own spread added, so no model is loaded to embed questions."""
+
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+    return queries + rng.normal(scale=queries.std(), size=queries.shape).astype(np.float32)
+
+
+def get_queries(metadata: dict, vectors: np.ndarray, num_queries: int, questions_path: str = EVAL_QUESTIONS_PATH) -> tuple:
+    f"""Returns the query vectors to measure with: the embedded questions of the evaluation question file if it exists
+    and the database was embedded with the query embedding model, or else vectors sampled near the stored ones.
+
+    Args:
+        metadata (dict): The collection metadata, see read_collection.
+        vectors (np.ndarray): The stored vectors, one per row.
+        num_queries (int): The maximum number of queries.
+        questions_path (str): The path to the evaluation questions. Default is {EVAL_QUESTIONS_PATH}.
+
+    Returns:
+        tuple: The queries (np.ndarray, one per row) and a description of where they come from.
+    """
+
+    if questions_path and os.path.exists(questions_path) and metadata.get("embedding_model") == EMBEDDING_MODEL:
+        from utils.embedding_utils import get_embedding_function
+        from utils.eval_utils import load_questions
+
+        questions = [question["question"] for question in load_questions(questions_path)][:num_queries]
+        if questions:
+            return get_embedding_function().encode(questions), f"{len(questions)} questions from {questions_path}"
+
+    queries = sample_queries(vectors, num_queries)
+    return queries, f"{len(queries)} stored vectors with noise"
+
+
+def measure_collection(db_path: str, queries: np.ndarray, expected: np.ndarray, ids: list, k: int) -> dict:
+    """Queries a database one query at a time and returns its recall@k against the exact neighbours and its
+    p50/p95 query latency in milliseconds."""
+
+    import chromadb
+
+    collection = chromadb.PersistentClient(db_path).get_collection(TABLE_NAME)
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=k)
+
+    recalls, latencies = [], []
+    for query, nearest in zip(queries, expected):
+        start_time = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k)
+        latencies.append(time.perf_counter() - start_time)
+        recalls.append(len(set(result["ids"][0]) & {ids[i] for i in nearest}) / len(nearest))
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+    }
+
+
+def tune_hnsw(
+    db_path: str,
+    grid: dict,
+    k: int = HNSW_TUNING_K,
+    num_queries: int = HNSW_TUNING_QUERIES,
+    questions_path: str = EVAL_QUESTIONS_PATH,
+) -> list:
+    f"""Rebuilds the database's collection from its stored embeddings under every combination of HNSW parameters in
+    the grid, and measures each build against exact brute-force search. The database itself is not changed.
+
+    Args:
+        db_path (str): The path to the database file.
+        grid (dict): The values to try for each parameter, e.g. {{'M': [16, 32], 'construction_ef': [100], 'search_ef': [10, 50]}}.
+        k (int): The number of neighbours recall is measured at. Default is {HNSW_TUNING_K}.
+        num_queries (int): The maximum number of queries, see get_queries. Default is {HNSW_TUNING_QUERIES}.
+        questions_path (str): The path to the evaluation questions used as queries. Default is {EVAL_QUESTIONS_PATH}.
+
+    Returns:
+        list: One result per combination: its parameters, recall@k, p50/p95 query latency in milliseconds,
+        build time in seconds and size of the built database on disk in bytes.
+    """
+
+    metadata, segments = read_collection(db_path)
+    vectors = np.array(segments["embeddings"], dtype=np.float32)
+    queries, source = get_queries(metadata, vectors, num_queries, questions_path)
+    print(f"Measuring with {source}.")
+    expected = exact_top_k(vectors, queries, k, metadata.get("hnsw:space", "l2"))
+
+    names = list(grid)
+    results = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = {**get_hnsw_params(metadata), **dict(zip(names, values))}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = os.path.join(tmp_dir, "tuning.db")
+            build_seconds = build_collection(tmp_path, metadata, segments, params)
+            result = {
+                "params": params,
+                **measure_collection(tmp_path, queries, expected, segments["ids"], k),
+                "build_seconds": build_seconds,
+            }
+
+            # Stopping the build's client writes its index to disk, which is then measured before it is removed
+            close_chroma_system(tmp_path)
+            result["disk_bytes"] = get_size(tmp_path)
+
+        results.append(result)
+        print(
+            f"{params}: recall@{k} {result['recall']:.3f}, p50 {result['p50_ms']:.2f} ms / "
+            f"p95 {result['p95_ms']:.2f} ms, build {build_seconds:.1f}s, disk {result['disk_bytes'] / 1e6:.2f} MB"
+        )
+    return results
+
+
+def choose_params(results: list, target_recall: float = HNSW_TARGET_RECALL) -> dict:
+    f"""Returns the tuning result with the lowest p95 latency among those reaching the target recall, or the one
+    with the highest recall if none does. Ties go to the smaller database.
+
+    Args:
+        results (list): The tuning results, see tune_hnsw.
+        target_recall (float): The recall@k the parameters must reach. Default is {HNSW_TARGET_RECALL}.
+
+    Returns:
+        dict: The chosen result.
+    """
+
+    passing = [result for result in results if result["recall"] >= target_recall]
+    if passing:
+        return min(passing, key=lambda result: (result["p95_ms"], result["disk_bytes"]))
+    return max(results, key=lambda result: (result["recall"], -result["p95_ms"]))
+
+
+def replace_collection(db_path: str, metadata: dict, segments: dict, params: dict) -> None:
+    """Replaces the database with one holding the given segments, see build_collection. The new database is built
+    next to the old one and then swapped in, so retrievers reopen it on their next query.
+
+    Args:
+        db_path (str): The path to the database file.
+        metadata (dict): The collection metadata of the new database.
+        segments (dict): The segments with their embeddings, see read_collection.
+        params (dict): The HNSW parameters. {'M': ..., 'construction_ef': ..., 'search_ef': ...}
+
+    Raises:
+        RuntimeError: If the database was reopened while it was being swapped. The old database is restored.
+    """
+
+    # Close the clients of the old database before its files are moved
+    close_chroma_system(db_path)
+    db_path = os.path.normpath(db_path)
+    close_chroma_system(db_path)
+
+    tmp_path = db_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    build_collection(tmp_path, metadata, segments, params)
+    close_chroma_system(tmp_path)
+
+    old_path = db_path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    os.rename(db_path, old_path)
+    try:
+        os.rename(tmp_path, db_path)
+    except OSError as error:
+        # A client opened the database between the renames, which makes Chroma create an empty one in its place.
+        # Put the old database back rather than leave it at the .old path, which the next run removes.
+        close_chroma_system(db_path)
+        shutil.rmtree(db_path, ignore_errors=True)
+        os.rename(old_path, db_path)
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise RuntimeError(
+            f"Database at {db_path} was opened while it was being replaced. It was restored unchanged; run again."
+        ) from error
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def apply_hnsw_params(db_path: str, params: dict) -> None:
+    """Rebuilds the database with new HNSW parameters, recorded in its collection metadata, from its stored
+    embeddings, see replace_collection.
+
+    Args:
+        db_path (str): The path to the database file.
+        params (dict): The HNSW parameters. {'M': ..., 'construction_ef': ..., 'search_ef': ...}
+    """
+
+    metadata, segments = read_collection(db_path)
+    replace_collection(db_path, metadata, segments, params)
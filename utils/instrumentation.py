@@ -0,0 +1,431 @@
+import bisect
+import contextvars
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constants import INSTRUMENTATION_ENABLED, INSTRUMENTATION_LOG_PATH, METRICS_PORT
+
+# Prefix of the metric names in the Prometheus export
+METRICS_PREFIX = "huberman_qa"
+
+# Upper bounds in seconds of the span duration histogram buckets
+DURATION_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0,
+)
+
+# The innermost open span of the current thread or task
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Histogram:
+    """Counts observations in fixed buckets, from which percentiles are estimated.
+
+    Functions:
+        observe: Adds an observation.
+        percentile: Returns an estimate of a percentile.
+        snapshot: Returns the count, sum and main percentiles.
+    """
+
+    def __init__(self, buckets: tuple = DURATION_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket holds observations above the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Adds an observation."""
+
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, q: float) -> float:
+        """Returns an estimate of the q-th percentile (0-100), interpolated linearly within its bucket."""
+
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+        if count == 0:
+            return math.nan
+
+        rank = q / 100 * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        """Returns the count, sum and p50/p95/p99 of the observations."""
+
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class Counter:
+    """A monotonically increasing count.
+
+    Functions:
+        increment: Adds to the count.
+    """
+
+    def __init__(self) -> None:
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def increment(self, amount: float = 1) -> None:
+        """Adds to the count."""
+
+        with self.lock:
+            self.value += amount
+
+
+class MetricsRegistry:
+    """The span histograms and counters of the process, and the exporters that finished spans are sent to.
+
+    Functions:
+        histogram: Returns the duration histogram of a span, creating it on first use.
+        counter: Returns a counter, creating it on first use.
+        add_exporter: Sends finished spans to the exporter.
+        export: Sends a finished span to every exporter.
+        snapshot: Returns the counters and histogram summaries.
+        reset: Drops all metrics.
+    """
+
+    def __init__(self, enabled: bool = INSTRUMENTATION_ENABLED) -> None:
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.exporters = []
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        """Returns the duration histogram of the span, creating it on first use."""
+
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def counter(self, name: str) -> Counter:
+        """Returns the counter, creating it on first use."""
+
+        counter = self.counters.get(name)
+        if counter is None:
+            with self.lock:
+                counter = self.counters.setdefault(name, Counter())
+        return counter
+
+    def add_exporter(self, exporter) -> None:
+        """Sends finished spans to the exporter, any object with an export(event) method."""
+
+        self.exporters.append(exporter)
+
+    def export(self, event: dict) -> None:
+        """Sends a finished span to every exporter."""
+
+        for exporter in self.exporters:
+            exporter.export(event)
+
+    def snapshot(self) -> dict:
+        """Returns the counter values and the count, sum and percentiles (in seconds) of each span."""
+
+        return {
+            "counters": {name: counter.value for name, counter in sorted(self.counters.items())},
+            "spans": {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())},
+        }
+
+    def reset(self) -> None:
+        """Drops all metrics. Exporters are kept."""
+
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+# The registry of the process
+registry = MetricsRegistry()
+
+
+class Span:
+    """A timed stage of work. Spans opened inside another span on the same thread or task are its children.
+
+    Functions:
+        set_attribute: Adds an attribute to the exported span.
+    """
+
+    def __init__(self, name: str, attributes: dict) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.parent = None
+        self.start_ns = None
+        self.duration_ns = None
+        self.token = None
+
+    def set_attribute(self, key: str, value) -> None:
+        """Adds an attribute to the exported span."""
+
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self.parent = _current_span.get()
+        self.token = _current_span.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.duration_ns = time.perf_counter_ns() - self.start_ns
+        _current_span.reset(self.token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        finish_span(self.name, self.duration_ns / 1e9, self.parent, self.attributes)
+
+    @property
+    def path(self) -> str:
+        """The names of the span and its ancestors, e.g. query/search."""
+
+        return f"{self.parent.path}/{self.name}" if self.parent is not None else self.name
+
+
+class _NoopSpan:
+    """Stands in for a span when instrumentation is disabled."""
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def finish_span(name: str, seconds: float, parent: Span = None, attributes: dict = None) -> None:
+    """Records the duration of a finished span and sends it to the exporters."""
+
+    registry.histogram(name).observe(seconds)
+    if registry.exporters:
+        registry.export(
+            {
+                "span": name,
+                "path": f"{parent.path}/{name}" if parent is not None else name,
+                "duration_ms": seconds * 1000,
+                "time": time.time(),
+                "thread": threading.current_thread().name,
+                **(attributes or {}),
+            }
+        )
+
+
+def span(name: str, **attributes) -> Span | _NoopSpan:
+    """Returns a context manager that times the enclosed block as a span.
+
+    Args:
+        name (str): The name of the span, e.g. search.
+        **attributes: Attributes of the exported span.
+
+    Returns:
+        Span | _NoopSpan: The span, or a shared no-op span if instrumentation is disabled.
+    """
+
+    if not registry.enabled:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def record_span(name: str, seconds: float, **attributes) -> None:
+    """Records a span that was timed by the caller, as a child of the current span. Use it where a block cannot be
+    wrapped in a context manager, e.g. across the yields of a generator.
+
+    Args:
+        name (str): The name of the span.
+        seconds (float): The duration of the span in seconds.
+        **attributes: Attributes of the exported span.
+    """
+
+    if registry.enabled:
+        finish_span(name, seconds, _current_span.get(), attributes)
+
+
+def increment(name: str, amount: float = 1) -> None:
+    """Adds to a counter, e.g. increment("segments_retrieved", 5)."""
+
+    if registry.enabled:
+        registry.counter(name).increment(amount)
+
+
+def instrument(name: str = None):
+    """Decorator that runs the function in a span named after it (or `name`)."""
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def in_current_context(func, *args, **kwargs):
+    """Returns a callable that runs the function in a copy of the current context, so spans it opens on another
+    thread (e.g. in run_in_executor) are children of the current span."""
+
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func, *args, **kwargs)
+
+
+class JsonLinesExporter:
+    """Writes each finished span as a JSON line to a file, or to stderr.
+
+    Functions:
+        export: Writes a span.
+    """
+
+    def __init__(self, path: str = None) -> None:
+        """Opens the log.
+
+        Args:
+            path (str): The path to append the spans to. Default is None (stderr).
+        """
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.stream = open(path, "a", buffering=1) if path else sys.stderr
+        self.lock = threading.Lock()
+
+    def export(self, event: dict) -> None:
+        """Writes the span as one JSON line."""
+
+        line = json.dumps(event, default=str)
+        with self.lock:
+            self.stream.write(line + "\n")
+
+
+def render_prometheus(metrics: MetricsRegistry = None) -> str:
+    """Returns the metrics in the Prometheus text exposition format: a counter per counter, and a histogram of span
+    durations in seconds labelled by span name.
+
+    Args:
+        metrics (MetricsRegistry): The metrics to render. Default is None (the registry of the process).
+
+    Returns:
+        str: The metrics text.
+    """
+
+    metrics = metrics or registry
+    lines = []
+    for name, counter in sorted(metrics.counters.items()):
+        metric = f"{METRICS_PREFIX}_{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {counter.value}"]
+
+    metric = f"{METRICS_PREFIX}_span_seconds"
+    lines.append(f"# TYPE {metric} histogram")
+    for name, histogram in sorted(metrics.histograms.items()):
+        with histogram.lock:
+            counts = list(histogram.counts)
+            count, total = histogram.count, histogram.sum
+
+        # Prometheus buckets are cumulative
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{metric}_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {count}')
+        lines.append(f'{metric}_sum{{span="{name}"}} {total}')
+        lines.append(f'{metric}_count{{span="{name}"}} {count}')
+
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusServer:
+    """Serves the metrics of the process in Prometheus text format at /metrics, on a background thread.
+
+    Functions:
+        start: Starts serving.
+        stop: Stops serving.
+    """
+
+    def __init__(self, port: int = METRICS_PORT, host: str = "0.0.0.0") -> None:
+        f"""Initializes the server.
+
+        Args:
+            port (int): The port to listen on, 0 for any free port. Default is {METRICS_PORT}.
+            host (str): The address to listen on. Default is 0.0.0.0.
+        """
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def start(self) -> "PrometheusServer":
+        """Starts serving on a daemon thread."""
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops serving and closes the socket."""
+
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def configure(log_path: str = INSTRUMENTATION_LOG_PATH, port: int = METRICS_PORT) -> PrometheusServer | None:
+    f"""Sets up the exporters: spans are appended to a JSON lines log and metrics are served for Prometheus, if
+    configured.
+
+    Args:
+        log_path (str): The path of the JSON lines log. Default is {INSTRUMENTATION_LOG_PATH} (no log).
+        port (int): The port of the Prometheus endpoint. Default is {METRICS_PORT} (no endpoint).
+
+    Returns:
+        PrometheusServer | None: The running Prometheus server, if any.
+    """
+
+    if log_path:
+        registry.add_exporter(JsonLinesExporter(log_path))
+    if port:
+        return PrometheusServer(port).start()
+    return None
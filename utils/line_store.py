@@ -0,0 +1,197 @@
+import os
+import threading
+from typing import List
+
+import numpy as np
+
+
+def get_line_store_path(db_path: str) -> str:
+    """Returns the path of the caption line store of a compact database, e.g. data/videos.lines for data/videos.db."""
+
+    return os.path.splitext(os.path.normpath(db_path))[0] + ".lines"
+
+
+def get_source_url(video_id: str, start: float) -> str:
+    """Returns the YouTube URL of the video at the start time of a segment."""
+
+    return f"https://www.youtube.com/watch?v={video_id}&t={start}s"
+
+
+def compact_metadata(segment: dict) -> dict:
+    """Returns the metadata of a segment in compact form: its video, line range and transcript hash.
+
+    Args:
+        segment (dict): A formatted segment with its line range, see models.etl.format_transcript.
+
+    Returns:
+        dict: The compact metadata. {'video_id': ..., 'first_line': ..., 'last_line': ..., 'transcript_hash': ...}
+    """
+
+    first_line, last_line = segment["lines"]
+    metadata = {"video_id": segment["metadata"]["video_id"], "first_line": first_line, "last_line": last_line}
+
+    # Chroma does not store None values
+    if segment["metadata"].get("transcript_hash") is not None:
+        metadata["transcript_hash"] = segment["metadata"]["transcript_hash"]
+    return metadata
+
+
+class LineStore:
+    """The caption lines of every video in a compact database, stored once per video rather than once per window.
+
+    Each video is one compressed .npz file of columns: its caption text as one UTF-8 buffer with line offsets, the
+    start and duration of each line, and its title and transcript hash. Windows are stored in the database as line
+    ranges, and their text and metadata are rebuilt from the video's lines when they are retrieved.
+
+    Videos are read on first use and kept in memory. A video is read again if a window carries a different
+    transcript hash, i.e. the video was reloaded since.
+
+    Functions:
+        save_video: Writes the caption lines of a video.
+        delete_video: Deletes the caption lines of a video.
+        get_video: Returns the caption lines of a video.
+        get_window: Returns the text and full metadata of a window.
+        expand: Rebuilds the text and full metadata of compact segments.
+        expand_results: Rebuilds the text and full metadata of the segments in a query result.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Opens the store. Videos are read on first use.
+
+        Args:
+            path (str): The path to the store directory.
+        """
+
+        self.path = path
+        self._videos = {}
+        self._lock = threading.Lock()
+
+    def _video_path(self, video_id: str) -> str:
+        return os.path.join(self.path, f"{video_id}.npz")
+
+    def save_video(self, video: dict, transcript: list, transcript_hash: str = None) -> None:
+        """Writes the caption lines of a video, replacing an existing file once the new one is written.
+
+        Args:
+            video (dict): The video information. {'id': 'The YouTube video ID', 'title': 'The title of the video'}
+            transcript (list): The transcript for the video.
+            transcript_hash (str): The hash of the video's segments, see models.etl.hash_video. Default is None.
+        """
+
+        encoded = [entry["text"].encode("utf-8") for entry in transcript]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in encoded])
+
+        os.makedirs(self.path, exist_ok=True)
+        path = self._video_path(video["id"])
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            text=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            offsets=offsets,
+            start=np.array([entry["start"] for entry in transcript], dtype=np.float64),
+            duration=np.array([entry["duration"] for entry in transcript], dtype=np.float64),
+            title=np.array(video["title"]),
+            transcript_hash=np.array(transcript_hash or ""),
+        )
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._videos.pop(video["id"], None)
+
+    def delete_video(self, video_id: str) -> None:
+        """Deletes the caption lines of a video, if there are any."""
+
+        with self._lock:
+            self._videos.pop(video_id, None)
+        if os.path.exists(self._video_path(video_id)):
+            os.remove(self._video_path(video_id))
+
+    def get_video(self, video_id: str, transcript_hash: str = None) -> dict:
+        """Returns the caption lines of a video.
+
+        Args:
+            video_id (str): The YouTube video ID.
+            transcript_hash (str): The transcript hash the lines must have. Default is None (any).
+
+        Returns:
+            dict: The caption lines. {'texts': [...], 'start': np.ndarray, 'duration': np.ndarray, 'title': ..., 'transcript_hash': ...}
+        """
+
+        with self._lock:
+            video = self._videos.get(video_id)
+        if video is not None and transcript_hash in (None, video["transcript_hash"]):
+            return video
+
+        with np.load(self._video_path(video_id)) as arrays:
+            buffer = arrays["text"].tobytes()
+            offsets = arrays["offsets"]
+            video = {
+                "texts": [
+                    buffer[offsets[i] : offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)
+                ],
+                "start": arrays["start"],
+                "duration": arrays["duration"],
+                "title": str(arrays["title"]),
+                "transcript_hash": str(arrays["transcript_hash"]) or None,
+            }
+
+        with self._lock:
+            self._videos[video_id] = video
+        return video
+
+    def get_window(self, id: str, metadata: dict) -> tuple:
+        """Returns the text and full metadata of a window stored in compact form.
+
+        Args:
+            id (str): The segment ID.
+            metadata (dict): The compact metadata of the window, see compact_metadata.
+
+        Returns:
+            tuple: The text (str) and the metadata (dict) the window would have in a database of full documents.
+        """
+
+        video_id = metadata["video_id"]
+        video = self.get_video(video_id, metadata.get("transcript_hash"))
+        first_line, last_line = metadata["first_line"], metadata["last_line"]
+
+        full_metadata = {
+            "video_id": video_id,
+            "segment_id": id,
+            "title": video["title"],
+            "source": get_source_url(video_id, float(video["start"][first_line])),
+        }
+        if metadata.get("transcript_hash") is not None:
+            full_metadata["transcript_hash"] = metadata["transcript_hash"]
+
+        return " ".join(video["texts"][first_line:last_line]), full_metadata
+
+    def expand(self, ids: List[str], documents: List[str], metadatas: List[dict]) -> tuple:
+        """Rebuilds the text and full metadata of the segments stored in compact form. Segments stored with their
+        text are returned as they are.
+
+        Args:
+            ids (list): The segment IDs.
+            documents (list): The stored documents, None for compact segments.
+            metadatas (list): The stored metadata of each segment.
+
+        Returns:
+            tuple: The documents (list) and metadata (list) of the segments.
+        """
+
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = list(metadatas)
+        for i, (id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+            if document is None and metadata is not None and "first_line" in metadata:
+                documents[i], metadatas[i] = self.get_window(id, metadata)
+        return documents, metadatas
+
+    def expand_results(self, results: dict) -> dict:
+        """Rebuilds the text and full metadata of the segments in a single-query result, see expand."""
+
+        documents, metadatas = self.expand(
+            results["ids"][0],
+            results["documents"][0] if results.get("documents") else None,
+            results["metadatas"][0],
+        )
+        return {**results, "documents": [documents], "metadatas": [metadatas]}
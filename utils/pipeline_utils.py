@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List
+
+from utils.instrumentation import in_current_context, span
+from constants import PIPELINE_QUEUE_SIZE
+
+# Marks the end of the stream on a queue
+_END = object()
+
+
+class Stage:
+    """One step of a streaming pipeline. Each worker thread takes items from the input queue, applies the
+    function in a span named after the stage and puts the result on the output queue. Results of None are dropped.
+
+    Functions:
+        report: Returns a one-line summary of the stage's progress and throughput.
+    """
+
+    def __init__(self, name: str, func: Callable, workers: int = 1) -> None:
+        """Initializes the stage.
+
+        Args:
+            name (str): The name of the stage, used in progress reports.
+            func (Callable): The function applied to each item.
+            workers (int): The number of worker threads. Default is 1.
+        """
+
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.items = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._workers_left = workers
+
+    def report(self) -> str:
+        """Returns a one-line summary of the stage's progress and throughput."""
+
+        rate = self.items / self.busy_seconds if self.busy_seconds else 0.0
+        return f"{self.name}: {self.items} items, busy {self.busy_seconds:.2f}s ({rate:.2f} items/s per worker)"
+
+
+def run_pipeline(
+    source: Iterable, stages: List[Stage], queue_size: int = PIPELINE_QUEUE_SIZE
+) -> None:
+    f"""Streams the items from the source through the stages. Stages run concurrently and are connected by bounded
+    queues, so at most `queue_size` items wait between two stages and memory stays flat however long the source is.
+
+    Args:
+        source (Iterable): The items to process.
+        stages (list): The stages, in order. The last stage should write its results out and return None.
+        queue_size (int): The maximum number of items waiting between two stages. Default is {PIPELINE_QUEUE_SIZE}.
+
+    Raises:
+        Exception: The first exception raised by a stage, after the pipeline has stopped.
+    """
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages))]
+    queues.append(queue.Queue())  # Results of the last stage are not consumed
+    errors = []
+    stop = threading.Event()
+
+    def put(q: queue.Queue, item) -> bool:
+        """Puts the item on the queue, giving up if the pipeline is stopping. Returns False if it gave up."""
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def work(stage: Stage, in_queue: queue.Queue, out_queue: queue.Queue) -> None:
+        try:
+            while not stop.is_set():
+                try:
+                    item = in_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    # Pass the end marker on to the other workers of this stage
+                    put(in_queue, _END)
+                    break
+
+                start_time = time.perf_counter()
+                with span(stage.name):
+                    result = stage.func(item)
+                with stage._lock:
+                    stage.items += 1
+                    stage.busy_seconds += time.perf_counter() - start_time
+
+                if result is not None:
+                    put(out_queue, result)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            # The last worker of the stage to finish ends the stream for the next stage
+            with stage._lock:
+                stage._workers_left -= 1
+                last_worker = stage._workers_left == 0
+            if last_worker:
+                put(out_queue, _END)
+
+    # Each worker runs in its own copy of the current context, so its stage spans are children of the current span
+    threads = [
+        threading.Thread(target=in_current_context(work, stage, queues[i], queues[i + 1]), daemon=True)
+        for i, stage in enumerate(stages)
+        for _ in range(stage.workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Feed the source into the first queue, then wait for the stages to finish
+    for item in source:
+        if not put(queues[0], item):
+            break
+    put(queues[0], _END)
+
+    for thread in threads:
+        thread.join()
+
+    for stage in stages:
+        print(stage.report())
+
+    if errors:
+        raise errors[0]
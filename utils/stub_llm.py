@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+STUB_ANSWER = "Stub answer to: {question}"
+
+
+def stub_answer(messages: list) -> str:
+    """Returns the deterministic stub answer, which repeats the last user message."""
+
+    return STUB_ANSWER.format(question=messages[-1]["content"])
+
+
+def split_tokens(answer: str) -> list:
+    """Splits the answer into word-sized tokens whose concatenation is the answer."""
+
+    words = answer.split(" ")
+    return [words[0]] + [" " + word for word in words[1:]]
+
+
+class StubOpenAIClient:
+    """A deterministic local stand-in for openai.OpenAI that answers chat completions without network access.
+
+    The answer repeats the last user message, so it is deterministic for a given question. Calls are counted so
+    tests can check whether the LLM was reached.
+
+    Functions:
+        create: Returns a chat completion (or a stream of chunks), available as client.chat.completions.create.
+    """
+
+    def __init__(self, delay: float = 0.0) -> None:
+        """Initializes the stub client.
+
+        Args:
+            delay (float): The number of seconds each completion takes. Default is 0.0.
+        """
+
+        self.delay = delay
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(
+        self,
+        model: str,
+        messages: list,
+        temperature: float = None,
+        stream: bool = False,
+        **kwargs,
+    ):
+        """Returns a chat completion with the same shape as the OpenAI client's response."""
+
+        self.calls += 1
+        time.sleep(self.delay)
+        answer = stub_answer(messages)
+
+        if stream:
+            return (
+                SimpleNamespace(
+                    model=model,
+                    choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=token))],
+                )
+                for token in split_tokens(answer)
+            )
+
+        message = SimpleNamespace(role="assistant", content=answer)
+        return SimpleNamespace(
+            model=model, choices=[SimpleNamespace(index=0, message=message)]
+        )
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    # Accept bursts of concurrent connections from load tests without dropping them
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class StubLLMServer:
+    """A local OpenAI-compatible HTTP server for tests and benchmarks. It serves /v1/chat/completions with the stub
+    answer, as one JSON response or as a server-sent event stream with one chunk per token.
+
+    Point an OpenAI client at it with openai.OpenAI(base_url=server.url, api_key="stub").
+
+    Functions:
+        start: Starts the server on a background thread.
+        stop: Stops the server.
+    """
+
+    def __init__(
+        self, delay: float = 0.0, token_delay: float = 0.0, port: int = 0
+    ) -> None:
+        """Initializes the server.
+
+        Args:
+            delay (float): The number of seconds before the first token. Default is 0.0.
+            token_delay (float): The number of seconds between streamed tokens. Default is 0.0.
+            port (int): The port to listen on. Default is 0 (any free port).
+        """
+
+        self.delay = delay
+        self.token_delay = token_delay
+        self.calls = 0
+        self._server = _StubHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The base URL of the OpenAI-compatible API."""
+
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.calls += 1
+                time.sleep(server.delay)
+
+                answer = stub_answer(body["messages"])
+                base = {
+                    "id": f"chatcmpl-stub-{server.calls}",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                }
+
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for token in split_tokens(answer):
+                        self._write_event(
+                            {
+                                **base,
+                                "object": "chat.completion.chunk",
+                                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                            }
+                        )
+                        time.sleep(server.token_delay)
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                    return
+
+                payload = json.dumps(
+                    {
+                        **base,
+                        "object": "chat.completion",
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": answer},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    }
+                ).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _write_event(self, data: dict) -> None:
+                self._write_chunk(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+            def _write_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "StubLLMServer":
+        """Starts the server on a background thread and returns it."""
+
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the server."""
+
+        self._server.shutdown()
+        self._server.server_close()
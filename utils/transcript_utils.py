@@ -0,0 +1,161 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+from youtube_transcript_api import YouTubeTranscriptApi
+
+from constants import (
+    TRANSCRIPT_CACHE_DIR,
+    TRANSCRIPT_FETCH_WORKERS,
+    TRANSCRIPT_FETCH_RETRIES,
+    TRANSCRIPT_FETCH_BACKOFF,
+)
+
+TRANSCRIPT_LANGUAGES = ["en", "en-US"]
+
+
+class JsonTranscriptFetcher:
+    """A local stand-in for YouTubeTranscriptApi that serves transcripts from JSON fixture files.
+
+    Each transcript is read from `<fixtures_dir>/<video_id>.json`, in the same format that
+    YouTubeTranscriptApi.get_transcript returns.
+
+    Functions:
+        get_transcript: Returns the transcript for a given video ID.
+    """
+
+    def __init__(self, fixtures_dir: str) -> None:
+        """Initializes the fetcher.
+
+        Args:
+            fixtures_dir (str): The folder containing the JSON transcripts.
+        """
+
+        self.fixtures_dir = fixtures_dir
+
+    def get_transcript(self, video_id: str, languages: list = None) -> List[Dict]:
+        """Returns the transcript for a given video ID. Raises FileNotFoundError if there is no fixture."""
+
+        with open(os.path.join(self.fixtures_dir, f"{video_id}.json")) as f:
+            return json.load(f)
+
+
+def fetch_with_retry(
+    video_id: str,
+    fetcher=YouTubeTranscriptApi,
+    retries: int = TRANSCRIPT_FETCH_RETRIES,
+    backoff: float = TRANSCRIPT_FETCH_BACKOFF,
+) -> List[Dict]:
+    f"""Fetches the transcript for a video, retrying with exponential backoff if the fetch fails.
+
+    Args:
+        video_id (str): The YouTube video ID.
+        fetcher: Any object with a YouTubeTranscriptApi-style get_transcript method. Default is YouTubeTranscriptApi.
+        retries (int): The number of retries after the first attempt. Default is {TRANSCRIPT_FETCH_RETRIES}.
+        backoff (float): The wait before the first retry in seconds. It doubles on each retry. Default is {TRANSCRIPT_FETCH_BACKOFF}.
+
+    Returns:
+        list: A list of dictionaries containing the transcript for the video.
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            return fetcher.get_transcript(video_id, languages=TRANSCRIPT_LANGUAGES)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+
+
+def load_cached_transcript(video_id: str, cache_dir: str = TRANSCRIPT_CACHE_DIR) -> List[Dict]:
+    """Returns the raw transcript from the local cache, or None if it has not been fetched before."""
+
+    path = os.path.join(cache_dir, f"{video_id}.json")
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_cached_transcript(
+    video_id: str, transcript: List[Dict], cache_dir: str = TRANSCRIPT_CACHE_DIR
+) -> None:
+    """Writes the raw transcript to the local cache. The file is written to a temporary path first so a crash never leaves a partial file."""
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{video_id}.json")
+
+    with open(path + ".tmp", "w") as f:
+        json.dump(transcript, f)
+    os.replace(path + ".tmp", path)
+
+
+def fetch_cached_transcript(
+    video_id: str,
+    fetcher=YouTubeTranscriptApi,
+    cache_dir: str = TRANSCRIPT_CACHE_DIR,
+    retries: int = TRANSCRIPT_FETCH_RETRIES,
+    backoff: float = TRANSCRIPT_FETCH_BACKOFF,
+) -> List[Dict]:
+    f"""Returns the transcript for a video from the local cache, fetching (with retries) and caching it if it is not cached yet.
+
+    Args:
+        video_id (str): The YouTube video ID.
+        fetcher: Any object with a YouTubeTranscriptApi-style get_transcript method. Default is YouTubeTranscriptApi.
+        cache_dir (str): The folder of the raw transcript cache. Default is {TRANSCRIPT_CACHE_DIR}.
+        retries (int): The number of retries after the first attempt. Default is {TRANSCRIPT_FETCH_RETRIES}.
+        backoff (float): The wait before the first retry in seconds. Default is {TRANSCRIPT_FETCH_BACKOFF}.
+
+    Returns:
+        list: A list of dictionaries containing the transcript for the video, or None if it could not be fetched.
+    """
+
+    transcript = load_cached_transcript(video_id, cache_dir)
+    if transcript is not None:
+        return transcript
+
+    try:
+        transcript = fetch_with_retry(
+            video_id, fetcher=fetcher, retries=retries, backoff=backoff
+        )
+    except Exception as e:
+        print(f"Error fetching transcript for video {video_id}: {str(e)}")
+        return None
+
+    save_cached_transcript(video_id, transcript, cache_dir)
+    return transcript
+
+
+def fetch_transcripts(
+    video_ids: List[str],
+    fetcher=YouTubeTranscriptApi,
+    max_workers: int = TRANSCRIPT_FETCH_WORKERS,
+    cache_dir: str = TRANSCRIPT_CACHE_DIR,
+    retries: int = TRANSCRIPT_FETCH_RETRIES,
+    backoff: float = TRANSCRIPT_FETCH_BACKOFF,
+) -> Dict[str, List[Dict]]:
+    f"""Fetches the transcripts for several videos concurrently. Transcripts in the local cache are not fetched again.
+
+    Args:
+        video_ids (list): The YouTube video IDs.
+        fetcher: Any object with a YouTubeTranscriptApi-style get_transcript method. Default is YouTubeTranscriptApi.
+        max_workers (int): The maximum number of concurrent fetches. Default is {TRANSCRIPT_FETCH_WORKERS}.
+        cache_dir (str): The folder of the raw transcript cache. Default is {TRANSCRIPT_CACHE_DIR}.
+        retries (int): The number of retries per video after the first attempt. Default is {TRANSCRIPT_FETCH_RETRIES}.
+        backoff (float): The wait before the first retry in seconds. Default is {TRANSCRIPT_FETCH_BACKOFF}.
+
+    Returns:
+        dict: The transcripts keyed by video ID, in the order of `video_ids`. Videos whose transcript could not be fetched map to None.
+    """
+
+    def fetch_one(video_id: str) -> List[Dict]:
+        return fetch_cached_transcript(
+            video_id, fetcher=fetcher, cache_dir=cache_dir, retries=retries, backoff=backoff
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        transcripts = executor.map(fetch_one, video_ids)
+        return dict(zip(video_ids, transcripts))
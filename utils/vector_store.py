@@ -0,0 +1,301 @@
+import json
+import os
+import shutil
+import time
+from typing import List
+
+import numpy as np
+
+from constants import EMBEDDING_MODEL, TABLE_NAME, VECTOR_STORE_DTYPE
+
+# Number of stored vectors scored at a time, which bounds the float32 working memory of a search
+SEARCH_CHUNK_ROWS = 8192
+
+# Number of segments read from Chroma per request when exporting
+EXPORT_PAGE_SIZE = 1000
+
+
+def get_vector_store_path(db_path: str) -> str:
+    """Returns the path of the vector store exported from the database, e.g. data/videos.vectors for data/videos.db."""
+
+    return os.path.splitext(os.path.normpath(db_path))[0] + ".vectors"
+
+
+def get_vector_store_versions(path: str) -> List[str]:
+    """Returns the version directories of the store at the path, oldest first. The store path is a symlink to one of them."""
+
+    directory, name = os.path.split(path)
+    prefix = name + ".v"
+    versions = [
+        entry
+        for entry in os.listdir(directory or ".")
+        if entry.startswith(prefix) and entry[len(prefix) :].isdigit()
+    ]
+    versions.sort(key=lambda entry: int(entry[len(prefix) :]))
+    return [os.path.join(directory, entry) for entry in versions]
+
+
+def remove_vector_store(path: str) -> None:
+    """Removes the store at the path along with all of its versions."""
+
+    if os.path.islink(path):
+        os.remove(path)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+    if os.path.isdir(os.path.dirname(path) or "."):
+        for version in get_vector_store_versions(path):
+            shutil.rmtree(version, ignore_errors=True)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple:
+    """Quantizes each row to int8 with its own symmetric scale.
+
+    Args:
+        vectors (np.ndarray): The float vectors, one per row.
+
+    Returns:
+        tuple: The int8 matrix and the float32 scale of each row.
+    """
+
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class VectorStore:
+    """A read-only store of segment vectors in a memory-mapped float16 or int8 matrix, with the IDs, documents and
+    metadata in a JSON sidecar. Queries are scored exactly with vectorized dot products.
+
+    The matrix is memory-mapped rather than read, so worker processes on the same host share one copy in the page
+    cache. Results have the same format as a Chroma query, with distances in the metric of the source collection.
+
+    Functions:
+        get: Returns the documents and metadata of segments by ID.
+        query: Returns the nearest segments of each query embedding.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Opens the store.
+
+        Args:
+            path (str): The path to the store directory.
+        """
+
+        self.path = path
+
+        # Resolve the symlink once so every file is read from the same version even if the store is re-exported meanwhile
+        path = os.path.realpath(path)
+        with open(os.path.join(path, "store.json")) as f:
+            self.info = json.load(f)
+        with open(os.path.join(path, "segments.json")) as f:
+            segments = json.load(f)
+
+        self.ids = segments["ids"]
+        self.documents = segments["documents"]
+        self.metadatas = segments["metadatas"]
+        self.metric = self.info["metric"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = None
+        if self.info["dtype"] == "int8":
+            self.scales = np.load(os.path.join(path, "scales.npy"))
+        self.squared_norms = np.load(os.path.join(path, "squared_norms.npy"))
+        self._rows = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get(self, ids: List[str]) -> dict:
+        """Returns the documents and metadata of the segments with the given IDs, in the format of a Chroma get.
+        Unknown IDs are skipped."""
+
+        if self._rows is None:
+            self._rows = {id: i for i, id in enumerate(self.ids)}
+        rows = [self._rows[id] for id in ids if id in self._rows]
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "documents": [self.documents[i] for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows],
+        }
+
+    def _dot_products(self, queries: np.ndarray) -> np.ndarray:
+        """Returns the dot products of the queries (rows) with every stored vector, as a (queries, vectors) matrix."""
+
+        products = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_CHUNK_ROWS):
+            end = start + SEARCH_CHUNK_ROWS
+            chunk = np.asarray(self.vectors[start:end], dtype=np.float32)
+            products[:, start:end] = queries @ chunk.T
+            if self.scales is not None:
+                products[:, start:end] *= self.scales[start:end]
+        return products
+
+    def query(self, query_embeddings: np.ndarray, n_results: int) -> List[dict]:
+        """Returns the nearest segments of each query embedding.
+
+        Args:
+            query_embeddings (np.ndarray): The query embeddings, one per row.
+            n_results (int): The number of results per query.
+
+        Returns:
+            list: The nearest segments of each query, in the format of a single-query Chroma result.
+        """
+
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        n_results = min(n_results, len(self))
+        if n_results <= 0:
+            return [self._result([], []) for _ in queries]
+
+        if self.metric == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        # Convert the dot products to the distance metric of the collection (smaller is nearer)
+        products = self._dot_products(queries)
+        if self.metric == "l2":
+            distances = (queries**2).sum(axis=1, keepdims=True) + self.squared_norms - 2 * products
+        else:
+            distances = 1.0 - products
+
+        # Exact top-k: partition out the k nearest, then sort only those
+        results = []
+        for row in distances:
+            nearest = np.argpartition(row, n_results - 1)[:n_results]
+            nearest = nearest[np.argsort(row[nearest], kind="stable")]
+            results.append(self._result(nearest, row[nearest].tolist()))
+        return results
+
+    def _result(self, rows: list, distances: list) -> dict:
+        """Returns the segments in the given rows as a single-query Chroma result."""
+
+        return {
+            "ids": [[self.ids[i] for i in rows]],
+            "distances": [distances],
+            "metadatas": [[self.metadatas[i] for i in rows]],
+            "documents": [[self.documents[i] for i in rows]],
+            "embeddings": None,
+            "uris": None,
+            "data": None,
+        }
+
+
+def get_collection_dimension(collection, path: str) -> int:
+    """Returns the number of dimensions of the collection's vectors.
+
+    An empty collection has no vectors to measure, so the dimension of the existing store at the path is kept, or
+    else the dimension of the embedding model the collection was embedded with is used. Returns 0 if neither is known.
+    """
+
+    stored = collection.get(limit=1, include=["embeddings"])["embeddings"]
+    if stored:
+        return len(stored[0])
+
+    try:
+        with open(os.path.join(path, "store.json")) as f:
+            return json.load(f)["dimension"]
+    except FileNotFoundError:
+        pass
+
+    if (collection.metadata or {}).get("embedding_model") == EMBEDDING_MODEL:
+        from utils.embedding_utils import get_config
+
+        return get_config().hidden_size
+    return 0
+
+
+def export_vector_store(db_path: str, path: str = None, dtype: str = None) -> dict:
+    f"""Exports the vectors, documents and metadata of a Chroma database to a vector store. An existing store at the
+    path is replaced once the new one is complete; processes that have the old one open keep reading it.
+
+    Each export is written to its own version directory (e.g. data/videos.vectors.v<timestamp>) and published by
+    atomically replacing the symlink at the path, so readers always find a complete store. The previous version is
+    kept for readers that are still opening it, and older ones are removed.
+
+    Args:
+        db_path (str): The path to the Chroma database.
+        path (str): The path to the store directory. Default is None (next to the database, see get_vector_store_path).
+        dtype (str): The storage type of the vectors, "float16" or "int8". Default is None (the type of the existing store, or {VECTOR_STORE_DTYPE}).
+
+    Returns:
+        dict: The store info (metric, dtype, embedding model, count, dimension).
+    """
+
+    import chromadb
+
+    path = path or get_vector_store_path(db_path)
+    if dtype is None:
+        try:
+            with open(os.path.join(path, "store.json")) as f:
+                dtype = json.load(f)["dtype"]
+        except FileNotFoundError:
+            dtype = VECTOR_STORE_DTYPE
+    if dtype not in ("float16", "int8"):
+        raise ValueError(f"Unknown vector store dtype {dtype}. Choose float16 or int8.")
+
+    # Read the collection a page at a time
+    client = chromadb.PersistentClient(db_path)
+    collection = client.get_collection(TABLE_NAME)
+    ids, documents, metadatas, embeddings = [], [], [], []
+    while True:
+        page = collection.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=EXPORT_PAGE_SIZE,
+            offset=len(ids),
+        )
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        embeddings.extend(page["embeddings"])
+        if len(page["ids"]) < EXPORT_PAGE_SIZE:
+            break
+
+    metadata = collection.metadata or {}
+    metric = metadata.get("hnsw:space", "l2")
+    if ids:
+        vectors = np.array(embeddings, dtype=np.float32)
+    else:
+        vectors = np.empty((0, get_collection_dimension(collection, path)), dtype=np.float32)
+    squared_norms = (vectors**2).sum(axis=1)
+
+    # Cosine distance only needs the direction, so unit vectors are stored and scored by dot product
+    if metric == "cosine":
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    info = {
+        "metric": metric,
+        "dtype": dtype,
+        "embedding_model": metadata.get("embedding_model"),
+        "count": len(ids),
+        "dimension": vectors.shape[1],
+    }
+
+    # Write the new store to its own version directory next to the old one
+    version_path = f"{path}.v{time.time_ns()}"
+    os.makedirs(version_path)
+    if dtype == "int8":
+        quantized, scales = quantize_int8(vectors)
+        np.save(os.path.join(version_path, "vectors.npy"), quantized)
+        np.save(os.path.join(version_path, "scales.npy"), scales)
+    else:
+        np.save(os.path.join(version_path, "vectors.npy"), vectors.astype(np.float16))
+    np.save(os.path.join(version_path, "squared_norms.npy"), squared_norms.astype(np.float32))
+    with open(os.path.join(version_path, "segments.json"), "w") as f:
+        json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, f)
+    with open(os.path.join(version_path, "store.json"), "w") as f:
+        json.dump(info, f, indent=4)
+
+    # A store exported before versioning is a plain directory, which is moved to a version of its own first
+    if os.path.isdir(path) and not os.path.islink(path):
+        os.rename(path, f"{path}.v0")
+
+    # Point the store at the new version by atomically replacing the symlink
+    link_path = path + ".tmp"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(os.path.basename(version_path), link_path)
+    os.replace(link_path, path)
+
+    # Keep the new and the previous version, and remove older ones
+    for old_version in get_vector_store_versions(path)[:-2]:
+        shutil.rmtree(old_version, ignore_errors=True)
+
+    return info